@@ -7,6 +7,7 @@ from routes import register_blueprints
 from google import genai
 from flask_login import LoginManager, login_required
 from services.database_service import DatabaseService
+from services.cache_service import init_cache
 
 def create_app(config_class=Config):
     # Ensure SQLite database directory exists before initializing the app
@@ -21,6 +22,9 @@ def create_app(config_class=Config):
     # Initialize database using the service
     DatabaseService.init_db(app)
     
+    # Attach the cache used for due counts, deck trees and stats
+    init_cache(app)
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -74,9 +78,37 @@ def create_app(config_class=Config):
                 'message': str(e)
             }), 500
     
+    @app.route('/api/cache-stats')
+    @login_required
+    def cache_stats_route():
+        """Hit/miss counters for this worker's cache and the LLM response cache"""
+        from services.llm_service import get_llm_stats
+        
+        return jsonify({
+            'enabled': app.config.get('ENABLE_CACHING', False),
+            'stats': app.cache.get_stats(),
+            'llm': get_llm_stats()
+        })
+    
     # Register blueprints using the centralized function
     register_blueprints(app)
     
+    # Scheduled daily stats snapshots for the history charts
+    if app.config.get('DECK_STATS_ROLLUP_INTERVAL'):
+        from services.background_service import start_stats_rollup
+        start_stats_rollup(app, app.config['DECK_STATS_ROLLUP_INTERVAL'])
+    
+    # Background imports are picked up from the job queue by this process
+    # unless dedicated `cli.py worker` processes handle them. The worker is
+    # started by the first request rather than here: spawned pool processes
+    # import this module too and must not claim jobs.
+    if app.config.get('IMPORT_WORKER_MODE') == 'thread':
+        from services.job_service import start_import_worker
+        
+        @app.before_request
+        def ensure_import_worker():
+            start_import_worker(app)
+    
     return app
 
 app = create_app()
@@ -8,6 +8,9 @@ from datetime import datetime
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+# CLI commands never run the web process's embedded import worker
+os.environ['IMPORT_WORKER_MODE'] = 'external'
+
 from app import create_app
 from models import db
 from services.database_service import DatabaseService
@@ -168,5 +171,132 @@ def sync_decks(direction, deck_id):
             else:
                 click.echo(f"{table}: {status}")
 
+@cli.command('rebuild-deck-closure')
+def rebuild_deck_closure():
+    """Rebuild the deck hierarchy closure table from parent links"""
+    from models import DeckClosure
+    
+    with app.app_context():
+        rows = DeckClosure.rebuild()
+        db.session.commit()
+        click.echo(f"Deck closure rebuilt: {rows} ancestor/descendant rows")
+
+@cli.command('rebuild-card-counters')
+def rebuild_card_counters():
+    """Recompute the per-deck card counters from the flashcards table"""
+    from models import FlashcardDecks
+    
+    with app.app_context():
+        decks = FlashcardDecks.refresh_card_counters()
+        db.session.commit()
+        click.echo(f"Card counters rebuilt for {decks} decks")
+
+@cli.command('fsrs-validate')
+@click.option('--samples', '-n', default=5000, help='Random cards to compare')
+@click.option('--seed', default=0, help='Random seed')
+def fsrs_validate(samples, seed):
+    """Check the vectorized FSRS engine against the fsrs package"""
+    from services.fsrs_scheduler import get_scheduler
+    from services.fsrs_vectorized import validate_against_reference
+    
+    report = validate_against_reference(get_scheduler(), samples=samples, seed=seed)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+    if not report['passed']:
+        raise SystemExit(1)
+
+@cli.command('fsrs-reschedule')
+@click.option('--deck-id', '-id', type=int, required=True, help='Root deck ID (sub-decks included)')
+@click.option('--retention', '-r', type=float, help='Desired retention (defaults to the scheduler setting)')
+def fsrs_reschedule(deck_id, retention):
+    """Recompute due dates and retrievability for a deck's reviewed cards"""
+    from services.fsrs_scheduler import reschedule_cards
+    
+    with app.app_context():
+        count = reschedule_cards(deck_id, retention)
+        click.echo(f"Rescheduled {count} cards under deck {deck_id}")
+
+@cli.command('refresh-retrievability')
+@click.option('--deck-id', '-id', type=int, help='Limit to one deck and its sub-decks')
+def refresh_retrievability_command(deck_id):
+    """Store current retrievability for every reviewed card"""
+    from services.fsrs_scheduler import refresh_retrievability
+    
+    with app.app_context():
+        count = refresh_retrievability(deck_id)
+        click.echo(f"Retrievability refreshed for {count} cards")
+
+@cli.command('fsrs-optimize')
+@click.option('--user-id', '-u', type=int, multiple=True, help='User to optimize (repeatable; default all users)')
+def fsrs_optimize(user_id):
+    """Fit per-user FSRS parameters from review logs"""
+    from models import User
+    from services.fsrs_optimizer import optimize_user
+    
+    with app.app_context():
+        user_ids = list(user_id) or [user.id for user in User.query.order_by(User.id).all()]
+        workers = app.config.get('FSRS_OPTIMIZER_WORKERS', 1)
+        for uid in user_ids:
+            result = optimize_user(uid, max_workers=workers)
+            if result is None:
+                click.echo(f"User {uid}: not enough review history, keeping current parameters")
+                continue
+            status = 'stored' if result['stored'] else 'not better, kept current'
+            click.echo(f"User {uid}: log loss {result['loss_before']:.4f} -> {result['loss_after']:.4f} "
+                       f"over {result['recall_checks']} reviews ({status})")
+
+@cli.command('rollup-deck-stats')
+def rollup_deck_stats_command():
+    """Write today's daily stats snapshot for every deck (run from cron)"""
+    from services.fsrs_scheduler import rollup_deck_stats
+    
+    with app.app_context():
+        written = rollup_deck_stats()
+        click.echo(f"Deck stats snapshots written: {written}")
+
+@cli.command('reindex-search')
+def reindex_search():
+    """Rebuild the full-text and trigram search indexes for flashcards and decks"""
+    from services.search_service import rebuild_search_index
+    
+    with app.app_context():
+        counts = rebuild_search_index()
+        click.echo(f"Search index rebuilt: {counts['cards']} cards, {counts['decks']} decks")
+
+@cli.command('rebuild-fingerprints')
+def rebuild_fingerprints():
+    """Recompute card fingerprints and the near-duplicate (LSH) index"""
+    from models import db, FlashcardLSH
+    
+    with app.app_context():
+        cards = FlashcardLSH.rebuild()
+        db.session.commit()
+        click.echo(f"Fingerprinted {cards} cards")
+
+@cli.command('worker')
+@click.option('--concurrency', '-c', type=int, help='Chunks processed at once (defaults to IMPORT_WORKERS)')
+@click.option('--drain/--no-drain', default=False, help='Exit once the import queue is empty')
+def worker(concurrency, drain):
+    """Process queued background import jobs"""
+    from services.job_service import ImportWorker
+    
+    import_worker = ImportWorker(app, concurrency=concurrency)
+    click.echo(f"Import worker {import_worker.worker_id} running with {import_worker.concurrency} threads")
+    try:
+        import_worker.run(drain=drain)
+    except KeyboardInterrupt:
+        # Leases of unfinished jobs expire and other workers pick them up
+        import_worker.stop()
+
+@cli.command('requeue-imports')
+@click.option('--task-id', '-t', multiple=True, help='Task to requeue (repeatable; default all)')
+def requeue_imports(task_id):
+    """Retry dead-lettered import chunks and resume imports left without jobs"""
+    from services.job_service import requeue_dead_jobs
+    
+    with app.app_context():
+        requeued = requeue_dead_jobs(list(task_id) or None)
+        click.echo(f"Requeued {requeued} import jobs")
+
 if __name__ == '__main__':
     cli()
@@ -76,6 +76,29 @@ class Config:
             return f'sqlite:///{self.SQLITE_DB_PATH}'
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Caching: an in-process LRU, optionally backed by a SQLite file shared by
+    # all workers on the host (CACHE_BACKEND=sqlite)
+    ENABLE_CACHING = os.getenv('ENABLE_CACHING', 'true').lower() in ('true', '1', 't')
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'local').strip().lower()
+    CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'memoria_cache.db'))
+    CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+
+    # LLM response cache: a SQLite file shared by all workers on the host.
+    # LLM_CACHE_SITES lists the call sites allowed to use it ('*' for all)
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('true', '1', 't')
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'memoria_llm_cache.db'))
+    LLM_CACHE_MAX_MB = int(os.getenv('LLM_CACHE_MAX_MB', 256))
+    LLM_CACHE_MAX_AGE_DAYS = int(os.getenv('LLM_CACHE_MAX_AGE_DAYS', 7))
+    LLM_CACHE_SITES = {site.strip() for site in os.getenv('LLM_CACHE_SITES', '*').split(',') if site.strip()}
+
+    # FSRS optimizer: worker processes fitting per-user parameters
+    FSRS_OPTIMIZER_WORKERS = int(os.getenv('FSRS_OPTIMIZER_WORKERS', 1))
+
+    # Seconds between in-process deck_stats_daily rollups (0 = off; use
+    # `cli.py rollup-deck-stats` from cron instead)
+    DECK_STATS_ROLLUP_INTERVAL = int(os.getenv('DECK_STATS_ROLLUP_INTERVAL', 0))
 
     # API Keys
     GEMINI_API_KEY = os.getenv("GOOGLE_GEMINI_API_KEY")
@@ -92,6 +115,28 @@ class Config:
     UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'flashcard_uploads')
     DEFAULT_BATCH_SIZE = 100  # Number of cards to generate per request
     CHUNK_SIZE = 15000        # Maximum number of characters per chunk
+    CHUNK_INSERT_BATCH = 20   # Chunks written per INSERT while ingesting an upload
+    CONTENT_CACHE_DAYS = int(os.getenv('CONTENT_CACHE_DAYS', 30))  # Unused extracted text and cards are kept this long
+    
+    # PDF text extraction: worker processes (below 2 extracts in the request
+    # thread), pages per pool task and seconds allowed per page
+    PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+    PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 16))
+    PDF_PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', 10))
+    
+    # Background imports: worker threads per import worker, and chunks of one
+    # file processed at the same time
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 4))
+    IMPORT_CHUNK_CONCURRENCY = int(os.getenv('IMPORT_CHUNK_CONCURRENCY', 2))
+    # 'thread' runs an import worker inside each web process; 'external'
+    # leaves the job queue to `cli.py worker` processes
+    IMPORT_WORKER_MODE = os.getenv('IMPORT_WORKER_MODE', 'thread').lower()
+    IMPORT_WORKER_POLL = float(os.getenv('IMPORT_WORKER_POLL', 5))       # Seconds between queue polls when idle
+    IMPORT_JOB_LEASE = int(os.getenv('IMPORT_JOB_LEASE', 120))           # Seconds a claimed job stays leased without a heartbeat
+    IMPORT_JOB_HEARTBEAT = int(os.getenv('IMPORT_JOB_HEARTBEAT', 30))    # Seconds between lease renewals
+    IMPORT_JOB_MAX_ATTEMPTS = int(os.getenv('IMPORT_JOB_MAX_ATTEMPTS', 5))  # Attempts before a chunk is dead-lettered
+    IMPORT_JOB_BACKOFF = int(os.getenv('IMPORT_JOB_BACKOFF', 10))        # Retry delay in seconds, doubled per attempt
+    IMPORT_JOB_BACKOFF_MAX = int(os.getenv('IMPORT_JOB_BACKOFF_MAX', 900))
     
     # JSON Schema for multiple-choice flashcards
     FLASHCARD_SCHEMA = {
@@ -1,17 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+import math
 import os
 
 # Configure SQLAlchemy for both PostgreSQL and SQLite compatibility
 db = SQLAlchemy()
 
 # Import models after db initialization
-from .flashcard_deck import FlashcardDecks
+from .flashcard_deck import FlashcardDecks, DeckClosure
 from .flashcard import Flashcards, FlashcardSet, FlashcardGenerator
 from .user import User
 from .learning import LearningSession, LearningSection, LearningQuestion
+from .review_log import ReviewLogs
+from .deck_stats import DeckStatsDaily, sql_date, sql_floor, sql_elapsed_days
+from .flashcard_lsh import FlashcardLSH
 
 # Import new models
-from models.import_models import ImportFile, ImportChunk, ImportFlashcard, ImportTask
+from models.import_models import ImportFile, ImportChunk, ImportFlashcard, ImportTask, ImportJob, ContentFile, ContentChunk
 
 # Setup for database compatibility
 def setup_db_compatibility():
@@ -23,19 +27,29 @@ def setup_db_compatibility():
         # Enable SQLite foreign key constraints
         from sqlalchemy import event
         from sqlalchemy.engine import Engine
-        from sqlite3 import Connection as SQLite3Connection
+        from sqlite3 import Connection as SQLite3Connection, OperationalError
+        
+        def sqlite_power(base, exponent):
+            if base is None or exponent is None:
+                return None
+            return math.pow(base, exponent)
         
         @event.listens_for(Engine, "connect")
         def set_sqlite_pragma(dbapi_connection, connection_record):
             if isinstance(dbapi_connection, SQLite3Connection):
                 cursor = dbapi_connection.cursor()
                 cursor.execute("PRAGMA foreign_keys=ON")
+                # POWER() is one of SQLite's optional math functions; provide it when the build lacks them
+                try:
+                    cursor.execute("SELECT power(2, 2)")
+                except OperationalError:
+                    dbapi_connection.create_function('power', 2, sqlite_power, deterministic=True)
                 cursor.close()
 
 # Call the setup function
 setup_db_compatibility()
 
-__all__ = ['db', 'FlashcardDecks', 'Flashcards']
+__all__ = ['db', 'FlashcardDecks', 'DeckClosure', 'Flashcards', 'ReviewLogs', 'DeckStatsDaily', 'FlashcardLSH']
 
 # Add to FlashcardDecks class
 def to_dict(self):
@@ -45,23 +59,6 @@ def to_dict(self):
         'name': self.name,
         'description': self.description,
         'parent_deck_id': self.parent_deck_id,
-        'card_count': len(self.flashcards) if self.flashcards else 0,
+        'card_count': self.card_count or 0,
         'created_at': self.created_at.isoformat() if self.created_at else None,
     }
-
-# Add to Flashcards class
-def to_search_dict(self):
-    """Convert flashcard to dictionary for search results"""
-    deck_info = {
-        'id': self.deck.flashcard_deck_id,
-        'name': self.deck.name
-    } if hasattr(self, 'deck') else None
-    
-    return {
-        'id': self.flashcard_id,
-        'question': self.question,
-        'correct_answer': self.correct_answer,
-        'deck': deck_info,
-        'state': self.state or 0,
-        'state_name': self.get_state_name(),
-    }
@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, case, or_, cast, bindparam, literal, Date, DateTime, Integer
+from . import db
+
+
+def sql_date(column):
+    """Calendar day of a timestamp column, per dialect"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite keeps timestamps as text; CAST(... AS DATE) would yield the year
+        return func.date(column)
+    return cast(column, Date)
+
+
+def sql_floor(expression):
+    """FLOOR() of a non-negative expression, per dialect"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # FLOOR needs SQLite's optional math functions; truncation is the same for x >= 0
+        return cast(expression, Integer)
+    return func.floor(expression)
+
+
+def sql_elapsed_days(column, now):
+    """Whole days from a timestamp column to ``now``, never negative, per dialect"""
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        seconds = cast(func.strftime('%s', literal(now, DateTime)), Integer) - cast(func.strftime('%s', column), Integer)
+        return sql_floor(func.max(seconds, 0) / 86400.0)
+    seconds = func.extract('epoch', literal(now, DateTime) - column)
+    return func.greatest(func.floor(seconds / 86400), 0)
+
+
+class DeckStatsDaily(db.Model):
+    """
+    Daily snapshot of a deck's subtree stats
+
+    One row per deck and UTC day, written by DeckStatsDaily.rollup(), so
+    history charts read a primary-key range instead of rescanning cards.
+    """
+    __tablename__ = 'deck_stats_daily'
+
+    flashcard_deck_id = db.Column(db.Integer, db.ForeignKey('flashcard_decks.flashcard_deck_id', ondelete='CASCADE'),
+                                  primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    new_count = db.Column(db.Integer, nullable=False, default=0)
+    learning_count = db.Column(db.Integer, nullable=False, default=0)
+    mastered_count = db.Column(db.Integer, nullable=False, default=0)
+    forgotten_count = db.Column(db.Integer, nullable=False, default=0)
+    due_count = db.Column(db.Integer, nullable=False, default=0)
+    mean_retrievability = db.Column(db.Float)  # None when no card was reviewed yet
+    review_count = db.Column(db.Integer, nullable=False, default=0)  # Reviews logged that day
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'date': self.day.isoformat(),
+            'total': self.total_count,
+            'new': self.new_count,
+            'learning': self.learning_count,
+            'mastered': self.mastered_count,
+            'forgotten': self.forgotten_count,
+            'due': self.due_count,
+            'mean_retrievability': self.mean_retrievability,
+            'reviews': self.review_count
+        }
+
+    @staticmethod
+    def series(deck_id, days=30, today=None):
+        """Snapshots of a deck for the last ``days`` days, oldest first"""
+        today = today or datetime.now(timezone.utc).date()
+        return DeckStatsDaily.query.filter(
+            DeckStatsDaily.flashcard_deck_id == deck_id,
+            DeckStatsDaily.day > today - timedelta(days=days),
+            DeckStatsDaily.day <= today
+        ).order_by(DeckStatsDaily.day).all()
+
+    @staticmethod
+    def has_snapshot(deck_id, day):
+        return db.session.query(
+            DeckStatsDaily.query.filter_by(flashcard_deck_id=deck_id, day=day).exists()
+        ).scalar()
+
+    @staticmethod
+    def rollup(now=None, deck_ids=None):
+        """
+        Write today's snapshot for every deck (or the given decks)
+
+        Incremental: only today's rows are (re)written, and the review counts
+        of days since the last snapshot are finalized from review_logs; older
+        rows are never recomputed. Mean retrievability is evaluated at ``now``
+        in the aggregate query, so cards are not rewritten first. The caller
+        commits.
+
+        Returns:
+            Number of deck rows written for today
+        """
+        from .flashcard_deck import FlashcardDecks, DeckClosure
+        from .flashcard import Flashcards
+        from services.fsrs_scheduler import retrievability_sql
+
+        now = now or datetime.now(timezone.utc)
+        today = now.date()
+
+        deck_query = db.session.query(FlashcardDecks.flashcard_deck_id)
+        if deck_ids is not None:
+            deck_query = deck_query.filter(FlashcardDecks.flashcard_deck_id.in_(deck_ids))
+        all_ids = [row[0] for row in deck_query.all()]
+        if not all_ids:
+            return 0
+
+        # Subtree aggregates for every deck in one grouped pass over the closure table
+        def count_where(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        aggregates = db.session.query(
+            DeckClosure.ancestor_id,
+            func.count(Flashcards.flashcard_id),
+            count_where(or_(Flashcards.state == 0, Flashcards.state.is_(None))),
+            count_where(Flashcards.state == 1),
+            count_where(Flashcards.state == 2),
+            count_where(Flashcards.state == 3),
+            count_where(Flashcards.due_date <= now),
+            func.avg(retrievability_sql(now))  # NULL for unreviewed cards, which avg skips
+        ).join(
+            Flashcards, Flashcards.flashcard_deck_id == DeckClosure.descendant_id
+        )
+        if deck_ids is not None:
+            aggregates = aggregates.filter(DeckClosure.ancestor_id.in_(all_ids))
+        by_deck = {row[0]: row[1:] for row in aggregates.group_by(DeckClosure.ancestor_id).all()}
+
+        # Finalize review counts for the days since the previous snapshot
+        last_day = db.session.query(func.max(DeckStatsDaily.day))
+        if deck_ids is not None:
+            last_day = last_day.filter(DeckStatsDaily.flashcard_deck_id.in_(all_ids))
+        last_day = last_day.scalar()
+        if isinstance(last_day, str):
+            last_day = datetime.strptime(last_day, '%Y-%m-%d').date()
+        day = last_day if last_day is not None and last_day < today else today
+        reviews = {}
+        while day <= today:
+            reviews[day] = DeckStatsDaily._review_counts(all_ids if deck_ids is not None else None, day)
+            day += timedelta(days=1)
+
+        table = DeckStatsDaily.__table__
+        finalize = table.update().where(
+            table.c.flashcard_deck_id == bindparam('deck_id'),
+            table.c.day == bindparam('snapshot_day')
+        ).values(review_count=bindparam('reviews'))
+        for past_day, counts in reviews.items():
+            if past_day == today:
+                continue
+            # One executemany per day; decks without reviews are reset to 0
+            db.session.execute(finalize, [
+                {'deck_id': deck_id, 'snapshot_day': past_day, 'reviews': counts.get(deck_id, 0)}
+                for deck_id in all_ids
+            ])
+
+        # Rewrite today's rows
+        rows = []
+        for deck_id in all_ids:
+            total, new, learning, mastered, forgotten, due, mean_r = by_deck.get(
+                deck_id, (0, 0, 0, 0, 0, 0, None)
+            )
+            rows.append({
+                'flashcard_deck_id': deck_id,
+                'day': today,
+                'total_count': int(total),
+                'new_count': int(new),
+                'learning_count': int(learning),
+                'mastered_count': int(mastered),
+                'forgotten_count': int(forgotten),
+                'due_count': int(due),
+                'mean_retrievability': float(mean_r) if mean_r is not None else None,
+                'review_count': reviews[today].get(deck_id, 0),
+                'updated_at': now.replace(tzinfo=None)
+            })
+        DeckStatsDaily._upsert(rows)
+        return len(rows)
+
+    @staticmethod
+    def _upsert(rows):
+        """Insert snapshot rows, overwriting any (deck, day) already written by a concurrent rollup"""
+        if db.session.get_bind().dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        statement = insert(DeckStatsDaily.__table__)
+        key = {'flashcard_deck_id', 'day'}
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column.name: statement.excluded[column.name]
+                  for column in DeckStatsDaily.__table__.columns if column.name not in key}
+        ), rows)
+
+    @staticmethod
+    def _review_counts(deck_ids, day):
+        """Reviews logged on a UTC day per deck subtree (cards still present); all decks when deck_ids is None"""
+        from .flashcard_deck import DeckClosure
+        from .flashcard import Flashcards
+        from .review_log import ReviewLogs
+
+        start = datetime.combine(day, datetime.min.time())
+        query = db.session.query(
+            DeckClosure.ancestor_id,
+            func.count(ReviewLogs.review_log_id)
+        ).join(
+            Flashcards, Flashcards.flashcard_id == ReviewLogs.flashcard_id
+        ).join(
+            DeckClosure, DeckClosure.descendant_id == Flashcards.flashcard_deck_id
+        ).filter(
+            ReviewLogs.reviewed_at >= start,
+            ReviewLogs.reviewed_at < start + timedelta(days=1)
+        )
+        if deck_ids is not None:
+            query = query.filter(DeckClosure.ancestor_id.in_(deck_ids))
+        return dict(query.group_by(DeckClosure.ancestor_id).all())
@@ -1,7 +1,10 @@
 from datetime import datetime, timezone
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.types import TypeDecorator
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import column_property, object_session
 from . import db
+from .flashcard_deck import FlashcardDecks
 import json
 import traceback
 from dataclasses import dataclass
@@ -59,7 +62,11 @@ class Flashcards(db.Model):
     question = db.Column(db.Text, nullable=False)
     correct_answer = db.Column(db.Text, nullable=False)
     incorrect_answers = db.Column(JSON, nullable=False)
-    flashcard_deck_id = db.Column(db.Integer, db.ForeignKey('flashcard_decks.flashcard_deck_id'), nullable=False)
+    # active_history keeps the previous deck/state around for the deck card counters
+    flashcard_deck_id = column_property(
+        db.Column(db.Integer, db.ForeignKey('flashcard_decks.flashcard_deck_id'), nullable=False),
+        active_history=True
+    )
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_reviewed = db.Column(db.DateTime)
     
@@ -69,7 +76,17 @@ class Flashcards(db.Model):
     difficulty = db.Column(db.Float, default=0.0)
     stability = db.Column(db.Float, default=0.0)
     retrievability = db.Column(db.Float, default=0.0)
-    state = db.Column(db.Integer, default=0)  # 0=New, 1=Learning, 2=Review, 3=Relearning
+    state = column_property(db.Column(db.Integer, default=0, nullable=False), active_history=True)  # 0=New, 1=Learning, 2=Review, 3=Relearning
+    
+    # MinHash fingerprint of question + answer for near-duplicate detection (see flashcard_lsh)
+    minhash = db.Column(db.LargeBinary)
+    
+    __table_args__ = (
+        # Study queue: per deck and state, cards in due order. The database keeps
+        # it current on every insert, move, delete and reschedule, and the study
+        # pages read it deck by deck as short range scans.
+        db.Index('idx_flashcards_study_queue', 'flashcard_deck_id', 'state', 'due_date', 'flashcard_id'),
+    )
     
     def init_fsrs_state(self):
         """Initialize FSRS state for new flashcard with custom 'New' state (0)"""
@@ -136,3 +153,64 @@ class Flashcards(db.Model):
             3: "forgotten"   # Relearning/Lapsed
         }
         return state_names.get(self.state, "new")
+    
+    def to_search_dict(self):
+        """Convert flashcard to dictionary for search results"""
+        deck_info = {
+            'id': self.deck.flashcard_deck_id,
+            'name': self.deck.name
+        } if self.deck is not None else None
+        
+        return {
+            'id': self.flashcard_id,
+            'question': self.question,
+            'correct_answer': self.correct_answer,
+            'deck': deck_info,
+            'state': self.state or 0,
+            'state_name': self.get_state_name(),
+        }
+
+
+def _previous_value(target, attr):
+    """Value an attribute had before the pending change (or its current value)"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(target, attr)
+
+
+@event.listens_for(Flashcards, 'after_insert')
+def _card_counts_after_insert(mapper, connection, target):
+    FlashcardDecks.queue_card_count_delta(
+        object_session(target), target.flashcard_deck_id, target.state, 1
+    )
+
+
+@event.listens_for(Flashcards, 'after_delete')
+def _card_counts_after_delete(mapper, connection, target):
+    FlashcardDecks.queue_card_count_delta(
+        object_session(target),
+        _previous_value(target, 'flashcard_deck_id'),
+        _previous_value(target, 'state'),
+        -1
+    )
+
+
+@event.listens_for(Flashcards, 'after_update')
+def _card_counts_after_update(mapper, connection, target):
+    """Move a card between counters when it changes deck or state"""
+    attrs = inspect(target).attrs
+    if not (attrs.flashcard_deck_id.history.has_changes() or attrs.state.history.has_changes()):
+        return
+    
+    session = object_session(target)
+    FlashcardDecks.queue_card_count_delta(
+        session,
+        _previous_value(target, 'flashcard_deck_id'),
+        _previous_value(target, 'state'),
+        -1
+    )
+    FlashcardDecks.queue_card_count_delta(session, target.flashcard_deck_id, target.state, 1)
+
@@ -1,7 +1,8 @@
 from datetime import datetime
 from sqlalchemy.sql import func, text
+from sqlalchemy import event, inspect, select, literal, true, case, bindparam
+from sqlalchemy.orm import relationship, aliased, Session
 from . import db
-from sqlalchemy.orm import relationship
 
 class FlashcardDecks(db.Model):
     __tablename__ = 'flashcard_decks'
@@ -13,6 +14,26 @@ class FlashcardDecks(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     is_public = db.Column(db.Boolean, default=False)
+    desired_retention = db.Column(db.Float)  # FSRS retention target for this deck's cards; None uses the scheduler's
+    
+    # Denormalized card counters, maintained by ORM events on Flashcards and on
+    # deck moves/deletes. card_count covers this deck only; the others roll up
+    # the whole subtree.
+    card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    new_card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    learning_card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    mastered_card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    forgotten_card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Subtree counter column for each FSRS state (0=New, 1=Learning, 2=Review, 3=Relearning)
+    STATE_COUNTER_COLUMNS = (
+        'new_card_count',
+        'learning_card_count',
+        'mastered_card_count',
+        'forgotten_card_count'
+    )
+    SUBTREE_COUNTER_COLUMNS = ('total_card_count',) + STATE_COUNTER_COLUMNS
     
     # Define relationships
     flashcards = relationship("Flashcards", backref="deck", cascade="all, delete-orphan")
@@ -20,28 +41,9 @@ class FlashcardDecks(db.Model):
                               backref=db.backref('parent_deck', remote_side=[flashcard_deck_id]),
                               cascade="all, delete-orphan")
 
-    def count_all_flashcards(self, visited=None):
-        """Count flashcards in this deck and all sub-decks with cycle detection"""
-        # Initialize visited set on first call
-        if visited is None:
-            visited = set()
-        
-        # Check for cycles
-        if self.flashcard_deck_id in visited:
-            # We've already seen this deck, so we have a cycle
-            return 0
-        
-        # Add current deck to visited set
-        visited.add(self.flashcard_deck_id)
-        
-        # Count cards in this deck
-        count = len(self.flashcards)
-        
-        # Recursively count cards in sub-decks
-        for sub_deck in self.child_decks:
-            count += sub_deck.count_all_flashcards(visited)
-        
-        return count
+    def count_all_flashcards(self):
+        """Count flashcards in this deck and all sub-decks (rolled-up counter)"""
+        return self.total_card_count or 0
     
     def count_all_sub_decks(self):
         """Count all sub-decks recursively"""
@@ -63,58 +65,372 @@ class FlashcardDecks(db.Model):
             'description': self.description,
             'parent_deck_id': self.parent_deck_id,
             'user_id': self.user_id,
-            'card_count': len(self.flashcards) if self.flashcards else 0,
+            'card_count': self.card_count or 0,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'is_public': self.is_public,
         }
         
     def get_mastery_stats(self):
-        """Get mastery statistics for the deck"""
+        """Get mastery statistics for the deck and its sub-decks from the rolled-up counters"""
+        total = self.total_card_count or 0
+        mastered = self.mastered_card_count or 0
+        
+        return {
+            'total': total,
+            'new': self.new_card_count or 0,
+            'learning': self.learning_card_count or 0,
+            'mastered': mastered,
+            'forgotten': self.forgotten_card_count or 0,
+            'mastery_percentage': (mastered / total * 100) if total > 0 else 0
+        }
+    
+    @staticmethod
+    def queue_card_count_delta(session, deck_id, state, delta):
+        """
+        Record a card count change to be applied to a deck and its ancestors
+        
+        Deltas are accumulated per deck and written once per flush, so adding
+        a batch of cards costs one UPDATE per affected deck instead of per card.
+        """
+        if session is None or deck_id is None:
+            return
+        
+        deltas = session.info.setdefault(_CARD_DELTAS_KEY, {})
+        # [direct, new, learning, mastered, forgotten]
+        entry = deltas.setdefault(int(deck_id), [0, 0, 0, 0, 0])
+        entry[0] += delta
+        entry[1 + _state_index(state)] += delta
+    
+    @staticmethod
+    def refresh_card_counters(deck_ids=None, connection=None):
+        """
+        Recompute card counters from the flashcards table
+        
+        Args:
+            deck_ids: Decks whose cards changed outside the ORM; they and all of
+                their ancestors are refreshed. None refreshes every deck.
+            connection: Optional connection to run on (defaults to the session's)
+        
+        Returns:
+            The number of decks refreshed
+        """
         from .flashcard import Flashcards
         
-        # Use recursive CTE to find all cards in this deck and sub-decks
-        cte = db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.flashcard_deck_id == self.flashcard_deck_id
-        ).cte(name='study_decks', recursive=True)
-
-        cte = cte.union_all(
-            db.session.query(
-                FlashcardDecks.flashcard_deck_id.label('id')
-            ).filter(
-                FlashcardDecks.parent_deck_id == cte.c.id
+        if connection is None:
+            db.session.flush()
+            connection = db.session.connection()
+        
+        decks = FlashcardDecks.__table__
+        cards = Flashcards.__table__
+        closure = DeckClosure.__table__
+        
+        if deck_ids is None:
+            targets = [row[0] for row in connection.execute(select(decks.c.flashcard_deck_id))]
+            target_filter = None
+        else:
+            targets = [row[0] for row in connection.execute(
+                select(closure.c.ancestor_id).where(
+                    closure.c.descendant_id.in_([int(d) for d in deck_ids])
+                ).distinct()
+            )]
+            target_filter = targets
+        
+        if not targets:
+            return 0
+        
+        counters = {deck_id: [0, 0, 0, 0, 0] for deck_id in targets}
+        
+        # Cards stored directly in each deck
+        direct_query = select(cards.c.flashcard_deck_id, func.count()).group_by(cards.c.flashcard_deck_id)
+        if target_filter is not None:
+            direct_query = direct_query.where(cards.c.flashcard_deck_id.in_(target_filter))
+        for deck_id, count in connection.execute(direct_query):
+            if deck_id in counters:
+                counters[deck_id][0] = count
+        
+        # Cards anywhere in each deck's subtree, split by state
+        rollup_query = select(
+            closure.c.ancestor_id, cards.c.state, func.count()
+        ).select_from(
+            closure.join(cards, cards.c.flashcard_deck_id == closure.c.descendant_id)
+        ).group_by(closure.c.ancestor_id, cards.c.state)
+        if target_filter is not None:
+            rollup_query = rollup_query.where(closure.c.ancestor_id.in_(target_filter))
+        for deck_id, state, count in connection.execute(rollup_query):
+            if deck_id in counters:
+                counters[deck_id][1 + _state_index(state)] += count
+        
+        connection.execute(
+            decks.update().where(decks.c.flashcard_deck_id == bindparam('b_deck_id')).values(
+                card_count=bindparam('b_direct'),
+                total_card_count=bindparam('b_total'),
+                new_card_count=bindparam('b_new'),
+                learning_card_count=bindparam('b_learning'),
+                mastered_card_count=bindparam('b_mastered'),
+                forgotten_card_count=bindparam('b_forgotten')
+            ),
+            [
+                {
+                    'b_deck_id': deck_id,
+                    'b_direct': values[0],
+                    'b_total': sum(values[1:]),
+                    'b_new': values[1],
+                    'b_learning': values[2],
+                    'b_mastered': values[3],
+                    'b_forgotten': values[4]
+                }
+                for deck_id, values in counters.items()
+            ]
+        )
+        return len(counters)
+
+
+_CARD_DELTAS_KEY = '_deck_card_count_deltas'
+
+
+def _state_index(state):
+    """Map a card state to its counter slot; unknown/None states count as new"""
+    state = int(state) if state is not None else 0
+    return state if 0 <= state <= 3 else 0
+
+
+def _shift_subtree_counters(connection, deck_id, sign):
+    """Add (sign=1) or subtract (sign=-1) a deck's subtree counters on its strict ancestors"""
+    decks = FlashcardDecks.__table__
+    closure = DeckClosure.__table__
+    
+    row = connection.execute(
+        select(*[decks.c[name] for name in FlashcardDecks.SUBTREE_COUNTER_COLUMNS]).where(
+            decks.c.flashcard_deck_id == deck_id
+        )
+    ).first()
+    if row is None or not any(row):
+        return
+    
+    connection.execute(
+        decks.update().where(
+            decks.c.flashcard_deck_id.in_(
+                select(closure.c.ancestor_id).where(
+                    closure.c.descendant_id == deck_id,
+                    closure.c.depth > 0
+                )
             )
+        ).values({
+            name: decks.c[name] + sign * (value or 0)
+            for name, value in zip(FlashcardDecks.SUBTREE_COUNTER_COLUMNS, row)
+        })
+    )
+
+
+class DeckClosure(db.Model):
+    """Closure table holding every (ancestor, descendant) pair of the deck hierarchy"""
+    __tablename__ = 'deck_closure'
+    
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('flashcard_decks.flashcard_deck_id', ondelete='CASCADE'),
+                            primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('flashcard_decks.flashcard_deck_id', ondelete='CASCADE'),
+                              primary_key=True)
+    depth = db.Column(db.Integer, nullable=False, default=0)  # 0 = the deck itself
+    
+    __table_args__ = (
+        db.Index('idx_deck_closure_descendant', 'descendant_id', 'depth'),
+    )
+    
+    @staticmethod
+    def subtree_ids(deck_id, include_self=True):
+        """
+        Query for the IDs of a deck and all of its sub-decks
+        
+        Args:
+            deck_id: The root deck of the subtree
+            include_self: Whether the root deck itself is part of the result
+        
+        Returns:
+            A query selecting descendant deck IDs, usable directly inside ``in_()``
+        """
+        query = db.session.query(DeckClosure.descendant_id).filter(
+            DeckClosure.ancestor_id == deck_id
         )
+        if not include_self:
+            query = query.filter(DeckClosure.depth > 0)
+        return query
+    
+    @staticmethod
+    def root_id(deck_id):
+        """ID of the top-level deck whose hierarchy contains deck_id"""
+        row = db.session.query(DeckClosure.ancestor_id).filter(
+            DeckClosure.descendant_id == deck_id
+        ).order_by(DeckClosure.depth.desc()).first()
+        return row[0] if row else deck_id
+    
+    @staticmethod
+    def is_ancestor(ancestor_id, descendant_id):
+        """Check if ancestor_id is the deck itself or one of its ancestors"""
+        return db.session.query(
+            DeckClosure.query.filter_by(
+                ancestor_id=ancestor_id,
+                descendant_id=descendant_id
+            ).exists()
+        ).scalar()
+    
+    @staticmethod
+    def rebuild(connection=None):
+        """
+        Recompute the whole closure table from flashcard_decks.parent_deck_id
         
-        # Get cards from all decks in the hierarchy
-        cards = Flashcards.query.filter(
-            Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
+        Used to backfill existing databases and to repair the table after
+        bulk operations that bypass the ORM (e.g. database sync).
+        
+        Returns:
+            The number of closure rows written
+        """
+        conn = connection if connection is not None else db.session.connection()
+        decks = conn.execute(
+            select(FlashcardDecks.flashcard_deck_id, FlashcardDecks.parent_deck_id)
         ).all()
+        parents = {deck_id: parent_id for deck_id, parent_id in decks}
         
-        # Count cards by FSRS state
-        total = len(cards)
-        new = 0
-        learning = 0
-        mastered = 0
-        forgotten = 0
-        
-        for card in cards:
-            state = card.state or 0
-            if state == 0:
-                new += 1
-            elif state == 1:
-                learning += 1
-            elif state == 2:
-                mastered += 1
-            elif state == 3:
-                forgotten += 1
+        rows = []
+        for deck_id in parents:
+            # Walk up the parent chain, guarding against cycles in bad data
+            current, depth, seen = deck_id, 0, set()
+            while current is not None and current in parents and current not in seen:
+                seen.add(current)
+                rows.append({'ancestor_id': current, 'descendant_id': deck_id, 'depth': depth})
+                current = parents[current]
+                depth += 1
         
-        return {
-            'total': total,
-            'new': new,
-            'learning': learning,
-            'mastered': mastered,
-            'forgotten': forgotten,
-            'mastery_percentage': (mastered / total * 100) if total > 0 else 0
-        }
+        closure = DeckClosure.__table__
+        conn.execute(closure.delete())
+        if rows:
+            conn.execute(closure.insert(), rows)
+        return len(rows)
+
+
+@event.listens_for(FlashcardDecks, 'after_insert')
+def _closure_after_insert(mapper, connection, target):
+    """Add the self row and inherit the parent's ancestors for a new deck"""
+    closure = DeckClosure.__table__
+    deck_id = target.flashcard_deck_id
+    
+    connection.execute(closure.insert().values(ancestor_id=deck_id, descendant_id=deck_id, depth=0))
+    
+    if target.parent_deck_id is not None:
+        connection.execute(
+            closure.insert().from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(closure.c.ancestor_id, literal(deck_id), closure.c.depth + 1).where(
+                    closure.c.descendant_id == int(target.parent_deck_id)
+                )
+            )
+        )
+
+
+@event.listens_for(FlashcardDecks, 'after_update')
+def _closure_after_update(mapper, connection, target):
+    """Re-link a deck's whole subtree when its parent changes"""
+    history = inspect(target).attrs.parent_deck_id.history
+    if not history.has_changes():
+        return
+    
+    closure = DeckClosure.__table__
+    deck_id = target.flashcard_deck_id
+    subtree = select(closure.c.descendant_id).where(closure.c.ancestor_id == deck_id)
+    
+    # The old ancestors lose the subtree's cards
+    _shift_subtree_counters(connection, deck_id, -1)
+    
+    # Detach: drop every path that enters the subtree from outside of it
+    connection.execute(
+        closure.delete().where(
+            closure.c.descendant_id.in_(subtree),
+            closure.c.ancestor_id.notin_(subtree)
+        )
+    )
+    
+    # Attach: connect every ancestor of the new parent to every node of the subtree
+    if target.parent_deck_id is not None:
+        above = aliased(closure)
+        below = aliased(closure)
+        connection.execute(
+            closure.insert().from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(
+                    above.c.ancestor_id,
+                    below.c.descendant_id,
+                    above.c.depth + below.c.depth + 1
+                ).select_from(
+                    above.join(below, true())  # Intentional cross product, filtered below
+                ).where(
+                    above.c.descendant_id == int(target.parent_deck_id),
+                    below.c.ancestor_id == deck_id
+                )
+            )
+        )
+        
+        # The new ancestors gain the subtree's cards
+        _shift_subtree_counters(connection, deck_id, 1)
+
+
+@event.listens_for(FlashcardDecks, 'before_delete')
+def _closure_before_delete(mapper, connection, target):
+    """Remove closure rows referencing a deck before the deck row goes away"""
+    closure = DeckClosure.__table__
+    deck_id = target.flashcard_deck_id
+    subtree = select(closure.c.descendant_id).where(closure.c.ancestor_id == deck_id)
+    
+    # Ancestors lose the cards of the removed subtree
+    _shift_subtree_counters(connection, deck_id, -1)
+    
+    # Detach the whole subtree so sub-decks deleted later in the same flush
+    # don't subtract their cards from these ancestors a second time
+    connection.execute(
+        closure.delete().where(
+            closure.c.descendant_id.in_(subtree),
+            closure.c.ancestor_id.notin_(subtree)
+        )
+    )
+    connection.execute(
+        closure.delete().where(
+            (closure.c.ancestor_id == deck_id) | (closure.c.descendant_id == deck_id)
+        )
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_card_count_deltas(session, flush_context):
+    """Write the card count deltas queued during this flush"""
+    deltas = session.info.pop(_CARD_DELTAS_KEY, None)
+    if not deltas:
+        return
+    
+    decks = FlashcardDecks.__table__
+    closure = DeckClosure.__table__
+    connection = session.connection()
+    
+    for deck_id, (direct, new, learning, mastered, forgotten) in deltas.items():
+        if not any((direct, new, learning, mastered, forgotten)):
+            continue
+        
+        connection.execute(
+            decks.update().where(
+                decks.c.flashcard_deck_id.in_(
+                    select(closure.c.ancestor_id).where(closure.c.descendant_id == deck_id)
+                )
+            ).values(
+                card_count=decks.c.card_count + case(
+                    (decks.c.flashcard_deck_id == deck_id, direct), else_=0
+                ),
+                total_card_count=decks.c.total_card_count + (new + learning + mastered + forgotten),
+                new_card_count=decks.c.new_card_count + new,
+                learning_card_count=decks.c.learning_card_count + learning,
+                mastered_card_count=decks.c.mastered_card_count + mastered,
+                forgotten_card_count=decks.c.forgotten_card_count + forgotten
+            )
+        )
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_card_count_deltas(session):
+    """Drop deltas queued by a flush that was rolled back"""
+    session.info.pop(_CARD_DELTAS_KEY, None)
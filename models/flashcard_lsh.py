@@ -0,0 +1,180 @@
+import re
+import hashlib
+import numpy as np
+from sqlalchemy import event, inspect, select, bindparam
+from sqlalchemy.orm import Session
+from . import db
+from .flashcard import Flashcards
+
+# MinHash over character 3-gram shingles of the normalized question and answer:
+# MINHASH_PERMUTATIONS values split into LSH_BANDS bands of LSH_ROWS values.
+# Cards with Jaccard similarity 0.7 share a band with probability ~0.89, at 0.8 ~0.99.
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)  # Fixed: fingerprints are persisted
+_HASH_A = _rng.integers(1, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def card_shingles(question, answer):
+    """Character 3-grams of a card's question and answer, lower-cased, punctuation dropped"""
+    text = ' '.join(re.findall(r'[^\W_]+', f'{question or ""} {answer or ""}'.lower()))
+    if len(text) < SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash_signature(shingles):
+    """MinHash signature of a shingle set as bytes (None for an empty set)"""
+    if not shingles:
+        return None
+    values = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'big') for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # (a * x + b) mod p for every permutation and shingle; a, x < 2^32 so no uint64 overflow
+    hashed = (_HASH_A[:, None] * values[None, :] + _HASH_B[:, None]) % np.uint64(_MERSENNE_PRIME)
+    return hashed.min(axis=1).astype('<u4').tobytes()
+
+
+def lsh_buckets(signature):
+    """One bucket id per band, unique across bands, as signed 32-bit ints"""
+    if signature is None:
+        return []
+    buckets = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * LSH_ROWS * 4:(band + 1) * LSH_ROWS * 4]
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=4).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+class FlashcardLSH(db.Model):
+    """
+    Locality-sensitive hash index over card fingerprints
+
+    One row per card and MinHash band. Cards sharing a bucket are
+    near-duplicate candidates; callers confirm them with the Jaccard
+    similarity of their shingles. Rows follow the card's fingerprint through
+    ORM events and go away with the card (ON DELETE CASCADE).
+    """
+    __tablename__ = 'flashcard_lsh'
+
+    bucket = db.Column(db.Integer, primary_key=True)
+    flashcard_id = db.Column(db.Integer, db.ForeignKey('flashcards.flashcard_id', ondelete='CASCADE'),
+                             primary_key=True)
+
+    __table_args__ = (
+        db.Index('idx_flashcard_lsh_card', 'flashcard_id'),
+    )
+
+    @staticmethod
+    def rebuild(connection=None, batch_size=1000):
+        """
+        Recompute every card's fingerprint and LSH rows
+
+        Returns:
+            Number of cards fingerprinted
+        """
+        connection = connection or db.session.connection()
+        connection.execute(FlashcardLSH.__table__.delete())
+
+        cards = Flashcards.__table__
+        last_id, total = 0, 0
+        while True:
+            rows = connection.execute(
+                select(cards.c.flashcard_id, cards.c.question, cards.c.correct_answer).where(
+                    cards.c.flashcard_id > last_id
+                ).order_by(cards.c.flashcard_id).limit(batch_size)
+            ).all()
+            if not rows:
+                return total
+
+            fingerprints = {row.flashcard_id: minhash_signature(card_shingles(row.question, row.correct_answer))
+                            for row in rows}
+            connection.execute(
+                cards.update().where(cards.c.flashcard_id == bindparam('card_id')).values(
+                    minhash=bindparam('signature')
+                ),
+                [{'card_id': card_id, 'signature': signature} for card_id, signature in fingerprints.items()]
+            )
+            _write_buckets(connection, fingerprints)
+            last_id = rows[-1].flashcard_id
+            total += len(rows)
+
+
+_LSH_QUEUE_KEY = '_flashcard_lsh_queue'
+
+
+def _write_buckets(connection, fingerprints, replace_ids=()):
+    """Insert the LSH rows of {flashcard_id: signature}, first dropping those of replace_ids"""
+    table = FlashcardLSH.__table__
+    replace_ids = list(replace_ids)
+    for start in range(0, len(replace_ids), 500):
+        connection.execute(table.delete().where(table.c.flashcard_id.in_(replace_ids[start:start + 500])))
+
+    rows = [
+        {'bucket': bucket, 'flashcard_id': card_id}
+        for card_id, signature in fingerprints.items()
+        for bucket in set(lsh_buckets(signature))
+    ]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def _fingerprint(target):
+    target.minhash = minhash_signature(card_shingles(target.question, target.correct_answer))
+
+
+@event.listens_for(Flashcards, 'before_insert')
+def _fingerprint_before_insert(mapper, connection, target):
+    _fingerprint(target)
+
+
+@event.listens_for(Flashcards, 'before_update')
+def _fingerprint_before_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.question.history.has_changes() or state.attrs.correct_answer.history.has_changes():
+        _fingerprint(target)
+
+
+def _queue_buckets(target, replace):
+    session = inspect(target).session
+    if session is not None:
+        fingerprints, replace_ids = session.info.setdefault(_LSH_QUEUE_KEY, ({}, set()))
+        fingerprints[target.flashcard_id] = target.minhash
+        if replace:
+            replace_ids.add(target.flashcard_id)
+
+
+@event.listens_for(Flashcards, 'after_insert')
+def _buckets_after_insert(mapper, connection, target):
+    _queue_buckets(target, replace=False)
+
+
+@event.listens_for(Flashcards, 'after_update')
+def _buckets_after_update(mapper, connection, target):
+    if inspect(target).attrs.minhash.history.has_changes():
+        _queue_buckets(target, replace=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _flush_buckets(session, flush_context):
+    queued = session.info.pop(_LSH_QUEUE_KEY, None)
+    if queued:
+        _write_buckets(session.connection(), *queued)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_buckets(session):
+    session.info.pop(_LSH_QUEUE_KEY, None)
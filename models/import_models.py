@@ -1,3 +1,5 @@
+import hashlib
+import unicodedata
 from models import db
 from datetime import datetime
 
@@ -14,6 +16,7 @@ class ImportFile(db.Model):
     current_index = db.Column(db.Integer, default=0)
     is_complete = db.Column(db.Boolean, default=False)
     total_saved_cards = db.Column(db.Integer, default=0)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the uploaded bytes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -44,6 +47,7 @@ class ImportChunk(db.Model):
     file_id = db.Column(db.Integer, db.ForeignKey('import_files.id'), nullable=False)
     index = db.Column(db.Integer, nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)  # ContentChunk key
     is_processed = db.Column(db.Boolean, default=False)
     is_saved = db.Column(db.Boolean, default=False)
     cards_saved = db.Column(db.Integer, default=0)
@@ -61,6 +65,45 @@ class ImportChunk(db.Model):
         return f"<ImportChunk {self.id} (file: {self.file_id}, index: {self.index})>"
 
 
+class ContentFile(db.Model):
+    """Chunk hashes of an uploaded file, keyed by the SHA-256 of its bytes"""
+    __tablename__ = 'content_files'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)
+    chunk_hashes = db.Column(db.JSON, nullable=False)  # Ordered ContentChunk keys
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<ContentFile {self.content_hash[:12]} ({len(self.chunk_hashes)} chunks)>"
+
+
+class ContentChunk(db.Model):
+    """
+    Extracted chunk text, keyed by the SHA-256 of its normalized text
+    
+    Shared by every upload containing the same chunk; also caches the cards
+    generated from it so that known content is not sent to the model again.
+    """
+    __tablename__ = 'content_chunks'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)
+    content = db.Column(db.Text, nullable=False)
+    cards = db.Column(db.JSON, nullable=True)  # Generated cards in the q/ca/ia format
+    cards_model = db.Column(db.String(100), nullable=True)  # Model that generated them
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    @staticmethod
+    def hash_text(text):
+        """SHA-256 of text after Unicode (NFC) and whitespace normalization"""
+        normalized = ' '.join(unicodedata.normalize('NFC', text or '').split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    def __repr__(self):
+        return f"<ContentChunk {self.content_hash[:12]}>"
+
+
 class ImportFlashcard(db.Model):
     """Temporary storage for generated flashcards during import process"""
     __tablename__ = 'import_flashcards'
@@ -123,3 +166,36 @@ class ImportTask(db.Model):
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'error': self.error
         }
+
+
+class ImportJob(db.Model):
+    """
+    One chunk of a background import in the durable job queue
+    
+    Workers claim queued jobs by taking a lease, which they keep alive with
+    heartbeats; a job whose lease runs out (its worker died) can be claimed
+    by another worker. Failed attempts are retried with exponential backoff
+    until the attempt limit, after which the job is dead-lettered.
+    """
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(36), db.ForeignKey('import_tasks.id', ondelete='CASCADE'), nullable=False)
+    file_key = db.Column(db.String(64), nullable=False)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Not claimed before (backoff)
+    lease_owner = db.Column(db.String(100), nullable=True)  # Worker holding the job
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'chunk_index', name='uix_import_job_task_chunk'),
+        db.Index('idx_import_jobs_claim', 'status', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f"<ImportJob {self.id} (task: {self.task_id}, chunk: {self.chunk_index}, {self.status})>"
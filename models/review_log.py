@@ -0,0 +1,100 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import db
+
+class ReviewLogs(db.Model):
+    """
+    Append-only history of FSRS reviews
+
+    One row per answered card with the rating, the whole days elapsed since
+    the previous review and the card's state, stability and difficulty before
+    and after the review. Rows are never updated; they are written in batches
+    through ReviewLogs.queue() rather than as ORM objects.
+    """
+    __tablename__ = 'review_logs'
+
+    # BIGINT on servers; SQLite only autoincrements INTEGER primary keys
+    review_log_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    # No foreign keys: the history outlives deleted cards and decks
+    flashcard_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)
+    rating = db.Column(db.SmallInteger, nullable=False)  # 1=Again, 2=Hard, 3=Good, 4=Easy
+    reviewed_at = db.Column(db.DateTime, nullable=False)
+    elapsed_days = db.Column(db.Integer)  # None for a card's first review
+    state_before = db.Column(db.SmallInteger, nullable=False)
+    state_after = db.Column(db.SmallInteger, nullable=False)
+    stability_before = db.Column(db.Float)
+    stability_after = db.Column(db.Float)
+    difficulty_before = db.Column(db.Float)
+    difficulty_after = db.Column(db.Float)
+    scheduled_days = db.Column(db.Float)  # Interval to the next due date, in days
+
+    __table_args__ = (
+        # Per-user history in time order (optimizer, stats)
+        db.Index('idx_review_logs_user_time', 'user_id', 'reviewed_at'),
+        # Per-card history in time order
+        db.Index('idx_review_logs_card_time', 'flashcard_id', 'reviewed_at'),
+    )
+
+    @staticmethod
+    def queue(session, **entry):
+        """
+        Buffer a review log row on the session
+
+        Buffered rows are inserted with one executemany per batch when the
+        session flushes, inside the same transaction as the card update, and
+        are dropped if that transaction rolls back.
+        """
+        if session is None:
+            return
+        session.info.setdefault(_REVIEW_LOG_BUFFER_KEY, []).append(entry)
+
+    @staticmethod
+    def pending(session):
+        """Number of buffered rows not written yet"""
+        return len(session.info.get(_REVIEW_LOG_BUFFER_KEY, ()))
+
+
+_REVIEW_LOG_BUFFER_KEY = '_review_log_buffer'
+
+# Rows per INSERT ... executemany
+REVIEW_LOG_BATCH_SIZE = 500
+
+_REVIEW_LOG_FIELDS = (
+    'flashcard_id', 'user_id', 'rating', 'reviewed_at', 'elapsed_days',
+    'state_before', 'state_after', 'stability_before', 'stability_after',
+    'difficulty_before', 'difficulty_after', 'scheduled_days'
+)
+
+
+def _write_review_logs(session):
+    """Insert the buffered review logs in batches on the session's connection"""
+    rows = session.info.pop(_REVIEW_LOG_BUFFER_KEY, None)
+    if not rows:
+        return
+
+    table = ReviewLogs.__table__
+    connection = session.connection()
+    for start in range(0, len(rows), REVIEW_LOG_BATCH_SIZE):
+        batch = rows[start:start + REVIEW_LOG_BATCH_SIZE]
+        connection.execute(
+            table.insert(),
+            [{field: row.get(field) for field in _REVIEW_LOG_FIELDS} for row in batch]
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _flush_review_logs(session, flush_context):
+    _write_review_logs(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_review_logs_before_commit(session):
+    # Covers rows buffered after the last flush when nothing else is dirty
+    _write_review_logs(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_review_logs(session):
+    """Drop review logs buffered in a transaction that was rolled back"""
+    session.info.pop(_REVIEW_LOG_BUFFER_KEY, None)
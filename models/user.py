@@ -12,6 +12,11 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
+    # Per-user FSRS weights fitted from review_logs (None = global defaults)
+    fsrs_parameters = db.Column(db.JSON)
+    fsrs_optimized_at = db.Column(db.DateTime)
+    fsrs_optimized_reviews = db.Column(db.Integer)  # Review log rows the fit used
+    
     # Relationship with flashcard decks (one-to-many)
     decks = db.relationship('FlashcardDecks', backref='user', lazy=True)
     
@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, request
 
 def register_blueprints(app: Flask):
     """Register all application blueprints"""
@@ -11,6 +11,20 @@ def register_blueprints(app: Flask):
     from routes.auth_routes import auth_bp
     from routes.learning.__init__ import register_learning_blueprint
     from routes.user import user_bp
+    from routes.flashcard.core_routes import flashcard_bp
+    from routes.flashcard.generation_routes import generation_bp
+    from services.cache_service import invalidate_after_mutation
+    
+    # Writes to decks, flashcards and reviews invalidate the user's cached data.
+    # The hook is registered on the app (not the shared blueprint objects) so
+    # create_app() can run more than once in a process, as cli.py does.
+    mutating_blueprints = {bp.name for bp in (import_bp, deck_bp, flashcard_bp, generation_bp)}
+    
+    @app.after_request
+    def invalidate_cache_after_write(response):
+        if mutating_blueprints.intersection(request.blueprints):
+            return invalidate_after_mutation(response)
+        return response
     
     # Register blueprints
     app.register_blueprint(main_bp)
@@ -1,7 +1,9 @@
 from flask import Blueprint, jsonify, request, current_app
-from models import db, FlashcardDecks, Flashcards
-from services.fsrs_scheduler import get_current_time
-from utils import count_due_flashcards
+from models import db, FlashcardDecks, Flashcards, DeckClosure
+from services.fsrs_scheduler import get_current_time, sweep_overdue_cards, reschedule_cards
+from utils import count_due_flashcards, batch_count_due_cards
+from services.deck_tree_service import DeckTreeCache
+from services.duplicate_service import filter_duplicates
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -11,66 +13,13 @@ deck_api_bp = Blueprint('deck_api', __name__)
 @login_required
 def get_deck_tree():
     """Get the complete deck hierarchy as a tree structure"""
-    # Get top-level decks for current user
-    root_decks = FlashcardDecks.query.filter_by(
-        parent_deck_id=None,
-        user_id=current_user.id
-    ).all()
-    
-    # Build tree recursively
-    result = []
-    for deck in root_decks:
-        result.append(build_deck_tree(deck))
-    
-    return jsonify(result)
-
-def build_deck_tree(deck):
-    """Helper function to build a deck tree structure recursively"""
-    deck_dict = {
-        'flashcard_deck_id': deck.flashcard_deck_id,
-        'name': deck.name,
-        'description': deck.description,
-        'child_decks': []
-    }
-    
-    for child in deck.child_decks:
-        deck_dict['child_decks'].append(build_deck_tree(child))
-    
-    return deck_dict
+    return jsonify(DeckTreeCache.get(current_user.id).to_tree())
 
 @deck_api_bp.route("/decks")
 @login_required
 def get_decks_api():
     """Get all decks as a structured JSON for API use"""
-    # Get top-level decks for current user
-    root_decks = FlashcardDecks.query.filter_by(
-        parent_deck_id=None,
-        user_id=current_user.id
-    ).all()
-    
-    result = []
-    for deck in root_decks:
-        result.append({
-            "id": deck.flashcard_deck_id,
-            "name": deck.name,
-            "children": get_child_decks(deck.flashcard_deck_id)
-        })
-    
-    return jsonify(result)
-
-def get_child_decks(parent_id):
-    """Helper function to recursively get child decks"""
-    child_decks = FlashcardDecks.query.filter_by(parent_deck_id=parent_id).all()
-    result = []
-    
-    for deck in child_decks:
-        result.append({
-            "id": deck.flashcard_deck_id,
-            "name": deck.name,
-            "children": get_child_decks(deck.flashcard_deck_id)
-        })
-    
-    return result
+    return jsonify(DeckTreeCache.get(current_user.id).to_nested())
 
 @deck_api_bp.route("/list", methods=["GET"])
 @login_required
@@ -86,7 +35,7 @@ def api_list_decks():
             'id': deck.flashcard_deck_id,
             'name': deck.name,
             'parent_id': deck.parent_deck_id,
-            'flashcard_count': len(deck.flashcards) if deck.flashcards else 0
+            'flashcard_count': deck.card_count or 0
         })
     
     return jsonify(result)
@@ -99,14 +48,12 @@ def get_due_counts():
         # Add debugging
         current_app.logger.info(f"Getting due counts for user {current_user.id}")
         
-        # Get all decks for the current user
-        decks = FlashcardDecks.query.filter_by(user_id=current_user.id).all()
-        
-        # Calculate due counts for each deck
-        result = {}
-        for deck in decks:
-            deck_id = deck.flashcard_deck_id
-            result[str(deck_id)] = count_due_flashcards(deck_id)
+        # Calculate due counts for all of the user's decks in one pass
+        deck_ids = [d.flashcard_deck_id for d in
+                    FlashcardDecks.query.with_entities(FlashcardDecks.flashcard_deck_id)
+                    .filter_by(user_id=current_user.id).all()]
+        counts = batch_count_due_cards(deck_ids, current_user.id)
+        result = {str(deck_id): count for deck_id, count in counts.items()}
         
         current_app.logger.debug(f"Due counts result: {result}")
         return jsonify({
@@ -205,13 +152,14 @@ def import_deck(deck_id):
         deck_mapping[source_deck.flashcard_deck_id] = new_deck.flashcard_deck_id
         
         # First import flashcards for the main deck
-        import_flashcards(source_deck.flashcard_deck_id, new_deck.flashcard_deck_id)
+        _, duplicates = import_flashcards(source_deck.flashcard_deck_id, new_deck.flashcard_deck_id)
         
         # Then recursively import all child decks
-        import_child_decks(source_deck, new_deck.flashcard_deck_id, deck_mapping)
+        duplicates += import_child_decks(source_deck, new_deck.flashcard_deck_id, deck_mapping)
         
         # Commit all changes
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         # Count total imported flashcards
         total_cards = count_imported_cards(new_deck.flashcard_deck_id)
@@ -219,7 +167,8 @@ def import_deck(deck_id):
         return jsonify({
             "success": True, 
             "message": f"Successfully imported deck with {total_cards} flashcards and {len(deck_mapping)-1} sub-decks",
-            "deck_id": new_deck.flashcard_deck_id
+            "deck_id": new_deck.flashcard_deck_id,
+            "duplicates_skipped": duplicates
         })
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -238,7 +187,11 @@ def import_child_decks(source_deck, new_parent_id, deck_mapping):
         source_deck: The source deck object
         new_parent_id: The ID of the new parent deck
         deck_mapping: Dictionary mapping source deck IDs to new deck IDs
+    
+    Returns:
+        The number of near-duplicate cards skipped in the child decks
     """
+    duplicates = 0
     # Process each child deck
     for child_deck in source_deck.child_decks:
         # Create a new deck for this child
@@ -256,10 +209,13 @@ def import_child_decks(source_deck, new_parent_id, deck_mapping):
         deck_mapping[child_deck.flashcard_deck_id] = new_child.flashcard_deck_id
         
         # Copy flashcards for this child deck
-        import_flashcards(child_deck.flashcard_deck_id, new_child.flashcard_deck_id)
+        _, skipped = import_flashcards(child_deck.flashcard_deck_id, new_child.flashcard_deck_id)
+        duplicates += skipped
         
         # Process this child's sub-decks recursively
-        import_child_decks(child_deck, new_child.flashcard_deck_id, deck_mapping)
+        duplicates += import_child_decks(child_deck, new_child.flashcard_deck_id, deck_mapping)
+    
+    return duplicates
 
 def import_flashcards(source_deck_id, target_deck_id):
     """
@@ -270,11 +226,18 @@ def import_flashcards(source_deck_id, target_deck_id):
         target_deck_id: The ID of the target deck
     
     Returns:
-        The number of cards imported
+        Tuple of (cards imported, near-duplicates skipped)
     """
     # Get all flashcards from the source deck
     flashcards = Flashcards.query.filter_by(flashcard_deck_id=source_deck_id).all()
     
+    # Skip near-duplicates of cards already copied into the new hierarchy
+    flashcards, duplicates = filter_duplicates(
+        target_deck_id, flashcards, fields=lambda card: (card.question, card.correct_answer)
+    )
+    if duplicates:
+        current_app.logger.info(f"Skipped {duplicates} near-duplicate flashcards from deck {source_deck_id}")
+    
     imported_count = 0
     for card in flashcards:
         try:
@@ -293,7 +256,7 @@ def import_flashcards(source_deck_id, target_deck_id):
             print(f"Error copying card {card.flashcard_id}: {str(e)}")
     
     print(f"Imported {imported_count} flashcards from deck {source_deck_id} to deck {target_deck_id}")
-    return imported_count
+    return imported_count, duplicates
 
 def count_imported_cards(deck_id):
     """
@@ -305,24 +268,9 @@ def count_imported_cards(deck_id):
     Returns:
         The total number of cards in the deck and all its sub-decks
     """
-    # Use recursive CTE to find all decks in the hierarchy
-    cte = db.session.query(
-        FlashcardDecks.flashcard_deck_id.label('id')
-    ).filter(
-        FlashcardDecks.flashcard_deck_id == deck_id
-    ).cte(name='count_decks', recursive=True)
-
-    cte = cte.union_all(
-        db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.parent_deck_id == cte.c.id
-        )
-    )
-    
     # Count cards from all decks in the hierarchy
     count = Flashcards.query.filter(
-        Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
+        Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(deck_id))
     ).count()
     
     return count
@@ -345,37 +293,15 @@ def update_overdue_cards(deck_id):
         if update_type != 'forgotten':
             return jsonify({'success': False, 'message': 'Invalid update type'}), 400
         
-        # Execute raw SQL query to update overdue cards to forgotten state
-        # This specific query handles both NULL and JSON fsrs_state
-        result = db.session.execute("""
-            UPDATE flashcards
-            SET 
-                state = 3,
-                fsrs_state = 
-                    CASE 
-                        WHEN fsrs_state IS NULL THEN '{"state": 3, "step": 0}'::jsonb
-                        ELSE jsonb_set(
-                            jsonb_set(
-                                fsrs_state::jsonb, 
-                                '{state}', 
-                                '3'::jsonb
-                            ),
-                            '{step}',
-                            '0'::jsonb
-                        )
-                    END
-            WHERE 
-                due_date < NOW() 
-                AND flashcard_deck_id = :deck_id
-                AND state != 0  -- Skip new cards
-                AND state != 3  -- Skip already forgotten cards
-            RETURNING flashcard_id
-        """, {'deck_id': deck_id})
-        
-        # Get the IDs of updated cards
-        updated_ids = [row[0] for row in result]
+        # Mark overdue cards forgotten in one bulk update, storing their
+        # current retrievability from the vectorized FSRS engine
+        updated_ids = sweep_overdue_cards(deck_id)
         updated_count = len(updated_ids)
         
+        # Bulk updates bypass the ORM counter hooks, so resync this deck's counters
+        if updated_count:
+            FlashcardDecks.refresh_card_counters([deck_id])
+        
         # Commit changes
         db.session.commit()
         
@@ -403,3 +329,31 @@ def update_overdue_cards(deck_id):
             'success': False, 
             'error': f"Error: {str(e)}"
         }), 500
+
+@deck_api_bp.route('/reschedule/<int:deck_id>', methods=['POST'])
+@login_required
+def reschedule_deck_cards(deck_id):
+    """Recompute due dates of a deck's reviewed cards, optionally for a new retention target saved on the deck and its sub-decks"""
+    FlashcardDecks.query.filter_by(
+        flashcard_deck_id=deck_id,
+        user_id=current_user.id
+    ).first_or_404()
+    
+    data = request.get_json(silent=True) or {}
+    desired_retention = data.get('desired_retention')
+    if desired_retention is not None:
+        try:
+            desired_retention = float(desired_retention)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'desired_retention must be a number'}), 400
+        if not 0.7 <= desired_retention <= 0.97:
+            return jsonify({'success': False, 'message': 'desired_retention must be between 0.7 and 0.97'}), 400
+    
+    try:
+        rescheduled = reschedule_cards(deck_id, desired_retention, commit=True)
+        current_app.logger.info(f"Rescheduled {rescheduled} cards for deck {deck_id}")
+        return jsonify({'success': True, 'rescheduled_count': rescheduled})
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Database error rescheduling cards: {str(e)}")
+        return jsonify({'success': False, 'error': f"Database error: {str(e)}"}), 500
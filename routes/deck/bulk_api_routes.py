@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request, current_app
 from models import db, FlashcardDecks, Flashcards
+from services.deck_tree_service import DeckTreeCache
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -123,6 +124,7 @@ def bulk_delete_decks():
             db.session.delete(deck)
         
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         return jsonify({
             "success": True, 
@@ -196,6 +198,7 @@ def bulk_move_decks():
             deck.parent_deck_id = parent_deck_id
         
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         parent_name = 'root level' if not parent_deck_id else parent_deck.name
         return jsonify({
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify, abort
-from models import db, FlashcardDecks, Flashcards
+from models import db, FlashcardDecks, Flashcards, DeckClosure
 from utils import is_descendant  # Updated import path
+from services.deck_tree_service import DeckTreeCache
+from services.duplicate_service import find_duplicate_groups
 from flask_login import current_user, login_required
 
 # Change the URL prefix to match how it's being called
@@ -50,6 +52,7 @@ def create_deck():
     )
     db.session.add(deck)
     db.session.commit()
+    DeckTreeCache.invalidate(current_user.id)
     
     return jsonify({"success": True, "deck_id": deck.flashcard_deck_id})
 
@@ -106,6 +109,7 @@ def create_multiple_decks(parent_deck_id=None):
         
         # Commit all decks at once
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         return jsonify({
             "success": True,
@@ -131,6 +135,7 @@ def rename_deck(deck_id):
         deck.name = data.get('name')
         deck.description = data.get('description')
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         return jsonify({"success": True, "message": "Deck renamed successfully"})
     except Exception as e:
         db.session.rollback()
@@ -146,24 +151,9 @@ def delete_deck(deck_id):
         return jsonify({"success": False, "error": "Unauthorized access"}), 403
     
     try:
-        # Create recursive CTE to find all sub-decks
-        cte = db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.parent_deck_id == deck_id
-        ).cte(name='sub_decks', recursive=True)
-
-        cte = cte.union_all(
-            db.session.query(
-                FlashcardDecks.flashcard_deck_id.label('id')
-            ).filter(
-                FlashcardDecks.parent_deck_id == cte.c.id
-            )
-        )
-
-        # Get all deck IDs including the parent
+        # Get all deck IDs including the parent from the closure table
         all_deck_ids = [deck_id]  # Include the parent deck ID
-        all_deck_ids.extend([row[0] for row in db.session.query(cte.c.id).all()])
+        all_deck_ids.extend([row[0] for row in DeckClosure.subtree_ids(deck_id, include_self=False).all()])
         
         # Count sub-decks (excluding parent)
         sub_decks_count = len(all_deck_ids) - 1
@@ -180,6 +170,7 @@ def delete_deck(deck_id):
         # Delete the deck (cascade will handle children)
         db.session.delete(deck)
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
 
         return jsonify({
             "success": True, 
@@ -227,6 +218,11 @@ def batch_delete_flashcards(deck_ids, batch_size=500):
         # Update total count and log progress
         total_deleted += batch_count
         print(f"Deleted batch of {batch_count} flashcards, total: {total_deleted}")
+    
+    # Bulk deletes skip the ORM counter hooks, so resync the affected decks
+    if total_deleted:
+        FlashcardDecks.refresh_card_counters(deck_ids)
+        db.session.commit()
 
 @deck_management_bp.route("/create_empty", methods=["POST"])
 @login_required
@@ -259,6 +255,7 @@ def create_empty_deck():
             
         db.session.add(deck)
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         return jsonify({
             "success": True,
@@ -306,6 +303,7 @@ def move_deck(deck_id):
         # Update the parent ID
         deck.parent_deck_id = new_parent_id
         db.session.commit()
+        DeckTreeCache.invalidate(current_user.id)
         
         return jsonify({
             "success": True, 
@@ -315,3 +313,15 @@ def move_deck(deck_id):
         db.session.rollback()
         print(f"Error moving deck: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
+
+@deck_management_bp.route("/<int:deck_id>/duplicates", methods=["GET"])
+@login_required
+def deck_duplicates(deck_id):
+    """Report groups of near-duplicate flashcards in a deck and its sub-decks"""
+    deck = FlashcardDecks.query.get_or_404(deck_id)
+    
+    if deck.user_id != current_user.id and not deck.is_public:
+        return jsonify({"success": False, "error": "Unauthorized access"}), 403
+    
+    report = find_duplicate_groups(deck_id)
+    return jsonify({"success": True, **report})
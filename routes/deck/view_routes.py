@@ -1,7 +1,8 @@
 from flask import Blueprint, request, render_template, jsonify, g, abort, current_app, redirect, url_for
 from models import db, FlashcardDecks, Flashcards
-from services.fsrs_scheduler import get_current_time, get_due_cards
+from services.fsrs_scheduler import get_current_time, get_due_cards, get_due_cards_page
 from utils import count_due_flashcards, create_pagination_metadata, batch_count_due_cards
+from services.deck_tree_service import DeckTreeCache
 from flask_login import login_required, current_user
 from sqlalchemy.orm import joinedload, contains_eager, defer, load_only
 from sqlalchemy import func, desc, asc, case
@@ -12,7 +13,7 @@ deck_view_bp = Blueprint('deck_view', __name__)
 def load_all_decks():
     """Load all decks for the current user for use in templates"""
     if current_user.is_authenticated:
-        g.all_decks = FlashcardDecks.query.filter_by(user_id=current_user.id).all()
+        g.all_decks = DeckTreeCache.get(current_user.id).all_decks
     else:
         g.all_decks = []
 
@@ -22,7 +23,6 @@ def get_deck_flashcards(deck_id):
     """View all flashcards in a deck with pagination"""
     # Get the deck with its sub-decks using eager loading
     deck = FlashcardDecks.query.options(
-        joinedload(FlashcardDecks.parent_deck),
         joinedload(FlashcardDecks.child_decks)
     ).get_or_404(deck_id)
     
@@ -31,11 +31,7 @@ def get_deck_flashcards(deck_id):
         abort(403)  # Unauthorized
     
     # Get parent decks for breadcrumb trail
-    parent_decks = []
-    current_parent = deck.parent_deck
-    while current_parent is not None:
-        parent_decks.insert(0, current_parent)
-        current_parent = current_parent.parent_deck
+    parent_decks = DeckTreeCache.get(current_user.id).breadcrumbs(deck_id)
     
     # Get sort parameter for child decks
     sort_by = request.args.get('sort', 'name')
@@ -154,42 +150,20 @@ def study_deck(deck_id):
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 45, type=int)
         
-        # Create recursive CTE to find all decks including this one and its sub-decks
-        cte = db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.flashcard_deck_id == deck_id
-        ).cte(name='ajax_deck_hierarchy', recursive=True)
-
-        cte = cte.union_all(
-            db.session.query(
-                FlashcardDecks.flashcard_deck_id.label('id')
-            ).filter(
-                FlashcardDecks.parent_deck_id == cte.c.id
-            )
-        )
-        
-        # Calculate total cards for this request
-        total_cards_query = db.session.query(db.func.count(Flashcards.flashcard_id))
-        total_cards_query = total_cards_query.filter(
-            Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
-        )
+        # Total cards across the deck and its sub-decks
+        total_cards = study_total(deck, due_only)
         
-        # Apply due_only filter if needed
-        if due_only:
-            current_time = get_current_time()
-            total_cards_query = total_cards_query.filter(
-                db.or_(Flashcards.due_date <= current_time, Flashcards.due_date == None),
-                Flashcards.state != 2  # Exclude cards already mastered
-            )
-        
-        # Get the actual total count of cards
-        total_cards = total_cards_query.scalar() or 0
-        
-        # Get all cards for this batch - important fix:
-        # Instead of getting all cards and then slicing, we should directly 
-        # apply pagination in the database query for better performance
-        all_cards = get_due_cards(deck_id, due_only, per_page=per_page, page=page)
+        # Get this batch with a keyset cursor; clients that only send a page
+        # number are walked forward from the first page
+        cursor = request.args.get('cursor')
+        try:
+            if cursor or page == 1:
+                all_cards, next_cursor = get_due_cards_page(deck_id, due_only, per_page=per_page, cursor=cursor)
+            else:
+                all_cards = get_due_cards(deck_id, due_only, per_page=per_page, page=page)
+                next_cursor = None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Log debugging information
         current_app.logger.debug(f"Study batch request: deck={deck_id}, page={page}, per_page={per_page}, returned={len(all_cards)}")
@@ -199,6 +173,7 @@ def study_deck(deck_id):
         
         # Transform to JSON response format
         flashcard_data = []
+        deck_tree = DeckTreeCache.get(current_user.id)
         
         for card in all_cards:
             # Set default deck info
@@ -206,7 +181,7 @@ def study_deck(deck_id):
             
             # If card is from a subdeck, include subdeck info
             if card.flashcard_deck_id != deck_id:
-                subdeck = FlashcardDecks.query.filter_by(flashcard_deck_id=card.flashcard_deck_id).first()
+                subdeck = deck_tree.get(card.flashcard_deck_id)
                 if subdeck:
                     deck_info = {
                         'deck_id': subdeck.flashcard_deck_id,
@@ -231,6 +206,7 @@ def study_deck(deck_id):
             'batch_size': len(flashcard_data),
             'current_page': page,
             'total_pages': total_pages,
+            'next_cursor': next_cursor,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -238,33 +214,8 @@ def study_deck(deck_id):
             }
         })
     
-    # Normal page load - calculate the count of cards for rendering the template
-    # Create recursive CTE to find all decks including this one and its sub-decks
-    cte = db.session.query(
-        FlashcardDecks.flashcard_deck_id.label('id')
-    ).filter(
-        FlashcardDecks.flashcard_deck_id == deck_id
-    ).cte(name='study_deck_hierarchy', recursive=True)
-
-    cte = cte.union_all(
-        db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.parent_deck_id == cte.c.id
-        )
-    )
-    
-    # Build a query that includes all cards in this deck and its subdecks
-    if due_only:
-        flashcards_count = db.session.query(db.func.count(Flashcards.flashcard_id)).filter(
-            Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id)),
-            db.or_(Flashcards.due_date <= get_current_time(), Flashcards.due_date == None),
-            Flashcards.state != 2  # Exclude cards already mastered
-        ).scalar()
-    else:
-        flashcards_count = db.session.query(db.func.count(Flashcards.flashcard_id)).filter(
-            Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
-        ).scalar()
+    # Normal page load - count of cards for rendering the template
+    flashcards_count = study_total(deck, due_only)
     
     return render_template(
         "flashcards.html", 
@@ -273,12 +224,23 @@ def study_deck(deck_id):
         due_only=due_only
     )
 
+def study_total(deck, due_only):
+    """
+    Number of cards in a study session for a deck and its sub-decks
+    
+    Uses the rolled-up card counter, or the user's cached due counts (which,
+    like the study queue, exclude mastered cards) when studying due cards only.
+    """
+    if due_only:
+        return batch_count_due_cards([deck.flashcard_deck_id], deck.user_id).get(deck.flashcard_deck_id, 0)
+    return deck.total_card_count or 0
+
 @deck_view_bp.route("/random-deck")
 @login_required
 def random_deck():
     """Select a random deck to study, prioritizing decks with due cards"""
     # Get all decks for the current user
-    user_decks = FlashcardDecks.query.filter_by(user_id=current_user.id).all()
+    user_decks = g.all_decks
     
     if not user_decks:
         # User has no decks
@@ -4,12 +4,17 @@ from services.fsrs_scheduler import process_review, get_current_time
 from flask_login import current_user, login_required
 import traceback
 import os
+from datetime import datetime, timezone
 from config import Config
 from google import genai
+from services import llm_service
 
 # Update blueprint name to be more specific since it's now part of flashcard package
 flashcard_bp = Blueprint('flashcard', __name__)
 
+# Upper bound on reviews accepted by one batch submission
+MAX_REVIEW_BATCH = 200
+
 @flashcard_bp.route("/deck/<int:deck_id>/view")
 def view_flashcards(deck_id):
     """View all flashcards in a deck"""
@@ -46,7 +51,10 @@ def update_progress():
                     print(f"Error initializing FSRS state: {e}")
             
             # Process the review with FSRS
-            next_due, retrievability = process_review(flashcard, is_correct)
+            next_due, retrievability = process_review(
+                flashcard, is_correct,
+                user_id=current_user.id if current_user.is_authenticated else None
+            )
             print(f"FSRS updated: next_due={next_due.isoformat()}, retrievability={retrievability}")
         except Exception as e:
             print(f"Error in FSRS processing: {e}")
@@ -75,6 +83,122 @@ def update_progress():
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
+@flashcard_bp.route("/update_progress/batch", methods=["POST"])
+@login_required
+def update_progress_batch():
+    """
+    Apply a batch of buffered study answers in one transaction
+    
+    Expects {"reviews": [{"flashcard_id", "is_correct", "answered_at"}, ...]}
+    where answered_at is an ISO timestamp from the client. Reviews are applied
+    in answer order and the per-card outcome is returned in the same order.
+    """
+    data = request.get_json(silent=True) or {}
+    reviews = data.get('reviews')
+    
+    if not isinstance(reviews, list) or not reviews:
+        return jsonify({"success": False, "error": "No reviews provided"}), 400
+    if len(reviews) > MAX_REVIEW_BATCH:
+        return jsonify({"success": False, "error": f"At most {MAX_REVIEW_BATCH} reviews per batch"}), 400
+    
+    try:
+        now = get_current_time()
+        events = []
+        for position, review in enumerate(reviews):
+            if not isinstance(review, dict) or 'flashcard_id' not in review or 'is_correct' not in review:
+                return jsonify({"success": False, "error": f"Invalid review at position {position}"}), 400
+            
+            try:
+                flashcard_id = int(review['flashcard_id'])
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "error": f"Invalid flashcard_id at position {position}"}), 400
+            
+            # bool("false") is True, so only JSON booleans are accepted
+            if not isinstance(review['is_correct'], bool):
+                return jsonify({"success": False, "error": f"Invalid is_correct at position {position}"}), 400
+            
+            events.append({
+                'position': position,
+                'flashcard_id': flashcard_id,
+                'is_correct': review['is_correct'],
+                'answered_at': parse_answered_at(review.get('answered_at'), now)
+            })
+        
+        # Load every card in one query, limited to the user's own decks
+        card_ids = {event['flashcard_id'] for event in events}
+        cards = {
+            card.flashcard_id: card
+            for card in Flashcards.query.join(FlashcardDecks).filter(
+                Flashcards.flashcard_id.in_(card_ids),
+                FlashcardDecks.user_id == current_user.id
+            ).all()
+        }
+        
+        results = [None] * len(events)
+        
+        # Apply in answer order; ties keep submission order
+        for event in sorted(events, key=lambda e: (e['answered_at'], e['position'])):
+            flashcard = cards.get(event['flashcard_id'])
+            if flashcard is None:
+                results[event['position']] = {
+                    "flashcard_id": event['flashcard_id'],
+                    "success": False,
+                    "error": "Flashcard not found"
+                }
+                continue
+            
+            # FSRS can't go back in time past the card's last review
+            review_time = event['answered_at']
+            if flashcard.last_reviewed is not None:
+                last_reviewed = flashcard.last_reviewed
+                if last_reviewed.tzinfo is None:
+                    last_reviewed = last_reviewed.replace(tzinfo=timezone.utc)
+                review_time = max(review_time, last_reviewed)
+            
+            if not flashcard.fsrs_state:
+                flashcard.init_fsrs_state()
+            
+            process_review(flashcard, event['is_correct'], review_time=review_time, commit=False,
+                           user_id=current_user.id)
+            
+            results[event['position']] = {
+                "flashcard_id": flashcard.flashcard_id,
+                "success": True,
+                "is_correct": event['is_correct'],
+                "last_reviewed": flashcard.last_reviewed.isoformat() if flashcard.last_reviewed else None,
+                "next_due": flashcard.due_date.isoformat() if flashcard.due_date else None,
+                "retrievability": flashcard.retrievability or 0.0,
+                "state": flashcard.get_state_name()
+            }
+        
+        # One transaction for the whole batch
+        db.session.commit()
+        
+        return jsonify({
+            "success": True,
+            "processed": sum(1 for result in results if result["success"]),
+            "results": results
+        })
+    except Exception as e:
+        print(f"Error in update_progress_batch: {e}")
+        print(traceback.format_exc())
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def parse_answered_at(value, now):
+    """Parse a client answer timestamp as UTC, falling back to (and capped at) now"""
+    if not value:
+        return now
+    
+    try:
+        answered_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return now
+    
+    if answered_at.tzinfo is None:
+        answered_at = answered_at.replace(tzinfo=timezone.utc)
+    return min(answered_at.astimezone(timezone.utc), now)
+
 @flashcard_bp.route("/create", methods=["POST"])
 @login_required
 def create_flashcard():
@@ -258,10 +382,12 @@ def generate_flashcard_explanation(flashcard):
         }
         
         # Generate the explanation
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model=Config.GEMINI_MODEL,
             contents=prompt,
-            config=explanation_config
+            config=explanation_config,
+            cache_site='card_explanation'
         )
         
         # Return the explanation text
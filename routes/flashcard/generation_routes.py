@@ -8,7 +8,9 @@ import re
 import os
 import traceback
 from services.fsrs_scheduler import get_current_time
+from services.duplicate_service import filter_duplicates
 from config import Config
+from services import llm_service
 
 generation_bp = Blueprint('generation', __name__)
 
@@ -46,10 +48,12 @@ def generate():
 
     try:
         current_app.logger.info("Sending request to Gemini API...")
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model=Config.GEMINI_MODEL,
             contents=prompt_template,
-            config=Config.GEMINI_CONFIG
+            config=Config.GEMINI_CONFIG,
+            cache_site='deck_generation'
         )
         
         current_app.logger.debug(f"RAW GEMINI API RESPONSE: {response.text}")
@@ -80,10 +84,10 @@ def generate():
         if not flashcards_data:
             raise ValueError("No valid flashcards generated")
             
-        cards_added = 0
         # Set current time for all cards to use same timestamp
         current_time = get_current_time()
         
+        valid_cards = []
         for card in flashcards_data:
             # Convert to dict if it's a Pydantic model
             if hasattr(card, 'model_dump'):
@@ -97,29 +101,36 @@ def generate():
             if not question or not correct_answer:
                 current_app.logger.warning(f"Skipping incomplete card: {card}")
                 continue
-                
-            if not Flashcards.query.filter_by(
+            
+            valid_cards.append((question, correct_answer, incorrect_answers))
+        
+        # Drop near-duplicates of each other and of cards already in the deck hierarchy
+        new_cards, duplicates = filter_duplicates(
+            deck.flashcard_deck_id, valid_cards, fields=lambda card: card[:2]
+        )
+        if duplicates:
+            current_app.logger.info(f"Skipped {duplicates} near-duplicate generated cards")
+        
+        cards_added = 0
+        for question, correct_answer, incorrect_answers in new_cards:
+            # Pad with empty answers if needed
+            while len(incorrect_answers) < 3:
+                incorrect_answers.append(f"Incorrect answer {len(incorrect_answers) + 1}")
+            
+            flashcard = Flashcards(
+                question=question,
+                correct_answer=correct_answer,
+                incorrect_answers=incorrect_answers,
                 flashcard_deck_id=deck.flashcard_deck_id,
-                question=question
-            ).first():
-                # Pad with empty answers if needed
-                while len(incorrect_answers) < 3:
-                    incorrect_answers.append(f"Incorrect answer {len(incorrect_answers) + 1}")
-                
-                flashcard = Flashcards(
-                    question=question,
-                    correct_answer=correct_answer,
-                    incorrect_answers=incorrect_answers,
-                    flashcard_deck_id=deck.flashcard_deck_id,
-                    due_date=current_time,
-                    state=0
-                )
-                
-                # Initialize FSRS state
-                flashcard.init_fsrs_state()
-                
-                db.session.add(flashcard)
-                cards_added += 1
+                due_date=current_time,
+                state=0
+            )
+            
+            # Initialize FSRS state
+            flashcard.init_fsrs_state()
+            
+            db.session.add(flashcard)
+            cards_added += 1
         
         db.session.commit()
         current_app.logger.info(f"Successfully added {cards_added} flashcards to deck {deck.flashcard_deck_id}")
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, render_template, request, url_for, redirect
-from models import db, FlashcardDecks, Flashcards
-from services.fsrs_scheduler import get_stats, get_current_time
+from flask_login import current_user, login_required
+from models import db, FlashcardDecks, Flashcards, DeckClosure, DeckStatsDaily
+from services.fsrs_scheduler import get_cached_stats, get_current_time, rollup_deck_stats
 from datetime import datetime, timedelta
 from sqlalchemy import case
 import traceback
@@ -22,102 +23,67 @@ def view_deck_stats(deck_id, page=1):
 def deck_stats(deck_id):
     """Get spaced repetition stats for a deck as JSON"""
     deck = FlashcardDecks.query.get_or_404(deck_id)
-    stats = get_stats(deck_id)
-    return jsonify(stats)
+    
+    # Scoped to the deck owner so their reviews and edits invalidate it
+    return jsonify(get_cached_stats(deck_id, deck.user_id))
 
-@stats_bp.route("/deck/<int:deck_id>/retention")
-def deck_retention(deck_id):
-    """Get retention analytics for a deck"""
+# Longest history window served by the history endpoint, in days
+MAX_HISTORY_DAYS = 365
+
+@stats_bp.route("/deck/<int:deck_id>/history")
+@login_required
+def deck_stats_history(deck_id):
+    """Daily stats snapshots of a deck for trend charts"""
     deck = FlashcardDecks.query.get_or_404(deck_id)
     
-    # Query for cards with retrievability values AND review history
-    cards_with_retention = Flashcards.query.filter_by(flashcard_deck_id=deck_id)\
-        .filter(
-            Flashcards.retrievability > 0,
-            Flashcards.last_reviewed.isnot(None)  # Only include cards that have been reviewed
-        ).all()
-    
-    # Calculate retention statistics
-    retention_data = {
-        'total_cards_studied': len(cards_with_retention),
-        'has_retention_data': len(cards_with_retention) > 0,
-    }
+    if deck.user_id != current_user.id and not deck.is_public:
+        return jsonify({'error': 'Unauthorized access'}), 403
     
-    # Only include average retention if there are cards with review history
-    if cards_with_retention:
-        retention_data['average_retention'] = sum(c.retrievability for c in cards_with_retention) / len(cards_with_retention)
-        retention_data['retention_distribution'] = get_retention_distribution(cards_with_retention)
-    else:
-        retention_data['average_retention'] = None
-        retention_data['retention_distribution'] = {}
+    days = min(max(request.args.get('days', 30, type=int), 1), MAX_HISTORY_DAYS)
+    today = get_current_time().date()
     
-    return jsonify(retention_data)
+    try:
+        # Snapshot today on the owner's first view if the scheduled rollup
+        # hasn't yet; viewers of a public deck only read
+        if deck.user_id == current_user.id and not DeckStatsDaily.has_snapshot(deck.flashcard_deck_id, today):
+            rollup_deck_stats(deck_ids=[deck.flashcard_deck_id])
+        
+        return jsonify({
+            'deck_id': deck.flashcard_deck_id,
+            'days': days,
+            'series': [row.to_dict() for row in DeckStatsDaily.series(deck.flashcard_deck_id, days, today)]
+        })
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error getting deck stats history: {e}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
-def get_retention_distribution(cards):
-    """Calculate retention distribution in 10% buckets"""
-    distribution = {
-        '0-10%': 0,
-        '10-20%': 0,
-        '20-30%': 0,
-        '30-40%': 0,
-        '40-50%': 0,
-        '50-60%': 0,
-        '60-70%': 0,
-        '70-80%': 0,
-        '80-90%': 0,
-        '90-100%': 0
-    }
+@stats_bp.route("/deck/<int:deck_id>/retention")
+def deck_retention(deck_id):
+    """Get retention analytics for a deck and its sub-decks"""
+    deck = FlashcardDecks.query.get_or_404(deck_id)
     
-    for card in cards:
-        r = card.retrievability
-        if r < 0.1:
-            distribution['0-10%'] += 1
-        elif r < 0.2:
-            distribution['10-20%'] += 1
-        elif r < 0.3:
-            distribution['20-30%'] += 1
-        elif r < 0.4:
-            distribution['30-40%'] += 1
-        elif r < 0.5:
-            distribution['40-50%'] += 1
-        elif r < 0.6:
-            distribution['50-60%'] += 1
-        elif r < 0.7:
-            distribution['60-70%'] += 1
-        elif r < 0.8:
-            distribution['70-80%'] += 1
-        elif r < 0.9:
-            distribution['80-90%'] += 1
-        else:
-            distribution['90-100%'] += 1
+    # Histogram and mean come from the same cached aggregate as deck_stats
+    stats = get_cached_stats(deck_id, deck.user_id)
     
-    return distribution
+    return jsonify({
+        'total_cards_studied': stats['reviewed_count'],
+        'has_retention_data': stats['has_retention_data'],
+        'average_retention': stats['average_retention'],
+        'retention_distribution': stats['retention_distribution']
+    })
 
 @stats_bp.route("/deck/<int:deck_id>/upcoming-reviews")
 def get_upcoming_reviews(deck_id):
     """Get upcoming review cards data for a specific deck"""
     try:
-        # Create recursive CTE to find all decks including this one and its sub-decks
-        cte = db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.flashcard_deck_id == deck_id
-        ).cte(name='review_decks', recursive=True)
-
-        cte = cte.union_all(
-            db.session.query(
-                FlashcardDecks.flashcard_deck_id.label('id')
-            ).filter(
-                FlashcardDecks.parent_deck_id == cte.c.id
-            )
-        )
-        
         # Get current time in UTC
         current_time = get_current_time()
         
-        # Query for all cards
+        # Query for all cards in this deck and its sub-decks
         query = Flashcards.query.filter(
-            Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
+            Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(deck_id))
         )
         
         # Order the results by due date
@@ -5,10 +5,12 @@ from werkzeug.utils import secure_filename
 from flask_login import current_user, login_required
 
 from config import Config
-from utils import allowed_file, count_due_flashcards
+from utils import allowed_file, count_due_flashcards, batch_count_due_cards
 from models import db, FlashcardDecks, Flashcards, ImportFile, ImportChunk, ImportFlashcard
 from services.file_service import FileProcessor
 from services.storage_service import ProcessingState
+from services.deck_tree_service import DeckTreeCache
+from services.duplicate_service import filter_duplicates
 from services.chunk_service import process_file_chunk_batch, get_file_state, cleanup_all_flashcards
 from services.background_service import (
     start_processing, get_user_tasks, get_task, 
@@ -23,7 +25,7 @@ def load_all_decks():
     """Load all decks for the current user for use in templates"""
     if current_user.is_authenticated:
         # Load all decks with parent-child relationships
-        g.all_decks = FlashcardDecks.query.filter_by(user_id=current_user.id).all()
+        g.all_decks = DeckTreeCache.get(current_user.id).all_decks
     else:
         g.all_decks = []
 
@@ -55,23 +57,17 @@ def upload_file():
         if not deck:
             return jsonify({'error': 'Invalid deck ID'}), 403
 
-        # Create a safe filename and ensure upload directory exists
+        # Create a safe filename; its unique path keys the processing state
         filename = secure_filename(file.filename)
         unique_filename = f"{uuid.uuid4()}_{filename}"
         filepath = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
         
-        # Ensure upload directory exists
-        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-        
-        # Save file temporarily for processing
-        try:
-            file.save(filepath)
-        except Exception as e:
-            current_app.logger.error(f"File save error: {str(e)}")
-            return jsonify({'error': 'Failed to save file'}), 500
-        
-        # Initialize processing state in the database
-        file_key = ProcessingState.init_file_state(filepath)
+        # Stream the upload straight through text extraction and chunking
+        # into the database instead of saving and re-reading it whole;
+        # bytes seen before reuse their extracted chunks
+        file_hash = FileProcessor.hash_stream(file.stream)
+        content = FileProcessor.iter_stream(file.stream, filename)
+        file_key = ProcessingState.init_file_state(filepath, content, file_hash)
         
         # Update deck ID in the state
         import_file = ImportFile.query.filter_by(file_key=file_key).first()
@@ -82,12 +78,6 @@ def upload_file():
         # Clean up old processing states
         ProcessingState.cleanup_old_states()
         
-        # Delete the temporary file after processing
-        try:
-            os.remove(filepath)
-        except:
-            current_app.logger.warning(f"Failed to delete temporary file: {filepath}")
-        
         return jsonify({
             'success': True, 
             'file_key': file_key, 
@@ -265,6 +255,7 @@ def save_to_deck():
         from services.fsrs_scheduler import get_current_time
         current_time = get_current_time()
         
+        valid_cards = []
         for card in flashcards:
             # Extract and validate required fields
             question = card.get('q', '')
@@ -279,30 +270,38 @@ def save_to_deck():
             # Ensure incorrect_answers is a list and limit to 3 items
             if not isinstance(incorrect_answers, list):
                 incorrect_answers = [str(incorrect_answers)]
-            incorrect_answers = incorrect_answers[:3]
-            
-            # Pad with empty answers if needed
-            while len(incorrect_answers) < 3:
-                incorrect_answers.append(f"Incorrect answer {len(incorrect_answers) + 1}")
-            
-            # Create a new flashcard
-            new_card = Flashcards(
-                question=question,
-                correct_answer=correct_answer,
-                incorrect_answers=incorrect_answers,
-                flashcard_deck_id=int(deck_id),
-                due_date=current_time,
-                state=0
-            )
-            
-            # Initialize FSRS state for the new card
-            new_card.init_fsrs_state()
+            valid_cards.append((question, correct_answer, incorrect_answers[:3]))
+        
+        # Near-duplicates of cards already in the deck hierarchy (or of each other) are not saved again
+        new_cards, duplicates = filter_duplicates(int(deck_id), valid_cards, fields=lambda card: card[:2])
+        new_card_keys = {id(card) for card in new_cards}
+        
+        for card in valid_cards:
+            question, correct_answer, incorrect_answers = card
             
-            # Add to session
-            db.session.add(new_card)
-            cards_added += 1
+            if id(card) in new_card_keys:
+                # Pad with empty answers if needed
+                while len(incorrect_answers) < 3:
+                    incorrect_answers.append(f"Incorrect answer {len(incorrect_answers) + 1}")
+                
+                # Create a new flashcard
+                new_card = Flashcards(
+                    question=question,
+                    correct_answer=correct_answer,
+                    incorrect_answers=incorrect_answers,
+                    flashcard_deck_id=int(deck_id),
+                    due_date=current_time,
+                    state=0
+                )
+                
+                # Initialize FSRS state for the new card
+                new_card.init_fsrs_state()
+                
+                # Add to session
+                db.session.add(new_card)
+                cards_added += 1
             
-            # Mark as saved in the import flashcards table
+            # Mark as saved in the import flashcards table (duplicates are handled too)
             if import_file:
                 import_card = ImportFlashcard.query.filter_by(
                     file_id=import_file.id,
@@ -313,6 +312,9 @@ def save_to_deck():
                 if import_card:
                     import_card.is_saved = True
         
+        if duplicates:
+            current_app.logger.info(f"Skipped {duplicates} near-duplicate cards for deck {deck_id}")
+        
         # Commit all changes at once
         db.session.commit()
         current_app.logger.info(f"Added {cards_added} flashcards to deck {deck_id}")
@@ -331,6 +333,7 @@ def save_to_deck():
             'success': True,
             'message': f'Added {cards_added} flashcards to deck',
             'count': cards_added,
+            'duplicates_skipped': duplicates,
             'total_saved_cards': import_file.total_saved_cards if import_file else cards_added
         })
         
@@ -416,8 +419,6 @@ def start_background_import():
         
         # Start background processing
         task_id = start_processing(
-            current_app._get_current_object(),
-            current_app.gemini_client,
             file_key,
             import_file.filename,
             deck_id,
@@ -497,11 +498,9 @@ def imports_dashboard():
         }
         
         # Get a list of decks for the import modal with additional metadata
-        decks = []
-        root_decks = FlashcardDecks.query.filter_by(
-            user_id=current_user.id, 
-            parent_deck_id=None
-        ).all()
+        deck_tree = DeckTreeCache.get(current_user.id)
+        root_decks = deck_tree.roots
+        due_counts = batch_count_due_cards(list(deck_tree.nodes), current_user.id)
         
         # Recursively process decks to build hierarchy
         def process_deck_hierarchy(deck_list, depth=0, parent_path=''):
@@ -513,7 +512,7 @@ def imports_dashboard():
                     'depth': depth,
                     'path': (parent_path + ' > ' + deck.name) if parent_path else deck.name,
                     'card_count': deck.count_all_flashcards(),
-                    'due_count': count_due_flashcards(deck.flashcard_deck_id)
+                    'due_count': due_counts.get(deck.flashcard_deck_id, 0)
                 }
                 result.append(deck_info)
                 
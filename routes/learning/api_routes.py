@@ -8,6 +8,7 @@ import os
 from config import Config
 import traceback
 from datetime import datetime
+from services import llm_service
 
 api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
 
@@ -66,10 +67,12 @@ def api_generate_section_content(section_id):
             section_title=section.title
         )
         
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model=Config.GEMINI_MODEL,
             contents=prompt,
-            config=Config.LEARNING_GEMINI_CONFIG
+            config=Config.LEARNING_GEMINI_CONFIG,
+            cache_site='section_content'
         )
         
         # Make sure content is a string
@@ -210,10 +213,12 @@ def generate_answer_explanation(question_text, correct_answer, user_answer, is_c
     explanation_config = Config.LEARNING_GEMINI_CONFIG.copy()
     explanation_config["temperature"] = 0.1  # Lower temperature for more factual responses
     
-    response = client.models.generate_content(
+    response = llm_service.generate(
+        client,
         model=Config.GEMINI_MODEL,
         contents=prompt,
-        config=explanation_config
+        config=explanation_config,
+        cache_site='answer_explanation'
     )
     
     # Return the explanation text, cleaned up
@@ -289,10 +294,12 @@ def generate_section_content(section_id):
         section_title=section.title
     )
     
-    response = client.models.generate_content(
+    response = llm_service.generate(
+        client,
         model=Config.GEMINI_MODEL,
         contents=prompt,
-        config=Config.LEARNING_GEMINI_CONFIG
+        config=Config.LEARNING_GEMINI_CONFIG,
+        cache_site='section_content'
     )
     
     # Make sure content is a string
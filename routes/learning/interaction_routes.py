@@ -8,6 +8,7 @@ import os
 from config import Config
 import traceback
 from datetime import datetime
+from services import llm_service
 
 api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
 
@@ -55,10 +56,12 @@ def generate_section_questions(section_id, num_questions=2):
             num_questions=num_questions
         )
         
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model=Config.GEMINI_MODEL,
             contents=prompt,
-            config=Config.QUESTION_GEMINI_CONFIG
+            config=Config.QUESTION_GEMINI_CONFIG,
+            cache_site='section_questions'
         )
         
         # Parse the JSON response with improved error handling
@@ -132,10 +135,12 @@ def generate_section_content(section_id):
         section_title=section.title
     )
     
-    response = client.models.generate_content(
+    response = llm_service.generate(
+        client,
         model=Config.GEMINI_MODEL,
         contents=prompt,
-        config=Config.LEARNING_GEMINI_CONFIG
+        config=Config.LEARNING_GEMINI_CONFIG,
+        cache_site='section_content'
     )
     
     # Make sure content is a string
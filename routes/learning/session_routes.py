@@ -8,6 +8,7 @@ import os
 from config import Config
 import traceback
 from datetime import datetime
+from services import llm_service
 
 api_key = os.getenv("GOOGLE_GEMINI_API_KEY")
 
@@ -92,10 +93,12 @@ def process_outline(session_id):
             topic=learning_session.topic
         )
         
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model=Config.GEMINI_MODEL,
             contents=prompt,
-            config=Config.LEARNING_GEMINI_CONFIG
+            config=Config.LEARNING_GEMINI_CONFIG,
+            cache_site='session_outline'
         )
         
         # Parse the JSON response with improved error handling
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, g, request, url_for
 from models import db, FlashcardDecks, Flashcards
 from flask_login import current_user, login_required
 from utils import count_due_flashcards, batch_count_due_cards, create_pagination_metadata
+from services.deck_tree_service import DeckTreeCache
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func, desc, asc, case, text, literal_column
 
@@ -32,9 +33,8 @@ def index():
             user_id=current_user.id
         ).options(
             # Eagerly load child_decks to avoid N+1 query problem 
-            joinedload(FlashcardDecks.child_decks),
-            # Eagerly load counts that will be needed for display
-            joinedload(FlashcardDecks.flashcards)
+            # (card counts come from the deck's own counter columns)
+            joinedload(FlashcardDecks.child_decks)
         )
         
         # Apply sorting
@@ -44,68 +44,16 @@ def index():
             decks_query = decks_query.order_by(desc(FlashcardDecks.created_at))
         elif sort_by == 'created_asc':
             decks_query = decks_query.order_by(asc(FlashcardDecks.created_at))
-        elif sort_by == 'cards_desc' or sort_by == 'cards_asc':
-            # We need to get all decks first so we can count all cards including those in subdecks
-            all_decks = decks_query.all()
-            
-            # Calculate total card count for each deck (including subdecks)
-            deck_with_counts = [(deck, deck.count_all_flashcards()) for deck in all_decks]
-            
-            # Sort the list by card count
-            if sort_by == 'cards_desc':
-                deck_with_counts.sort(key=lambda x: x[1], reverse=True)
-            else:  # cards_asc
-                deck_with_counts.sort(key=lambda x: x[1])
-            
-            # Get the properly sorted decks
-            sorted_decks = [deck for deck, _ in deck_with_counts]
-            
-            # Apply pagination after sorting
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
-            decks = sorted_decks[start_idx:end_idx]
-            
-            # Create pagination metadata
-            pagination = create_pagination_metadata(
-                page, 
-                per_page, 
-                total_decks,
-                {key: value for key, value in request.args.items() if key not in ['page']}
-            )
-            
-            # Get all decks in a single efficient query for dropdown menus
-            all_decks = FlashcardDecks.query.filter_by(
-                user_id=current_user.id
-            ).options(
-                # Eager load relationships needed for templates
-                joinedload(FlashcardDecks.parent_deck),
-                joinedload(FlashcardDecks.child_decks)
-            ).all()
-            
-            # Make all decks available to templates
-            g.all_decks = all_decks
-            
-            # Get deck IDs for due count calculation
-            deck_ids = [deck.flashcard_deck_id for deck in decks]
-            
-            # Calculate due counts efficiently in a batch
-            due_counts = batch_count_due_cards(deck_ids, current_user.id)
-            
-            # Create an optimized due count function for templates
-            def optimized_count_due(deck_id):
-                return due_counts.get(deck_id, 0)
-            
-            return render_template(
-                'index.html', 
-                decks=decks, 
-                count_due_flashcards=optimized_count_due,
-                pagination=pagination
-            )
+        elif sort_by == 'cards_desc':
+            # Rolled-up counter covers cards in sub-decks too
+            decks_query = decks_query.order_by(desc(FlashcardDecks.total_card_count), FlashcardDecks.name)
+        elif sort_by == 'cards_asc':
+            decks_query = decks_query.order_by(asc(FlashcardDecks.total_card_count), FlashcardDecks.name)
         elif sort_by == 'due_desc':
             # We'll sort after fetching since due count requires recursive calculation
             pass
         
-        # If we didn't return early in the cards_desc/cards_asc case, apply pagination
+        # Apply pagination
         decks = decks_query.offset((page-1) * per_page).limit(per_page).all()
         
         # Special handling for due_desc sort (must happen after query)
@@ -125,17 +73,8 @@ def index():
             {key: value for key, value in request.args.items() if key not in ['page']}
         )
         
-        # Get all decks in a single efficient query for dropdown menus
-        all_decks = FlashcardDecks.query.filter_by(
-            user_id=current_user.id
-        ).options(
-            # Eager load relationships needed for templates
-            joinedload(FlashcardDecks.parent_deck),
-            joinedload(FlashcardDecks.child_decks)
-        ).all()
-        
-        # Make all decks available to templates
-        g.all_decks = all_decks
+        # Make all decks available to templates (cached tree, one query on a miss)
+        g.all_decks = DeckTreeCache.get(current_user.id).all_decks
         
         # Get deck IDs for due count calculation
         deck_ids = [deck.flashcard_deck_id for deck in decks]
@@ -1,7 +1,10 @@
-from flask import Blueprint, request, render_template, jsonify, g
-from models import db, FlashcardDecks, Flashcards
-from sqlalchemy import or_, and_, func, text, desc
+from flask import Blueprint, request, render_template, jsonify, g, url_for
 from utils import count_due_flashcards
+from flask_login import current_user
+from services.deck_tree_service import DeckTreeCache
+from services.search_service import search_decks, search_flashcards
+from services.suggest_service import suggest, SUGGEST_DEFAULT_LIMIT, SUGGEST_MAX_LIMIT
+from services.similarity_service import similar_cards, visible_card
 
 search_bp = Blueprint('search', __name__, url_prefix='/search')
 
@@ -11,10 +14,17 @@ def search():
     query = request.args.get('q', '').strip()
     page = int(request.args.get('page', 1))
     scope = request.args.get('scope', 'all')
+    mode = request.args.get('mode', 'text')
+    card_id = request.args.get('card_id', type=int)
     per_page = 20
     
-    # Get all decks for the study/stats modals
-    g.all_decks = FlashcardDecks.query.all()
+    # Get the user's decks for the study/stats modals
+    g.all_decks = DeckTreeCache.get(current_user.id).all_decks if current_user.is_authenticated else []
+    
+    # "Related cards" for a card show that card's question as the query
+    if mode == 'similar' and card_id is not None and not query:
+        source_card = visible_card(current_user.id if current_user.is_authenticated else None, card_id)
+        query = source_card.question if source_card else ''
     
     # Empty query shows search page with no results
     if not query:
@@ -27,24 +37,31 @@ def search():
                               page=page,
                               per_page=per_page,
                               scope=scope,
+                              mode=mode,
+                              card_id=None,
                               count_due_flashcards=count_due_flashcards,
                               min=min)
     
     # For AJAX requests, return JSON data
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return search_json(query, page, per_page, scope)
+        return search_json(query, page, per_page, scope, mode, card_id)
     
     # Regular request - perform search based on scope
+    user_id = current_user.id if current_user.is_authenticated else None
     deck_results = []
     card_results = []
     total_decks = 0
     total_cards = 0
     
-    if scope in ['all', 'decks']:
-        deck_results, total_decks = search_decks(query, page, per_page)
-    
-    if scope in ['all', 'cards']:
-        card_results, total_cards = search_flashcards(query, page, per_page)
+    if mode == 'similar':
+        # Similarity ranks the user's own cards only
+        card_results, total_cards = similar_cards(user_id, query, card_id, page, per_page)
+    else:
+        if scope in ['all', 'decks']:
+            deck_results, total_decks = search_decks(query, page, per_page, user_id)
+        
+        if scope in ['all', 'cards']:
+            card_results, total_cards = search_flashcards(query, page, per_page, user_id)
     
     return render_template('search_results.html',
                           query=query,
@@ -55,6 +72,8 @@ def search():
                           page=page,
                           per_page=per_page,
                           scope=scope,
+                          mode=mode,
+                          card_id=card_id,
                           count_due_flashcards=count_due_flashcards,
                           min=min)
 
@@ -65,11 +84,35 @@ def search_api():
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 20))
     search_type = request.args.get('type', 'all')  # 'all', 'decks', or 'cards'
+    mode = request.args.get('mode', 'text')  # 'text' or 'similar'
+    card_id = request.args.get('card_id', type=int)
     
-    return search_json(query, page, per_page, search_type)
+    return search_json(query, page, per_page, search_type, mode, card_id)
+
+@search_bp.route('/suggest', methods=['GET'])
+def search_suggest():
+    """Search-as-you-type suggestions from the user's deck names and card questions"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int), 1), SUGGEST_MAX_LIMIT)
+    
+    if not query or not current_user.is_authenticated:
+        return jsonify({'success': True, 'query': query, 'suggestions': []})
+    
+    suggestions = suggest(current_user.id, query, limit)
+    for item in suggestions:
+        item['url'] = url_for('deck.deck_view.get_deck_flashcards', deck_id=item['deck_id'])
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'suggestions': suggestions
+    })
 
-def search_json(query, page=1, per_page=20, search_type='all'):
+def search_json(query, page=1, per_page=20, search_type='all', mode='text', card_id=None):
     """Return search results as JSON"""
+    if mode == 'similar':
+        return similar_json(query, page, per_page, card_id)
+    
     if not query:
         return jsonify({
             'success': False,
@@ -77,10 +120,11 @@ def search_json(query, page=1, per_page=20, search_type='all'):
             'results': {}
         })
     
+    user_id = current_user.id if current_user.is_authenticated else None
     results = {}
     
     if search_type in ['all', 'decks']:
-        deck_results, total_decks = search_decks(query, page, per_page)
+        deck_results, total_decks = search_decks(query, page, per_page, user_id)
         results['decks'] = {
             'results': [deck.to_dict() for deck in deck_results],
             'total': total_decks,
@@ -89,7 +133,7 @@ def search_json(query, page=1, per_page=20, search_type='all'):
         }
     
     if search_type in ['all', 'cards']:
-        card_results, total_cards = search_flashcards(query, page, per_page)
+        card_results, total_cards = search_flashcards(query, page, per_page, user_id)
         results['cards'] = {
             'results': [card.to_search_dict() for card in card_results],
             'total': total_cards,
@@ -103,148 +147,29 @@ def search_json(query, page=1, per_page=20, search_type='all'):
         'results': results
     })
 
-def search_decks(query, page=1, per_page=20):
-    """Search deck names and descriptions with improved fuzzy matching"""
-    # Split the query into individual terms for fuzzy matching
-    search_terms = query.lower().split()
-    
-    if not search_terms:
-        return [], 0
-    
-    # Base query to search decks
-    deck_query = FlashcardDecks.query
-    
-    # Create conditions for each term - if ANY term matches, include the deck
-    term_conditions = []
-    for term in search_terms:
-        search_pattern = f'%{term}%'
-        term_conditions.append(
-            or_(
-                FlashcardDecks.name.ilike(search_pattern),
-                FlashcardDecks.description.ilike(search_pattern)
-            )
-        )
-    
-    # Apply the conditions - match if ANY term is found
-    deck_query = deck_query.filter(or_(*term_conditions))
-    
-    # Get total count
-    total_decks = deck_query.count()
-    
-    # Calculate relevance score for sorting
-    # 1. Exact match with name gets highest priority
-    # 2. Starting of name gets second priority
-    # 3. Count how many terms match in name and description
-    decks_with_scores = []
-    for deck in deck_query.all():
-        score = 0
-        deck_name_lower = deck.name.lower()
-        deck_desc_lower = deck.description.lower() if deck.description else ""
-        
-        # Exact match gets highest score
-        if deck_name_lower == query.lower():
-            score += 100
-        
-        # Name starts with query term gets high score
-        for term in search_terms:
-            if deck_name_lower.startswith(term):
-                score += 50
-        
-        # Count matches in name
-        for term in search_terms:
-            if term in deck_name_lower:
-                score += 10
-        
-        # Count matches in description
-        for term in search_terms:
-            if term in deck_desc_lower:
-                score += 5
-        
-        decks_with_scores.append((deck, score))
-    
-    # Sort by score and paginate manually
-    decks_with_scores.sort(key=lambda x: x[1], reverse=True)
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    paginated_decks = [deck for deck, score in decks_with_scores[start_idx:end_idx]]
-    
-    return paginated_decks, total_decks
-
-def search_flashcards(query, page=1, per_page=20):
-    """Search flashcard questions and answers with improved fuzzy matching"""
-    # Split the query into individual terms for fuzzy matching
-    search_terms = query.lower().split()
-    
-    if not search_terms:
-        return [], 0
-    
-    # Base query to search flashcards
-    card_query = db.session.query(
-        Flashcards, FlashcardDecks
-    ).join(
-        FlashcardDecks, 
-        Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
-    )
-    
-    # Create conditions for each term - if ANY term matches, include the flashcard
-    term_conditions = []
-    for term in search_terms:
-        search_pattern = f'%{term}%'
-        term_conditions.append(
-            or_(
-                Flashcards.question.ilike(search_pattern),
-                Flashcards.correct_answer.ilike(search_pattern),
-                # Also search incorrect answers if they're stored as strings
-                func.cast(Flashcards.incorrect_answers, db.String).ilike(search_pattern)
-            )
-        )
-    
-    # Apply the conditions - match if ANY term is found
-    card_query = card_query.filter(or_(*term_conditions))
-    
-    # Get total count
-    total_cards = card_query.count()
-    
-    # Calculate relevance score for sorting
-    cards_with_scores = []
-    for card, deck in card_query.all():
-        score = 0
-        question_lower = card.question.lower()
-        answer_lower = card.correct_answer.lower()
-        
-        # Question contains exact query gets highest score
-        if query.lower() in question_lower:
-            score += 50
-        
-        # Count matches in question
-        for term in search_terms:
-            if term in question_lower:
-                score += 10
-        
-        # Count matches in answer
-        for term in search_terms:
-            if term in answer_lower:
-                score += 5
-        
-        # Additional points for match in incorrect answers
-        if hasattr(card, 'incorrect_answers') and card.incorrect_answers:
-            incorrect_text = ' '.join(str(ans).lower() for ans in card.incorrect_answers)
-            for term in search_terms:
-                if term in incorrect_text:
-                    score += 3
-        
-        cards_with_scores.append((card, deck, score))
-    
-    # Sort by score and paginate manually
-    cards_with_scores.sort(key=lambda x: x[2], reverse=True)
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
+def similar_json(query, page=1, per_page=20, card_id=None):
+    """Return the user's cards most similar to a card or to the query text as JSON"""
+    if not query and card_id is None:
+        return jsonify({
+            'success': False,
+            'message': 'No search query or card provided',
+            'results': {}
+        })
     
-    # Process results to add deck information
-    processed_results = []
-    for card, deck, _ in cards_with_scores[start_idx:end_idx]:
-        # Add deck reference to card
-        card.deck = deck
-        processed_results.append(card)
+    user_id = current_user.id if current_user.is_authenticated else None
+    card_results, total_cards = similar_cards(user_id, query, card_id, page, per_page)
     
-    return processed_results, total_cards
+    return jsonify({
+        'success': True,
+        'query': query,
+        'mode': 'similar',
+        'card_id': card_id,
+        'results': {
+            'cards': {
+                'results': [dict(card.to_search_dict(), similarity=card.similarity) for card in card_results],
+                'total': total_cards,
+                'page': page,
+                'per_page': per_page
+            }
+        }
+    })
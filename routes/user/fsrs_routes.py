@@ -0,0 +1,37 @@
+from flask import jsonify, current_app
+from flask_login import current_user, login_required
+from routes.user import user_bp
+from services.fsrs_optimizer import start_optimization, is_optimizing
+from services.fsrs_scheduler import get_user_scheduler
+
+@user_bp.route('/api/fsrs', methods=['GET'])
+@login_required
+def fsrs_parameters():
+    """FSRS parameters in use for the current user and the state of their last fit"""
+    return jsonify({
+        'success': True,
+        'personalized': bool(current_user.fsrs_parameters),
+        'parameters': list(get_user_scheduler(current_user.id).parameters),
+        'optimized_at': current_user.fsrs_optimized_at.isoformat() if current_user.fsrs_optimized_at else None,
+        'optimized_reviews': current_user.fsrs_optimized_reviews,
+        'optimizing': is_optimizing(current_user.id)
+    })
+
+@user_bp.route('/api/fsrs/optimize', methods=['POST'])
+@login_required
+def optimize_fsrs_parameters():
+    """Start fitting the current user's FSRS parameters in the background"""
+    try:
+        status = start_optimization(current_app._get_current_object(), current_user.id)
+    except Exception as e:
+        current_app.logger.error(f"Error starting FSRS optimization: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    if status == 'insufficient_data':
+        return jsonify({
+            'success': False,
+            'status': status,
+            'message': 'Not enough review history to personalize scheduling yet'
+        }), 409
+    
+    return jsonify({'success': True, 'status': status}), 202
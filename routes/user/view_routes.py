@@ -1,6 +1,7 @@
 from flask import render_template, abort, redirect, url_for, flash, g
 from models import User, FlashcardDecks, Flashcards
 from flask_login import current_user, login_required
+from services.deck_tree_service import DeckTreeCache
 from routes.user import user_bp
 from sqlalchemy import func, and_
 
@@ -39,7 +40,7 @@ def profile(username):
     
     # Add all decks to g for modals
     if current_user.is_authenticated:
-        g.all_decks = FlashcardDecks.query.filter_by(user_id=current_user.id).all()
+        g.all_decks = DeckTreeCache.get(current_user.id).all_decks
     
     # Render the profile template
     return render_template(
@@ -4,7 +4,7 @@ import uuid
 from datetime import datetime
 from flask import current_app
 
-from models import db, ImportTask
+from models import db, ImportTask, ImportFile
 
 class TaskStatus:
     PENDING = 'pending'
@@ -12,7 +12,8 @@ class TaskStatus:
     COMPLETED = 'completed'
     FAILED = 'failed'
 
-# Thread lock for preventing race conditions
+# Serializes task writes within this process only; import job state shared
+# between processes is changed with conditional SQL (services.job_service)
 task_lock = threading.Lock()
 
 def get_user_tasks(user_id):
@@ -97,64 +98,15 @@ def cleanup_old_tasks(age_hours=24):
         
         return len(old_tasks)
 
-def process_chunk(task_id, app, gemini_client, file_key, chunk_index):
-    """Process a single chunk in the background"""
-    from services.chunk_service import process_file_chunk_batch
+def start_processing(file_key, filename, deck_id, deck_name, user_id):
+    """
+    Queue background processing of a file
+    
+    Each chunk becomes a job in the durable queue (services.job_service),
+    processed by the web process's embedded worker or by `cli.py worker`.
+    """
+    from services.job_service import enqueue_import_jobs, settle_task, wake_import_worker
     
-    # Create an application context for this thread
-    with app.app_context():
-        try:
-            # Update task status to running
-            update_task(task_id, status=TaskStatus.RUNNING)
-            
-            # Process the chunk
-            result = process_file_chunk_batch(gemini_client, file_key, chunk_index)
-            
-            if 'error' in result:
-                update_task(
-                    task_id, 
-                    error=result['error'],
-                    status=TaskStatus.FAILED
-                )
-                return
-            
-            # Update progress
-            progress = int((result['chunk_index'] + 1) / result['total_chunks'] * 100)
-            update_task(
-                task_id,
-                progress=progress,
-                current_chunk=result['chunk_index'] + 1,
-                total_chunks=result['total_chunks'],
-                saved_cards=result.get('total_saved_cards', 0)
-            )
-            
-            # If not complete, process the next chunk
-            if not result.get('is_complete'):
-                # Schedule the next chunk
-                next_chunk = result['chunk_index'] + 1
-                thread = threading.Thread(
-                    target=process_chunk,
-                    args=(task_id, app, gemini_client, file_key, next_chunk)
-                )
-                thread.daemon = True
-                thread.start()
-            else:
-                # Update as completed
-                update_task(
-                    task_id,
-                    status=TaskStatus.COMPLETED,
-                    progress=100
-                )
-        except Exception as e:
-            app.logger.error(f"Background task error: {str(e)}")
-            update_task(
-                task_id,
-                status=TaskStatus.FAILED,
-                error=str(e)
-            )
-
-def start_processing(app, gemini_client, file_key, filename, deck_id, deck_name, user_id):
-    """Start background processing of a file"""
     # Register a new task in the database
     task_id = register_task(
         file_key=file_key,
@@ -164,12 +116,35 @@ def start_processing(app, gemini_client, file_key, filename, deck_id, deck_name,
         user_id=user_id
     )
     
-    # Start processing the first chunk
-    thread = threading.Thread(
-        target=process_chunk,
-        args=(task_id, app, gemini_client, file_key, 0)
-    )
-    thread.daemon = True
-    thread.start()
+    import_file = ImportFile.query.filter_by(file_key=file_key).first()
+    if not import_file:
+        update_task(task_id, status=TaskStatus.FAILED, error='Import file not found')
+        return task_id
+    
+    update_task(task_id, status=TaskStatus.RUNNING, total_chunks=import_file.total_chunks)
+    if enqueue_import_jobs(task_id, file_key, import_file.total_chunks):
+        wake_import_worker()
+    else:
+        settle_task(task_id)
     
     return task_id
+
+def start_stats_rollup(app, interval):
+    """Run the deck_stats_daily rollup every ``interval`` seconds in a daemon thread"""
+    from services.fsrs_scheduler import rollup_deck_stats
+    
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    written = rollup_deck_stats()
+                    app.logger.info(f"Deck stats rollup wrote {written} snapshots")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Deck stats rollup failed: {str(e)}")
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=run, name='deck-stats-rollup')
+    thread.daemon = True
+    thread.start()
+    return thread
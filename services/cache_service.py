@@ -0,0 +1,276 @@
+"""
+Cache service for Memoria application.
+Provides an in-process LRU cache with an optional shared SQLite backend,
+attached to the Flask app as ``app.cache``.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from flask import current_app, request
+from flask_login import current_user
+
+logger = logging.getLogger("cache_service")
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe in-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value; timeout=0 keeps it until evicted"""
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Cache shared between worker processes through a local SQLite file"""
+
+    def __init__(self, path, default_timeout=300):
+        self.path = path
+        self.default_timeout = default_timeout
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return default
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return default
+
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        """Store a value; timeout=0 keeps it until deleted"""
+        timeout = self.default_timeout if timeout is None else timeout
+        expires_at = time.time() + timeout if timeout else None
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value), expires_at)
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_entries")
+
+    def purge_expired(self):
+        """Drop expired rows, returning how many were removed"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+            return cursor.rowcount
+
+
+class CacheService:
+    """
+    Two-level cache with namespaced, per-user keys
+
+    Values live in the local LRU and, when configured, in a shared backend so
+    other workers can reuse them. Every user-scoped key embeds the user's cache
+    version; invalidating a user bumps that version (in the shared backend when
+    present), which orphans all of their entries in every worker at once.
+    """
+
+    def __init__(self, local, shared=None, key_prefix='memoria'):
+        self.local = local
+        self.shared = shared
+        self.key_prefix = key_prefix
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _user_version(self, user_id):
+        if self.shared is not None:
+            return self.shared.get(f"{self.key_prefix}:version:{user_id}", 0)
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def make_key(self, namespace, name, user_id=None):
+        """Build a namespaced key, scoped to the user's current cache version"""
+        if user_id is None:
+            return f"{self.key_prefix}:{namespace}:{name}"
+        return f"{self.key_prefix}:{namespace}:u{user_id}.v{self._user_version(user_id)}:{name}"
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING and self.shared is not None:
+            value = self.shared.get(key, _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+
+        if value is _MISSING:
+            self._count('misses')
+            return default
+
+        self._count('hits')
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.local.set(key, value, timeout)
+        if self.shared is not None:
+            self.shared.set(key, value, timeout)
+        self._count('sets')
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def get_or_set(self, namespace, name, factory, user_id=None, timeout=None):
+        """Return the cached value for a key, computing and storing it on a miss"""
+        key = self.make_key(namespace, name, user_id)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            if value is not None:
+                self.set(key, value, timeout)
+        return value
+
+    def invalidate_user(self, user_id):
+        """Drop every cached entry scoped to a user"""
+        if user_id is None:
+            return
+
+        if self.shared is not None:
+            version_key = f"{self.key_prefix}:version:{user_id}"
+            self.shared.set(version_key, self.shared.get(version_key, 0) + 1, timeout=0)
+        else:
+            with self._lock:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self._count('invalidations')
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_stats(self):
+        """Hit/miss counters for this worker"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['local_entries'] = len(self.local)
+        stats['backend'] = 'sqlite' if self.shared is not None else 'local'
+        return stats
+
+
+def init_cache(app):
+    """Create the cache configured for the app and attach it as app.cache"""
+    local = LocalCache(
+        max_entries=app.config.get('CACHE_MAX_ENTRIES', 1024),
+        default_timeout=app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    )
+
+    shared = None
+    if app.config.get('CACHE_BACKEND', 'local') == 'sqlite':
+        try:
+            shared = SQLiteCache(
+                app.config['CACHE_SQLITE_PATH'],
+                default_timeout=app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+            )
+        except Exception as e:
+            logger.error(f"Shared cache unavailable, using local cache only: {e}")
+
+    app.cache = CacheService(local, shared)
+    return app.cache
+
+
+def get_cache():
+    """Return the app cache, or None when caching is disabled"""
+    if not current_app.config.get('ENABLE_CACHING', False):
+        return None
+    return getattr(current_app, 'cache', None)
+
+
+def invalidate_user_cache(user_id):
+    """Invalidate cached data for a user after their decks or cards change"""
+    cache = get_cache()
+    if cache is not None:
+        try:
+            cache.invalidate_user(user_id)
+        except Exception as e:
+            logger.error(f"Error invalidating cache for user {user_id}: {e}")
+
+
+def invalidate_after_mutation(response):
+    """after_request hook: invalidate the current user's cache after a successful write"""
+    if (request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and current_user.is_authenticated):
+        invalidate_user_cache(current_user.id)
+    return response
@@ -2,12 +2,16 @@ import json
 import traceback
 import re
 from google.genai import types
-from models import FlashcardGenerator, db, Flashcards, ImportFile, ImportChunk, ImportFlashcard
+from datetime import datetime
+from sqlalchemy import update, case, func, select
+from models import FlashcardGenerator, db, Flashcards, ImportFile, ImportChunk, ImportFlashcard, ContentChunk
 from config import Config
 from utils import clean_flashcard_text
 from services.storage_service import ProcessingState
 from flask import current_app
 from services.fsrs_scheduler import get_current_time
+from services.duplicate_service import filter_duplicates
+from services import llm_service
 
 def process_file_chunk_batch(client, file_key, chunk_index):
     """Process a single chunk of a file in batch mode"""
@@ -50,81 +54,24 @@ def process_file_chunk_batch(client, file_key, chunk_index):
     if chunk_size < 50:
         current_app.logger.warning(f"Chunk {chunk_index} is too small ({chunk_size} chars), might not generate flashcards")
     
-    # Initialize generator for this chunk
-    generator = FlashcardGenerator(client)
-    
     try:
-        # Generate flashcards for this chunk using the multiple-choice format
-        prompt = Config.generate_prompt_template(f"the following content: {chunk_content}", 
-                                                batch_size=Config.DEFAULT_BATCH_SIZE)
-        
-        # Use the model from Config instead of hardcoding it
-        current_app.logger.info(f"Using model: {Config.GEMINI_MODEL}")
-        
-        response = client.models.generate_content(
-            model=Config.GEMINI_MODEL,
-            contents=types.Part.from_text(text=prompt),
-            config=Config.GEMINI_CONFIG
-        )
-        
-        # Log response details for debugging
-        current_app.logger.info(f"Received response from Gemini API for chunk {chunk_index}")
-        
-        chunk_flashcards = []
-        mc_data = []
-        
-        # Try to parse JSON response for multiple-choice format
-        try:
-            # Log the raw response for debugging
-            current_app.logger.debug(f"Raw response text: {response.text}")
-            
-            response_text = response.text
-            
-            # Try to repair common JSON formatting issues
-            repaired_json = repair_json(response_text)
-            
-            # Try to parse the JSON
-            flashcards_data = json.loads(repaired_json)
-            current_app.logger.info(f"Successfully parsed JSON response with {len(flashcards_data)} flashcards")
-            
-            # Format flashcards for compatibility with existing UI
-            for card in flashcards_data:
-                # Skip incomplete cards
-                if not all(key in card for key in ['q', 'ca', 'ia']):
-                    current_app.logger.warning(f"Skipping incomplete card: {card}")
-                    continue
-                
-                # Format: Q: [question] | A: [correct_answer]
-                formatted_card = f"Q: {card['q']} | A: {card['ca']}"
-                chunk_flashcards.append(formatted_card)
-                mc_data.append(card)
-                
-        except (json.JSONDecodeError, KeyError) as e:
-            # Log the parsing error
-            current_app.logger.error(f"Failed to parse JSON: {str(e)}")
-            
-            # Try extracting cards using regex as last resort
-            current_app.logger.info("Attempting to extract cards using regex pattern matching")
-            extracted_cards = extract_cards_from_text(response_text)
-            
-            if extracted_cards:
-                current_app.logger.info(f"Successfully extracted {len(extracted_cards)} cards using pattern matching")
-                mc_data = extracted_cards
-                
-                # Also format as standard flashcards
-                for card in extracted_cards:
-                    formatted_card = f"q: {card['q']} | ca: {card['ca']}"
-                    chunk_flashcards.append(formatted_card)
-            else:
-                # Fallback to legacy format if JSON parsing fails
-                raw_cards = response_text.split('\n')
-                for card in raw_cards:
-                    if 'q:' in card and '|' in card and 'a:' in card:
-                        cleaned = clean_flashcard_text(card)
-                        if cleaned:
-                            chunk_flashcards.append(cleaned)
-                
-                current_app.logger.info(f"Fallback parsing found {len(chunk_flashcards)} flashcards")
+        # Chunks seen before (in any upload) reuse their generated cards
+        content_hash = chunk.content_hash or ContentChunk.hash_text(chunk_content)
+        cached = db.session.get(ContentChunk, content_hash)
+        if cached is not None and cached.cards and cached.cards_model == Config.GEMINI_MODEL:
+            current_app.logger.info(f"Reusing {len(cached.cards)} cached cards for chunk {chunk_index}")
+            mc_data = cached.cards
+            chunk_flashcards = [f"Q: {card['q']} | A: {card['ca']}" for card in mc_data]
+            cached.used_at = datetime.utcnow()
+        else:
+            chunk_flashcards, mc_data = generate_chunk_cards(client, chunk_content, chunk_index)
+            if mc_data:
+                if cached is None:
+                    cached = ContentChunk(content_hash=content_hash, content=chunk_content)
+                    db.session.add(cached)
+                cached.cards = mc_data
+                cached.cards_model = Config.GEMINI_MODEL
+                cached.used_at = datetime.utcnow()
         
         # Log results
         current_app.logger.info(f"Generated {len(chunk_flashcards)} flashcards for chunk {chunk_index}")
@@ -147,13 +94,6 @@ def process_file_chunk_batch(client, file_key, chunk_index):
         # Update chunk as processed
         chunk.is_processed = True
         
-        # Update file processing state
-        import_file.current_index = chunk_index + 1
-        
-        # Check if all chunks are processed
-        if import_file.current_index >= import_file.total_chunks:
-            import_file.is_complete = True
-        
         # NEW: Automatically save the flashcards to the database
         cards_saved = 0
         if import_file.deck_id:
@@ -170,11 +110,19 @@ def process_file_chunk_batch(client, file_key, chunk_index):
                 is_saved=False
             ).all()
             
-            for card in unsaved_cards:
-                # Skip incomplete cards
-                if not card.question or not card.correct_answer:
-                    continue
-                
+            # Near-duplicates of cards already in the deck hierarchy are only marked as handled
+            complete_cards = [card for card in unsaved_cards if card.question and card.correct_answer]
+            new_cards, duplicates = filter_duplicates(
+                int(deck_id), complete_cards, fields=lambda card: (card.question, card.correct_answer)
+            )
+            if duplicates:
+                current_app.logger.info(f"Skipped {duplicates} near-duplicate cards for deck {deck_id}")
+                new_card_ids = {card.id for card in new_cards}
+                for card in complete_cards:
+                    if card.id not in new_card_ids:
+                        card.is_saved = True
+            
+            for card in new_cards:
                 # Ensure incorrect_answers is a list and limit to 3 items
                 incorrect_answers = card.incorrect_answers or []
                 if not isinstance(incorrect_answers, list):
@@ -211,15 +159,27 @@ def process_file_chunk_batch(client, file_key, chunk_index):
                 chunk.is_saved = True
                 chunk.cards_saved = cards_saved
                 
-                # Update the total saved cards count
-                import_file.total_saved_cards += cards_saved
-                
                 # Clean up saved flashcards since they're now in the main Flashcards table
                 cleanup_saved_flashcards(chunk.id)
         
+        # Chunks of one file may finish out of order on different threads, so
+        # the file's counters are moved in SQL rather than read and written back
+        db.session.execute(
+            update(ImportFile).where(ImportFile.id == import_file.id).values(
+                current_index=case(
+                    (ImportFile.current_index < chunk_index + 1, chunk_index + 1),
+                    else_=ImportFile.current_index
+                ),
+                total_saved_cards=ImportFile.total_saved_cards + cards_saved
+            ).execution_options(synchronize_session=False)
+        )
+        
         # Commit all database changes
         db.session.commit()
         
+        # Whichever chunk commits last sees every other chunk processed
+        mark_file_complete(import_file.id)
+        
         # Return processing results
         return {
             'flashcards': chunk_flashcards,
@@ -239,6 +199,107 @@ def process_file_chunk_batch(client, file_key, chunk_index):
         db.session.rollback()
         return {'error': error_msg}
 
+def mark_file_complete(file_id):
+    """Flag an import file complete once none of its chunks is left unprocessed"""
+    remaining = select(func.count()).select_from(ImportChunk).where(
+        ImportChunk.file_id == file_id,
+        ImportChunk.is_processed.is_(False)
+    ).scalar_subquery()
+    db.session.execute(
+        update(ImportFile).where(
+            ImportFile.id == file_id,
+            ImportFile.is_complete.is_(False),
+            remaining == 0
+        ).values(is_complete=True).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def generate_chunk_cards(client, chunk_content, chunk_index):
+    """
+    Generate flashcards for a chunk with the model
+    
+    Returns:
+        Tuple of (formatted "Q: ... | A: ..." strings, cards in the q/ca/ia format)
+    """
+    # Initialize generator for this chunk
+    generator = FlashcardGenerator(client)
+    
+    # Generate flashcards for this chunk using the multiple-choice format
+    prompt = Config.generate_prompt_template(f"the following content: {chunk_content}", 
+                                            batch_size=Config.DEFAULT_BATCH_SIZE)
+    
+    # Use the model from Config instead of hardcoding it
+    current_app.logger.info(f"Using model: {Config.GEMINI_MODEL}")
+    
+    response = llm_service.generate(
+        client,
+        model=Config.GEMINI_MODEL,
+        contents=types.Part.from_text(text=prompt),
+        config=Config.GEMINI_CONFIG,
+        cache_site='import_chunk'
+    )
+    
+    # Log response details for debugging
+    current_app.logger.info(f"Received response from Gemini API for chunk {chunk_index}")
+    
+    chunk_flashcards = []
+    mc_data = []
+    
+    # Try to parse JSON response for multiple-choice format
+    try:
+        # Log the raw response for debugging
+        current_app.logger.debug(f"Raw response text: {response.text}")
+        
+        response_text = response.text
+        
+        # Try to repair common JSON formatting issues
+        repaired_json = repair_json(response_text)
+        
+        # Try to parse the JSON
+        flashcards_data = json.loads(repaired_json)
+        current_app.logger.info(f"Successfully parsed JSON response with {len(flashcards_data)} flashcards")
+        
+        # Format flashcards for compatibility with existing UI
+        for card in flashcards_data:
+            # Skip incomplete cards
+            if not all(key in card for key in ['q', 'ca', 'ia']):
+                current_app.logger.warning(f"Skipping incomplete card: {card}")
+                continue
+            
+            # Format: Q: [question] | A: [correct_answer]
+            formatted_card = f"Q: {card['q']} | A: {card['ca']}"
+            chunk_flashcards.append(formatted_card)
+            mc_data.append(card)
+            
+    except (json.JSONDecodeError, KeyError) as e:
+        # Log the parsing error
+        current_app.logger.error(f"Failed to parse JSON: {str(e)}")
+        
+        # Try extracting cards using regex as last resort
+        current_app.logger.info("Attempting to extract cards using regex pattern matching")
+        extracted_cards = extract_cards_from_text(response_text)
+        
+        if extracted_cards:
+            current_app.logger.info(f"Successfully extracted {len(extracted_cards)} cards using pattern matching")
+            mc_data = extracted_cards
+            
+            # Also format as standard flashcards
+            for card in extracted_cards:
+                formatted_card = f"q: {card['q']} | ca: {card['ca']}"
+                chunk_flashcards.append(formatted_card)
+        else:
+            # Fallback to legacy format if JSON parsing fails
+            raw_cards = response_text.split('\n')
+            for card in raw_cards:
+                if 'q:' in card and '|' in card and 'a:' in card:
+                    cleaned = clean_flashcard_text(card)
+                    if cleaned:
+                        chunk_flashcards.append(cleaned)
+            
+            current_app.logger.info(f"Fallback parsing found {len(chunk_flashcards)} flashcards")
+    
+    return chunk_flashcards, mc_data
+
 def cleanup_saved_flashcards(chunk_id):
     """Delete ImportFlashcard records that have been saved to the main Flashcards table"""
     try:
@@ -16,7 +16,9 @@ from models import db
 from models import (
     User, 
     FlashcardDecks, 
+    DeckClosure,
     Flashcards, 
+    FlashcardLSH,
     FlashcardGenerator,
     LearningSession, 
     LearningSection, 
@@ -47,6 +49,14 @@ class DatabaseService:
             try:
                 db.create_all()
                 logger.info("Database tables created successfully.")
+                
+                added_columns = DatabaseService.add_missing_columns()
+                DatabaseService.add_missing_indexes()
+                DatabaseService.ensure_deck_closure()
+                DatabaseService.ensure_card_states()
+                DatabaseService.ensure_card_counters(added_columns)
+                DatabaseService.ensure_card_fingerprints(added_columns)
+                DatabaseService.ensure_search_index()
             except Exception as e:
                 logger.error(f"Error creating database tables: {e}")
                 if "sqlite3.OperationalError" in str(e) and "unable to open database file" in str(e):
@@ -55,6 +65,153 @@ class DatabaseService:
                     logger.error(f"Directory exists: {os.path.exists(os.path.dirname(db_path) if os.path.dirname(db_path) else '.')}")
                     logger.error(f"Directory is writable: {os.access(os.path.dirname(db_path) if os.path.dirname(db_path) else '.', os.W_OK)}")
     
+    @staticmethod
+    def ensure_deck_closure():
+        """Backfill the deck closure table for databases created before it existed"""
+        try:
+            if FlashcardDecks.query.first() and not DeckClosure.query.first():
+                rows = DeckClosure.rebuild()
+                db.session.commit()
+                logger.info(f"Backfilled deck closure table with {rows} rows.")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error backfilling deck closure table: {e}")
+    
+    @staticmethod
+    def add_missing_columns():
+        """
+        Add model columns that are missing from existing tables
+        
+        db.create_all() only creates missing tables, so columns added to an
+        existing model are appended here with ALTER TABLE ... ADD COLUMN.
+        
+        Returns:
+            List of "table.column" names that were added
+        """
+        added = []
+        try:
+            inspector = inspect(db.engine)
+            existing_tables = set(inspector.get_table_names())
+            
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    if column.server_default is not None:
+                        ddl += f" DEFAULT {column.server_default.arg}"
+                        if not column.nullable:
+                            ddl += " NOT NULL"
+                    
+                    with db.engine.begin() as connection:
+                        connection.execute(text(ddl))
+                    added.append(f"{table.name}.{column.name}")
+                    logger.info(f"Added column {table.name}.{column.name}")
+        except Exception as e:
+            logger.error(f"Error adding missing columns: {e}")
+        
+        return added
+    
+    @staticmethod
+    def add_missing_indexes():
+        """
+        Create model indexes that are missing from existing tables
+        
+        Like columns, indexes declared on an existing model are skipped by
+        db.create_all(), so they are created here.
+        
+        Returns:
+            List of index names that were created
+        """
+        created = []
+        try:
+            inspector = inspect(db.engine)
+            existing_tables = set(inspector.get_table_names())
+            
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing_indexes:
+                        continue
+                    
+                    index.create(bind=db.engine)
+                    created.append(index.name)
+                    logger.info(f"Created index {index.name} on {table.name}")
+        except Exception as e:
+            logger.error(f"Error creating missing indexes: {e}")
+        
+        return created
+    
+    @staticmethod
+    def ensure_card_counters(added_columns):
+        """Backfill deck card counters when their columns were just added"""
+        counter_columns = {f"flashcard_decks.{name}" for name in ('card_count',) + FlashcardDecks.SUBTREE_COUNTER_COLUMNS}
+        if not counter_columns.intersection(added_columns):
+            return
+        
+        try:
+            decks = FlashcardDecks.refresh_card_counters()
+            db.session.commit()
+            logger.info(f"Backfilled card counters for {decks} decks.")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error backfilling deck card counters: {e}")
+    
+    @staticmethod
+    def ensure_card_states():
+        """
+        Store New (0) for cards with no state
+        
+        The study queue reads each state by equality on the study queue
+        index, so a NULL state would keep a card out of every page.
+        """
+        try:
+            updated = Flashcards.query.filter(Flashcards.state.is_(None)).update(
+                {'state': 0}, synchronize_session=False
+            )
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(text('ALTER TABLE flashcards ALTER COLUMN state SET NOT NULL'))
+            db.session.commit()
+            if updated:
+                logger.info(f"Set {updated} cards without a state to New.")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error backfilling card states: {e}")
+    
+    @staticmethod
+    def ensure_card_fingerprints(added_columns):
+        """Backfill card fingerprints and the LSH index for cards created before they existed"""
+        try:
+            if 'flashcards.minhash' not in added_columns and (
+                    FlashcardLSH.query.first() or not Flashcards.query.first()):
+                return
+            
+            cards = FlashcardLSH.rebuild()
+            db.session.commit()
+            logger.info(f"Backfilled duplicate-detection fingerprints for {cards} cards.")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error backfilling card fingerprints: {e}")
+    
+    @staticmethod
+    def ensure_search_index():
+        """Create the full-text and trigram search structures if missing"""
+        from services.search_service import ensure_search_index
+        
+        try:
+            ensure_search_index()
+        except Exception as e:
+            logger.error(f"Error creating full-text search index: {e}")
+    
     @staticmethod
     def ensure_directories():
         """Ensure all necessary directories exist"""
@@ -174,6 +331,7 @@ class DatabaseSyncHelper:
         self.model_map = {
             'users': User, 
             'flashcard_decks': FlashcardDecks,
+            'deck_closure': DeckClosure,
             'flashcards': Flashcards,
             'learning_sessions': LearningSession, 
             'learning_sections': LearningSection, 
@@ -189,6 +347,7 @@ class DatabaseSyncHelper:
         self.table_dependencies = {
             'users': [],  # users have no dependencies
             'flashcard_decks': ['users'],  # decks depend on users
+            'deck_closure': ['flashcard_decks'],  # closure rows reference decks
             'flashcards': ['flashcard_decks'],  # flashcards depend on decks
             'learning_sessions': ['users'],  
             'learning_sections': ['learning_sessions'],
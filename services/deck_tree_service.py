@@ -0,0 +1,175 @@
+"""
+Deck tree service for Memoria application.
+Builds a user's whole deck hierarchy from a single query and caches it, so
+templates, breadcrumbs and tree APIs don't walk relationships one query at a time.
+"""
+
+from models import db, FlashcardDecks
+from services.cache_service import get_cache
+
+
+class DeckNode:
+    """Lightweight stand-in for a FlashcardDecks row inside a cached tree"""
+
+    __slots__ = (
+        'flashcard_deck_id',
+        'name',
+        'description',
+        'parent_deck_id',
+        'user_id',
+        'is_public',
+        'created_at',
+        'card_count',
+        'total_card_count',
+        'parent_deck',
+        'child_decks'
+    )
+
+    def __init__(self, row):
+        self.flashcard_deck_id = row.flashcard_deck_id
+        self.name = row.name
+        self.description = row.description
+        self.parent_deck_id = row.parent_deck_id
+        self.user_id = row.user_id
+        self.is_public = row.is_public
+        self.created_at = row.created_at
+        self.card_count = row.card_count or 0
+        self.total_card_count = row.total_card_count or 0
+        self.parent_deck = None
+        self.child_decks = []
+
+    def count_all_flashcards(self):
+        """Count flashcards in this deck and all sub-decks"""
+        return self.total_card_count
+
+    def count_all_sub_decks(self):
+        """Count all sub-decks recursively"""
+        return sum(1 + child.count_all_sub_decks() for child in self.child_decks)
+
+
+class DeckTree:
+    """A user's deck hierarchy as an id -> node map"""
+
+    def __init__(self, rows):
+        self.nodes = {row.flashcard_deck_id: DeckNode(row) for row in rows}
+        self.roots = []
+
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_deck_id)
+            if parent is not None:
+                node.parent_deck = parent
+                parent.child_decks.append(node)
+            else:
+                self.roots.append(node)
+
+    @property
+    def all_decks(self):
+        """Every deck of the user, in the order they were loaded"""
+        return list(self.nodes.values())
+
+    def get(self, deck_id):
+        return self.nodes.get(deck_id)
+
+    def breadcrumbs(self, deck_id):
+        """Ancestors of a deck, root first (excluding the deck itself)"""
+        node = self.nodes.get(deck_id)
+        trail = []
+        seen = {deck_id}
+        parent = node.parent_deck if node is not None else None
+        while parent is not None and parent.flashcard_deck_id not in seen:
+            seen.add(parent.flashcard_deck_id)
+            trail.insert(0, parent)
+            parent = parent.parent_deck
+        return trail
+
+    def descendant_ids(self, deck_id, include_self=True):
+        """Set of deck ids in a deck's subtree"""
+        node = self.nodes.get(deck_id)
+        if node is None:
+            return set()
+
+        result = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.flashcard_deck_id in result:
+                continue
+            result.add(current.flashcard_deck_id)
+            stack.extend(current.child_decks)
+
+        if not include_self:
+            result.discard(deck_id)
+        return result
+
+    def walk(self, nodes=None, depth=0):
+        """Yield (node, depth) pairs depth-first"""
+        for node in (self.roots if nodes is None else nodes):
+            yield node, depth
+            yield from self.walk(node.child_decks, depth + 1)
+
+    def to_tree(self, nodes=None):
+        """Nested dicts in the /deck/api/decks/tree format"""
+        return [
+            {
+                'flashcard_deck_id': node.flashcard_deck_id,
+                'name': node.name,
+                'description': node.description,
+                'child_decks': self.to_tree(node.child_decks)
+            }
+            for node in (self.roots if nodes is None else nodes)
+        ]
+
+    def to_nested(self, nodes=None):
+        """Nested dicts in the /deck/api/decks format"""
+        return [
+            {
+                'id': node.flashcard_deck_id,
+                'name': node.name,
+                'children': self.to_nested(node.child_decks)
+            }
+            for node in (self.roots if nodes is None else nodes)
+        ]
+
+
+class DeckTreeCache:
+    """
+    Per-user deck trees kept in the app cache
+
+    Trees are stored under the user's cache version, so the version bump done
+    by invalidate() (called from the create, rename, move and delete routes,
+    and by every other write to the user's decks or cards) retires them.
+    """
+
+    @staticmethod
+    def build(user_id):
+        """Load all of a user's decks in one query and link them into a tree"""
+        rows = db.session.query(
+            FlashcardDecks.flashcard_deck_id,
+            FlashcardDecks.name,
+            FlashcardDecks.description,
+            FlashcardDecks.parent_deck_id,
+            FlashcardDecks.user_id,
+            FlashcardDecks.is_public,
+            FlashcardDecks.created_at,
+            FlashcardDecks.card_count,
+            FlashcardDecks.total_card_count
+        ).filter(
+            FlashcardDecks.user_id == user_id
+        ).order_by(FlashcardDecks.name, FlashcardDecks.flashcard_deck_id).all()
+
+        return DeckTree(rows)
+
+    @staticmethod
+    def get(user_id):
+        """Return the user's deck tree, building it on a cache miss"""
+        cache = get_cache()
+        if cache is None:
+            return DeckTreeCache.build(user_id)
+        return cache.get_or_set('deck_tree', 'nodes', lambda: DeckTreeCache.build(user_id), user_id=user_id)
+
+    @staticmethod
+    def invalidate(user_id):
+        """Bump the user's cache version after their deck hierarchy changed"""
+        cache = get_cache()
+        if cache is not None:
+            cache.invalidate_user(user_id)
@@ -0,0 +1,168 @@
+"""
+Duplicate service for Memoria application.
+Near-duplicate card detection on the MinHash LSH index (models.flashcard_lsh):
+incoming cards are checked against a deck hierarchy in one set-based pass
+before they are inserted, and existing cards are grouped for the duplicates
+report.
+"""
+
+from sqlalchemy import and_
+from sqlalchemy.orm import aliased
+from models import db, Flashcards, FlashcardDecks, DeckClosure, FlashcardLSH
+from models.flashcard_lsh import card_shingles, jaccard, minhash_signature, lsh_buckets
+
+# Cards whose question + answer shingles overlap at least this much are duplicates
+DUPLICATE_SIMILARITY = 0.7
+# Most groups listed by the duplicates report
+MAX_REPORT_GROUPS = 200
+# Values per IN (...) list
+_IN_BATCH = 500
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), _IN_BATCH):
+        yield values[start:start + _IN_BATCH]
+
+
+def filter_duplicates(deck_id, cards, fields, threshold=DUPLICATE_SIMILARITY):
+    """
+    Drop incoming cards that nearly duplicate an existing card or each other
+
+    Existing cards are those anywhere in the hierarchy of the target deck's
+    top-level deck, found through the LSH buckets of all incoming cards at
+    once; the candidates are confirmed by shingle Jaccard similarity.
+
+    Args:
+        deck_id: Deck the cards are about to be added to
+        cards: Incoming cards in any form
+        fields: Callable returning (question, correct_answer) for a card
+        threshold: Jaccard similarity at which two cards are duplicates
+
+    Returns:
+        Tuple of (cards to keep in their original order, number dropped)
+    """
+    prepared = []
+    for card in cards:
+        shingles = card_shingles(*fields(card))
+        prepared.append((card, shingles, lsh_buckets(minhash_signature(shingles))))
+
+    # Existing candidates sharing any bucket with any incoming card
+    existing_by_bucket = {}
+    existing_shingles = {}
+    root_id = DeckClosure.root_id(deck_id)
+    all_buckets = {bucket for _, _, buckets in prepared for bucket in buckets}
+    for batch in _chunks(all_buckets):
+        rows = db.session.query(
+            FlashcardLSH.bucket,
+            Flashcards.flashcard_id,
+            Flashcards.question,
+            Flashcards.correct_answer
+        ).join(
+            Flashcards, Flashcards.flashcard_id == FlashcardLSH.flashcard_id
+        ).filter(
+            FlashcardLSH.bucket.in_(batch),
+            Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(root_id))
+        ).all()
+        for row in rows:
+            existing_by_bucket.setdefault(row.bucket, set()).add(row.flashcard_id)
+            if row.flashcard_id not in existing_shingles:
+                existing_shingles[row.flashcard_id] = card_shingles(row.question, row.correct_answer)
+
+    kept = []
+    kept_by_bucket = {}
+    for card, shingles, buckets in prepared:
+        candidates = set()
+        batch_candidates = []
+        for bucket in buckets:
+            candidates.update(existing_by_bucket.get(bucket, ()))
+            batch_candidates.extend(kept_by_bucket.get(bucket, ()))
+
+        if any(jaccard(shingles, existing_shingles[card_id]) >= threshold for card_id in candidates) or \
+                any(jaccard(shingles, other) >= threshold for other in batch_candidates):
+            continue
+
+        kept.append(card)
+        for bucket in buckets:
+            kept_by_bucket.setdefault(bucket, []).append(shingles)
+
+    return kept, len(prepared) - len(kept)
+
+
+def find_duplicate_groups(deck_id, threshold=DUPLICATE_SIMILARITY, max_groups=MAX_REPORT_GROUPS):
+    """
+    Group near-duplicate cards within a deck and its sub-decks
+
+    Candidate pairs come from one self-join of the LSH index restricted to
+    the subtree; pairs below the similarity threshold are discarded and the
+    rest are merged into groups.
+
+    Returns:
+        Dict with the groups (largest first, at most max_groups), the number
+        of groups and the number of cards that could be removed
+    """
+    subtree = DeckClosure.subtree_ids(deck_id)
+    left, right = aliased(FlashcardLSH), aliased(FlashcardLSH)
+    left_card, right_card = aliased(Flashcards), aliased(Flashcards)
+
+    pairs = db.session.query(left.flashcard_id, right.flashcard_id).join(
+        right, and_(left.bucket == right.bucket, left.flashcard_id < right.flashcard_id)
+    ).join(
+        left_card, left_card.flashcard_id == left.flashcard_id
+    ).join(
+        right_card, right_card.flashcard_id == right.flashcard_id
+    ).filter(
+        left_card.flashcard_deck_id.in_(subtree),
+        right_card.flashcard_deck_id.in_(subtree)
+    ).distinct().all()
+
+    card_ids = {card_id for pair in pairs for card_id in pair}
+    cards = {}
+    for batch in _chunks(card_ids):
+        for row in db.session.query(
+            Flashcards.flashcard_id,
+            Flashcards.question,
+            Flashcards.correct_answer,
+            Flashcards.flashcard_deck_id,
+            FlashcardDecks.name
+        ).join(
+            FlashcardDecks, FlashcardDecks.flashcard_deck_id == Flashcards.flashcard_deck_id
+        ).filter(Flashcards.flashcard_id.in_(batch)):
+            cards[row.flashcard_id] = (row, card_shingles(row.question, row.correct_answer))
+
+    # Union-find over confirmed pairs
+    parent = {}
+
+    def find(card_id):
+        parent.setdefault(card_id, card_id)
+        while parent[card_id] != card_id:
+            parent[card_id] = parent[parent[card_id]]
+            card_id = parent[card_id]
+        return card_id
+
+    for a, b in pairs:
+        if jaccard(cards[a][1], cards[b][1]) >= threshold:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for card_id in parent:
+        groups.setdefault(find(card_id), []).append(card_id)
+    ordered = sorted(groups.values(), key=lambda ids: (-len(ids), min(ids)))
+
+    return {
+        'deck_id': deck_id,
+        'group_count': len(ordered),
+        'duplicate_cards': sum(len(ids) - 1 for ids in ordered),
+        'groups': [
+            [{
+                'id': card_id,
+                'question': cards[card_id][0].question,
+                'correct_answer': cards[card_id][0].correct_answer,
+                'deck_id': cards[card_id][0].flashcard_deck_id,
+                'deck_name': cards[card_id][0].name
+            } for card_id in sorted(ids)]
+            for ids in ordered[:max_groups]
+        ]
+    }
@@ -1,26 +1,232 @@
+import io
+import os
+import time
+import hashlib
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from io import StringIO
 import PyPDF2
-from typing import Dict
+from typing import Dict, BinaryIO, Iterator, List
+
+from config import Config
+
+logger = logging.getLogger("file_service")
+
+# Characters read from a text file per step when streaming
+TEXT_BLOCK_SIZE = 64 * 1024
+# Bytes read per step when hashing an upload
+HASH_BLOCK_SIZE = 1024 * 1024
+# Seconds between checks on a PDF page range that is still being extracted
+RANGE_POLL_INTERVAL = 0.5
+# Resubmissions of a page range whose worker pool crashed or was recycled
+PDF_RANGE_RETRIES = 2
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool(max_workers):
+    """Process pool shared by PDF extraction (spawned, so workers hold no app state)"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        # A crashed worker breaks the pool for good, so start a new one
+        if _pdf_pool is None or getattr(_pdf_pool, '_broken', False):
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pdf_pool
+
+
+def recycle_pdf_pool(pool):
+    """
+    Kill a pool's worker processes and retire it
+
+    A running task cannot be cancelled, so a hung extraction is only freed
+    by terminating its process. Other tasks on the pool fail with
+    BrokenProcessPool or are cancelled; their callers resubmit them to the
+    fresh pool that get_pdf_pool creates next.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_page_range(filepath: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end) of a PDF on disk (runs in a pool worker)"""
+    with open(filepath, 'rb') as file:
+        pages = PyPDF2.PdfReader(file).pages
+        return [pages[number].extract_text() for number in range(start, end)]
+
+
+class _PageRangeTask:
+    """A page range submitted to the PDF pool, timed from when it started running"""
+
+    def __init__(self, page_range, pool, future, retries):
+        self.page_range = page_range
+        self.pool = pool
+        self.future = future
+        self.retries = retries
+
+    def result(self, timeout):
+        """
+        The range's pages; raises FutureTimeoutError once it has run longer than timeout
+
+        Waiting in the queue behind other ranges doesn't count: the clock
+        starts when the executor hands the range to a worker.
+        """
+        started = None
+        while True:
+            try:
+                return self.future.result(timeout=RANGE_POLL_INTERVAL)
+            except FutureTimeoutError:
+                now = time.monotonic()
+                if started is None:
+                    if self.future.running():
+                        started = now
+                elif now - started > timeout:
+                    raise
+
 
 class FileProcessor:
     """Handle file processing operations"""
     @staticmethod
     def read_content(filepath: str) -> str:
         """Read and extract content from file"""
-        if filepath.lower().endswith('.pdf'):
-            return FileProcessor._read_pdf(filepath)
-        return FileProcessor._read_text(filepath)
-    
+        text = StringIO()
+        for piece in FileProcessor.iter_content(filepath):
+            text.write(piece)
+        return text.getvalue()
+
     @staticmethod
-    def _read_pdf(filepath: str) -> str:
+    def iter_content(filepath: str) -> Iterator[str]:
+        """Extract content from a file on disk piece by piece"""
         with open(filepath, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = StringIO()
+            yield from FileProcessor.iter_stream(file, filepath)
+
+    @staticmethod
+    def hash_stream(stream: BinaryIO) -> str:
+        """SHA-256 of a seekable binary stream's bytes, leaving it rewound"""
+        digest = hashlib.sha256()
+        stream.seek(0)
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+        stream.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def iter_stream(stream: BinaryIO, filename: str) -> Iterator[str]:
+        """
+        Extract content from a binary stream piece by piece
+
+        PDFs yield one page of text at a time and text files one block at
+        a time, so callers never hold the whole document in memory.
+        """
+        if filename.lower().endswith('.pdf'):
+            return FileProcessor._iter_pdf(stream)
+        return FileProcessor._iter_text(stream)
+
+    @staticmethod
+    def _iter_pdf(stream: BinaryIO) -> Iterator[str]:
+        pdf_reader = PyPDF2.PdfReader(stream)
+        page_count = len(pdf_reader.pages)
+
+        # Small documents aren't worth the trip through the pool
+        if Config.PDF_EXTRACT_WORKERS < 2 or page_count <= Config.PDF_PAGES_PER_TASK:
             for page in pdf_reader.pages:
-                text.write(page.extract_text())
-            return text.getvalue()
-    
+                yield page.extract_text()
+            return
+
+        yield from FileProcessor._iter_pdf_parallel(stream, page_count)
+
+    @staticmethod
+    def _iter_pdf_parallel(stream: BinaryIO, page_count: int) -> Iterator[str]:
+        """
+        Extract page ranges in the PDF process pool, yielding pages in order
+
+        Workers read the document from a temporary copy on disk. At most two
+        ranges per worker are in flight, so finished ranges stream into the
+        caller while later ones are still being extracted. A range still
+        running PDF_PAGE_TIMEOUT per page after it started is skipped with a
+        warning, and the pool is recycled to kill it. A range lost to a
+        crashed or recycled pool is resubmitted (up to PDF_RANGE_RETRIES
+        times) before it is skipped.
+        """
+        workers = Config.PDF_EXTRACT_WORKERS
+        per_task = Config.PDF_PAGES_PER_TASK
+        ranges = iter([(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)])
+
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as copy:
+            stream.seek(0)
+            shutil.copyfileobj(stream, copy)
+            copy_path = copy.name
+
+        pending = deque()
+
+        def submit(page_range, retries=0):
+            pool = get_pdf_pool(workers)
+            try:
+                future = pool.submit(extract_page_range, copy_path, *page_range)
+            except BrokenProcessPool:
+                recycle_pdf_pool(pool)
+                pool = get_pdf_pool(workers)
+                future = pool.submit(extract_page_range, copy_path, *page_range)
+            return _PageRangeTask(page_range, pool, future, retries)
+
+        def submit_next():
+            page_range = next(ranges, None)
+            if page_range is not None:
+                pending.append(submit(page_range))
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                task = pending[0]
+                start, end = task.page_range
+                try:
+                    pages = task.result(Config.PDF_PAGE_TIMEOUT * (end - start))
+                except FutureTimeoutError:
+                    logger.warning(f"PDF pages {start + 1}-{end} timed out and were skipped")
+                    recycle_pdf_pool(task.pool)
+                    pages = []
+                except (BrokenProcessPool, CancelledError):
+                    if task.retries < PDF_RANGE_RETRIES:
+                        pending[0] = submit(task.page_range, task.retries + 1)
+                        continue
+                    logger.warning(f"PDF pages {start + 1}-{end} failed in the worker pool and were skipped")
+                    pages = []
+                pending.popleft()
+                submit_next()
+                yield from pages
+        finally:
+            for task in pending:
+                task.future.cancel()
+            try:
+                os.remove(copy_path)
+            except OSError:
+                logger.warning(f"Failed to delete temporary file: {copy_path}")
+
     @staticmethod
-    def _read_text(filepath: str) -> str:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-            return file.read()
+    def _iter_text(stream: BinaryIO) -> Iterator[str]:
+        text = io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')
+        try:
+            while True:
+                block = text.read(TEXT_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            # Leave the underlying stream open for its owner
+            text.detach()
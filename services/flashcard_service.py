@@ -6,6 +6,7 @@ import json
 from models import FlashcardSet
 from config import Config
 from utils import clean_flashcard_text
+from services import llm_service
 
 def generate_flashcards_batch(client, topic):
     """Generate flashcards from topic in batch mode"""
@@ -14,10 +15,12 @@ def generate_flashcards_batch(client, topic):
         prompt = Config.generate_prompt_template(topic)
         
         # Generate flashcards with JSON response
-        response = client.models.generate_content(
+        response = llm_service.generate(
+            client,
             model='gemini-2.0-flash-lite',
             contents=types.Part.from_text(text=prompt),
-            config=Config.GEMINI_CONFIG
+            config=Config.GEMINI_CONFIG,
+            cache_site='flashcard_batch'
         )
         
         # Parse JSON response
@@ -0,0 +1,318 @@
+"""
+FSRS optimizer service for Memoria application.
+Fits per-user FSRS weights from the review_logs history and stores them on
+the user. Fits are CPU-bound, so they run in a process pool instead of a web
+worker; only loading the history and storing the result touch the database.
+"""
+
+import math
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+import numpy as np
+
+logger = logging.getLogger("fsrs_optimizer")
+
+# Weight bounds used by the fsrs package optimizer
+PARAMETER_LOWER_BOUNDS = np.array([
+    0.01, 0.01, 0.01, 0.01, 1.0, 0.1, 0.1, 0.0, 0.0, 0.0,
+    0.01, 0.1, 0.01, 0.01, 0.01, 0.0, 1.0, 0.0, 0.0
+])
+PARAMETER_UPPER_BOUNDS = np.array([
+    100.0, 100.0, 100.0, 100.0, 10.0, 4.0, 4.0, 0.75, 4.5, 0.8,
+    3.5, 5.0, 0.25, 0.9, 4.0, 1.0, 6.0, 2.0, 2.0
+])
+
+# Fewer recall checks than this and the defaults are kept (same cut-off as fsrs)
+MIN_REVIEWS = 512
+# Only the first reviews of each card are used for fitting
+MAX_SEQUENCE_LENGTH = 64
+
+EPOCHS = 5
+MINI_BATCH_REVIEWS = 512
+LEARNING_RATE = 4e-2
+GRADIENT_STEP = 1e-4
+MAX_STEPS = 400
+
+_STABILITY_RANGE = (0.01, 36500.0)
+
+_pool = None
+_pool_lock = threading.Lock()
+_running = {}
+
+
+def load_review_histories(user_id):
+    """
+    Load a user's review history as padded per-card arrays
+
+    Returns:
+        Tuple of (ratings, times, review_count): int ratings and epoch-second
+        review times of shape (cards, MAX_SEQUENCE_LENGTH), 0/NaN padded, and
+        the number of review log rows read.
+    """
+    from models import db, ReviewLogs
+    from services.fsrs_vectorized import to_epoch_seconds
+
+    rows = db.session.query(
+        ReviewLogs.flashcard_id,
+        ReviewLogs.rating,
+        ReviewLogs.reviewed_at
+    ).filter(
+        ReviewLogs.user_id == user_id
+    ).order_by(ReviewLogs.flashcard_id, ReviewLogs.reviewed_at).all()
+
+    card_index = {}
+    for row in rows:
+        card_index.setdefault(row.flashcard_id, len(card_index))
+
+    ratings = np.zeros((len(card_index), MAX_SEQUENCE_LENGTH), dtype=np.int64)
+    times = np.full((len(card_index), MAX_SEQUENCE_LENGTH), np.nan)
+    lengths = np.zeros(len(card_index), dtype=np.int64)
+    epoch = to_epoch_seconds([row.reviewed_at for row in rows])
+
+    for row, timestamp in zip(rows, epoch):
+        card = card_index[row.flashcard_id]
+        position = lengths[card]
+        if position < MAX_SEQUENCE_LENGTH:
+            ratings[card, position] = row.rating
+            times[card, position] = timestamp
+            lengths[card] += 1
+
+    return ratings, times, len(rows)
+
+
+def count_recall_checks(times):
+    """Reviews at least a day after the previous one: the ones the loss is computed on"""
+    gaps = np.floor(np.diff(times, axis=1) / 86400.0)
+    return int(np.count_nonzero(gaps >= 1))
+
+
+def log_loss(parameters, ratings, times):
+    """
+    Mean binary cross-entropy of predicted retrievability against recall
+
+    Replays every card's history with the FSRS model for the given weights;
+    reviews a day or more after the previous one are scored, same-day
+    reviews only update the memory state.
+    """
+    from services.fsrs_vectorized import VectorizedFSRS, elapsed_days
+
+    engine = VectorizedFSRS(parameters)
+    stability = np.full(ratings.shape[0], np.nan)
+    difficulty = np.full(ratings.shape[0], np.nan)
+    total, count = 0.0, 0
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for k in range(ratings.shape[1]):
+            valid = ~np.isnan(times[:, k])
+            if not valid.any():
+                break
+            rating = np.where(valid, ratings[:, k], 3)
+
+            if k == 0:
+                stability = engine.initial_stability(rating)
+                difficulty = engine.initial_difficulty(rating)
+                continue
+
+            elapsed = elapsed_days(times[:, k - 1], times[:, k])
+            retrievability = engine.retrievability(stability, elapsed)
+
+            scored = valid & (elapsed >= 1)
+            if scored.any():
+                predicted = np.clip(retrievability[scored], 1e-6, 1 - 1e-6)
+                recalled = rating[scored] > 1
+                total -= float(np.sum(np.where(recalled, np.log(predicted), np.log(1 - predicted))))
+                count += int(np.count_nonzero(scored))
+
+            next_stability = np.where(
+                elapsed < 1,
+                engine.short_term_stability(stability, rating),
+                engine.next_stability(difficulty, stability, retrievability, rating)
+            )
+            next_stability = np.clip(np.nan_to_num(next_stability, nan=_STABILITY_RANGE[0]), *_STABILITY_RANGE)
+            stability = np.where(valid, next_stability, stability)
+            difficulty = np.where(valid, engine.next_difficulty(difficulty, rating), difficulty)
+
+    return total / count if count else 0.0
+
+
+def fit_parameters(ratings, times, initial_parameters, seed=42):
+    """
+    Fit FSRS weights to review histories (runs inside a pool worker)
+
+    Adam on finite-difference gradients of log_loss over mini-batches of
+    cards, with a cosine-annealed learning rate and weights clamped to the
+    fsrs bounds. The best full-history loss across epochs wins.
+
+    Returns:
+        Dict with parameters, loss_before, loss_after and recall_checks
+    """
+    rng = np.random.default_rng(seed)
+    params = np.clip(np.asarray(initial_parameters, dtype=np.float64),
+                     PARAMETER_LOWER_BOUNDS, PARAMETER_UPPER_BOUNDS)
+    recall_checks = count_recall_checks(times)
+
+    loss_before = log_loss(params, ratings, times)
+    best_params, best_loss = params.copy(), loss_before
+
+    cards = ratings.shape[0]
+    checks_per_card = max(recall_checks / max(cards, 1), 1.0)
+    batch_cards = max(int(MINI_BATCH_REVIEWS / checks_per_card), 1)
+    steps_per_epoch = math.ceil(cards / batch_cards)
+    total_steps = min(steps_per_epoch * EPOCHS, MAX_STEPS)
+
+    m = np.zeros_like(params)
+    v = np.zeros_like(params)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    step = 0
+
+    for epoch in range(EPOCHS):
+        order = rng.permutation(cards)
+        for start in range(0, cards, batch_cards):
+            if step >= total_steps:
+                break
+            batch = order[start:start + batch_cards]
+            batch_ratings, batch_times = ratings[batch], times[batch]
+
+            base = log_loss(params, batch_ratings, batch_times)
+            gradient = np.zeros_like(params)
+            for i in range(len(params)):
+                shifted = params.copy()
+                h = GRADIENT_STEP * max(1.0, abs(params[i]))
+                shifted[i] += h
+                gradient[i] = (log_loss(shifted, batch_ratings, batch_times) - base) / h
+
+            step += 1
+            lr = 0.5 * LEARNING_RATE * (1 + math.cos(math.pi * step / total_steps))
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            m_hat = m / (1 - beta1 ** step)
+            v_hat = v / (1 - beta2 ** step)
+            params = np.clip(params - lr * m_hat / (np.sqrt(v_hat) + eps),
+                             PARAMETER_LOWER_BOUNDS, PARAMETER_UPPER_BOUNDS)
+
+        loss = log_loss(params, ratings, times)
+        if loss < best_loss:
+            best_params, best_loss = params.copy(), loss
+
+    return {
+        'parameters': [float(w) for w in best_params],
+        'loss_before': loss_before,
+        'loss_after': best_loss,
+        'recall_checks': recall_checks
+    }
+
+
+def get_optimizer_pool(max_workers=1):
+    """Process pool shared by optimizer jobs (spawned, so workers hold no app state)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _submit_fit(user_id, max_workers):
+    """Load a user's history and submit its fit; returns (future, review_count) or (None, count)"""
+    from services.fsrs_scheduler import get_user_scheduler
+
+    ratings, times, review_count = load_review_histories(user_id)
+    if count_recall_checks(times) < MIN_REVIEWS:
+        return None, review_count
+
+    initial = get_user_scheduler(user_id).parameters
+    future = get_optimizer_pool(max_workers).submit(fit_parameters, ratings, times, initial)
+    return future, review_count
+
+
+def store_parameters(user_id, result, review_count):
+    """Save fitted weights on the user if they beat the ones in use"""
+    from models import db, User
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return False
+
+    improved = result['loss_after'] < result['loss_before']
+    if improved:
+        user.fsrs_parameters = result['parameters']
+    user.fsrs_optimized_at = datetime.utcnow()
+    user.fsrs_optimized_reviews = review_count
+    db.session.commit()
+
+    logger.info(
+        f"FSRS fit for user {user_id}: loss {result['loss_before']:.4f} -> {result['loss_after']:.4f} "
+        f"over {result['recall_checks']} reviews ({'stored' if improved else 'kept previous weights'})"
+    )
+    return improved
+
+
+def optimize_user(user_id, max_workers=1):
+    """
+    Fit and store a user's weights, waiting for the pool worker
+
+    Returns:
+        The fit result dict, or None if the user has too little history
+    """
+    future, review_count = _submit_fit(user_id, max_workers)
+    if future is None:
+        return None
+
+    result = future.result()
+    result['stored'] = store_parameters(user_id, result, review_count)
+    return result
+
+
+def start_optimization(app, user_id):
+    """
+    Background job: fit a user's weights without blocking the request
+
+    Returns:
+        'started', 'running' (a fit for this user is in flight) or
+        'insufficient_data'
+    """
+    # Reserve the slot before loading history; _submit_fit takes _pool_lock itself
+    with _pool_lock:
+        if user_id in _running:
+            return 'running'
+        _running[user_id] = None
+
+    try:
+        max_workers = app.config.get('FSRS_OPTIMIZER_WORKERS', 1)
+        future, review_count = _submit_fit(user_id, max_workers)
+    except Exception:
+        with _pool_lock:
+            _running.pop(user_id, None)
+        raise
+    if future is None:
+        with _pool_lock:
+            _running.pop(user_id, None)
+        return 'insufficient_data'
+
+    with _pool_lock:
+        _running[user_id] = future
+
+    def _store(done):
+        # Runs on the pool's result thread, outside any request
+        with app.app_context():
+            try:
+                store_parameters(user_id, done.result(), review_count)
+            except Exception as e:
+                app.logger.error(f"FSRS optimization failed for user {user_id}: {e}")
+            finally:
+                with _pool_lock:
+                    _running.pop(user_id, None)
+
+    future.add_done_callback(_store)
+    return 'started'
+
+
+def is_optimizing(user_id):
+    with _pool_lock:
+        return user_id in _running
@@ -1,7 +1,12 @@
 from datetime import datetime, timedelta, timezone
 from fsrs import Scheduler, Card, Rating, ReviewLog, State
 import traceback
-from models import db  # Add this import at the top
+import base64
+import binascii
+import json
+from functools import lru_cache
+import numpy as np
+from models import db, ReviewLogs  # Add this import at the top
 import logging
 
 # Get logger
@@ -29,20 +34,79 @@ scheduler = Scheduler(
     enable_fuzzing=True
 )
 
-def get_scheduler():
-    """Get FSRS scheduler instance"""
-    return scheduler
+# Schedulers for per-user parameter sets and per-deck retention targets, most recently used kept
+SCHEDULER_CACHE_SIZE = 64
+
+@lru_cache(maxsize=SCHEDULER_CACHE_SIZE)
+def _scheduler_for(parameters, desired_retention):
+    return Scheduler(
+        parameters=parameters,
+        desired_retention=desired_retention,
+        learning_steps=scheduler.learning_steps,
+        relearning_steps=scheduler.relearning_steps,
+        maximum_interval=scheduler.maximum_interval,
+        enable_fuzzing=scheduler.enable_fuzzing
+    )
+
+def get_scheduler(parameters=None, desired_retention=None):
+    """
+    Get FSRS scheduler instance
+    
+    Args:
+        parameters: Optional 19 FSRS weights; schedulers for custom weights are
+            built once and kept in a bounded LRU keyed by the weights
+        desired_retention: Optional retention target (defaults to the global one)
+    """
+    if not parameters and desired_retention is None:
+        return scheduler
+    return _scheduler_for(
+        tuple(float(w) for w in (parameters or scheduler.parameters)),
+        float(desired_retention) if desired_retention is not None else scheduler.desired_retention
+    )
+
+def get_user_scheduler(user_id, desired_retention=None):
+    """Scheduler with the user's fitted FSRS weights (or the global ones) and an optional retention target"""
+    from models import User
+    
+    # Usually an identity-map hit: the user is loaded for the request already
+    user = db.session.get(User, user_id) if user_id is not None else None
+    return get_scheduler(user.fsrs_parameters if user is not None else None, desired_retention)
+
+def get_vectorized_engine(desired_retention=None, parameters=None):
+    """Array-backed FSRS engine with the scheduler's configuration, for bulk operations"""
+    from services.fsrs_vectorized import VectorizedFSRS
+    return VectorizedFSRS.from_scheduler(get_scheduler(parameters), desired_retention)
 
 def convert_rating(is_correct):
     """Convert binary correct/incorrect to FSRS ratings"""
     return Rating.Good if is_correct else Rating.Again
 
-def process_review(flashcard, is_correct):
-    """Process a review for a flashcard"""
+def process_review(flashcard, is_correct, review_time=None, commit=True, user_id=None):
+    """
+    Process a review for a flashcard
+    
+    Args:
+        flashcard: The flashcard being reviewed
+        is_correct: Whether the answer was correct
+        review_time: When the answer was given (UTC, defaults to now)
+        commit: Commit the session; batch callers pass False and commit once
+        user_id: Reviewing user, whose FSRS weights schedule the card and who
+            owns the review log entry (defaults to the deck owner)
+    """
     try:
         # Get current card state
         fsrs_card = flashcard.get_fsrs_card()
-        now = get_current_time()
+        now = review_time or get_current_time()
+        
+        deck = flashcard.deck
+        if user_id is None:
+            user_id = deck.user_id
+        
+        # Pre-review snapshot for the review log
+        state_before = flashcard.state or NEW_STATE
+        stability_before = flashcard.stability
+        difficulty_before = flashcard.difficulty
+        elapsed_days = (now - fsrs_card.last_review).days if fsrs_card.last_review else None
         
         # Debug the card state before any modifications
         print(f"Processing card {flashcard.flashcard_id} with initial state: step={fsrs_card.step}, state={fsrs_card.state}")
@@ -98,7 +162,9 @@ def process_review(flashcard, is_correct):
         print(f"Card parameters: step={fsrs_card.step}, difficulty={fsrs_card.difficulty}, stability={fsrs_card.stability}")
         
         # Process with FSRS
-        next_card, review_log = scheduler.review_card(fsrs_card, rating, now)
+        # The deck's retention target, saved when its cards were last rescheduled
+        desired_retention = deck.desired_retention if deck is not None else None
+        next_card, review_log = get_user_scheduler(user_id, desired_retention).review_card(fsrs_card, rating, now)
         
         # Update flashcard with new state
         flashcard.fsrs_state = next_card.to_dict()
@@ -119,9 +185,27 @@ def process_review(flashcard, is_correct):
         
         flashcard.last_reviewed = now
         
+        # Append to the review history; written in batches when the session flushes
+        ReviewLogs.queue(
+            db.session,
+            flashcard_id=flashcard.flashcard_id,
+            user_id=user_id,
+            rating=int(rating),
+            reviewed_at=now,
+            elapsed_days=elapsed_days,
+            state_before=state_before,
+            state_after=flashcard.state,
+            stability_before=stability_before,
+            stability_after=flashcard.stability,
+            difficulty_before=difficulty_before,
+            difficulty_after=flashcard.difficulty,
+            scheduled_days=(next_card.due - now).total_seconds() / 86400
+        )
+        
         # Save to database
         db.session.add(flashcard)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return flashcard.due_date, flashcard.retrievability
         
@@ -130,37 +214,339 @@ def process_review(flashcard, is_correct):
         print(traceback.format_exc())
         
         # Simple fallback if FSRS fails
-        now = get_current_time()
+        now = review_time or get_current_time()
         flashcard.last_reviewed = now
             
         db.session.add(flashcard)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return flashcard.due_date, 0.0
 
-def get_due_cards(deck_id, due_only=False, excluded_ids=None, page=1, per_page=None):
+def _bulk_card_rows(*filters):
+    """Scheduling columns of the matching cards, as plain rows"""
+    from models import Flashcards
+    
+    return db.session.query(
+        Flashcards.flashcard_id,
+        Flashcards.flashcard_deck_id,
+        Flashcards.stability,
+        Flashcards.last_reviewed,
+        Flashcards.fsrs_state
+    ).filter(*filters).all()
+
+def _bulk_update_cards(updates):
+    """UPDATE flashcards by primary key in one executemany"""
+    from models import Flashcards
+    from sqlalchemy import update
+    
+    if updates:
+        db.session.execute(update(Flashcards), updates)
+    return len(updates)
+
+def reschedule_cards(deck_id, desired_retention=None, now=None, rng=None, commit=True):
     """
-    Get cards that are due for review from a deck and its sub-decks
+    Recompute due dates of reviewed cards in a deck and its sub-decks
+    
+    Used after the desired retention or the scheduler parameters change. Each
+    card keeps its stability and last review; its next interval and current
+    retrievability are recomputed for the whole subtree at once.
+    
+    Args:
+        deck_id: The root deck ID
+        desired_retention: New target retention, saved on every deck of the
+            subtree so later reviews use it too; by default each deck keeps
+            its saved target (or the scheduler's)
+        now: Reference time for retrievability (UTC, defaults to now)
+        rng: numpy Generator used for interval fuzzing
+        commit: Commit the session when done
+    
+    Returns:
+        Number of cards rescheduled
+    """
+    from models import DeckClosure, FlashcardDecks, Flashcards
+    from services.fsrs_vectorized import to_epoch_seconds, elapsed_days
+    
+    now = now or get_current_time()
+    subtree = DeckClosure.subtree_ids(deck_id)
+    if desired_retention is not None:
+        FlashcardDecks.query.filter(FlashcardDecks.flashcard_deck_id.in_(subtree)).update(
+            {'desired_retention': desired_retention}, synchronize_session=False
+        )
+    
+    rows = _bulk_card_rows(
+        Flashcards.flashcard_deck_id.in_(subtree),
+        Flashcards.state == 2,
+        Flashcards.stability > 0,
+        Flashcards.last_reviewed.isnot(None)
+    )
+    if not rows:
+        return 0
+    
+    engine = get_vectorized_engine()
+    targets = dict(db.session.query(FlashcardDecks.flashcard_deck_id, FlashcardDecks.desired_retention).filter(
+        FlashcardDecks.flashcard_deck_id.in_(subtree)
+    ).all())
+    retention = np.array([
+        targets.get(row.flashcard_deck_id) or engine.desired_retention for row in rows
+    ], dtype=np.float64)
+    stability = np.array([row.stability for row in rows], dtype=np.float64)
+    last_review = to_epoch_seconds([row.last_reviewed for row in rows])
+    
+    intervals = engine.next_interval(stability, retention)
+    if scheduler.enable_fuzzing:
+        intervals = engine.fuzz_interval(intervals, rng)
+    retrievability = engine.retrievability(stability, elapsed_days(last_review, now.timestamp()))
+    
+    updates = []
+    for row, days, r in zip(rows, intervals.tolist(), retrievability.tolist()):
+        last = row.last_reviewed if row.last_reviewed.tzinfo else row.last_reviewed.replace(tzinfo=timezone.utc)
+        due = last + timedelta(days=days)
+        fsrs_state = dict(row.fsrs_state or {})
+        fsrs_state['due'] = due.isoformat()
+        updates.append({
+            'flashcard_id': row.flashcard_id,
+            'due_date': due,
+            'retrievability': r,
+            'fsrs_state': fsrs_state
+        })
+    
+    count = _bulk_update_cards(updates)
+    if commit:
+        db.session.commit()
+    
+    logger.info(f"Rescheduled {count} cards under deck {deck_id}")
+    return count
+
+def refresh_retrievability(deck_id=None, now=None, commit=True):
+    """
+    Store current retrievability for every reviewed card (optionally one deck subtree)
+    
+    The column is otherwise only written at review time, when it is close to 1.
+    
+    Returns:
+        Number of cards updated
+    """
+    from models import DeckClosure, Flashcards
+    from services.fsrs_vectorized import to_epoch_seconds, elapsed_days
+    
+    now = now or get_current_time()
+    filters = [Flashcards.stability > 0, Flashcards.last_reviewed.isnot(None)]
+    if deck_id:
+        filters.append(Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(deck_id)))
+    
+    rows = db.session.query(
+        Flashcards.flashcard_id,
+        Flashcards.stability,
+        Flashcards.last_reviewed
+    ).filter(*filters).all()
+    if not rows:
+        return 0
+    
+    engine = get_vectorized_engine()
+    stability = np.array([row.stability for row in rows], dtype=np.float64)
+    last_review = to_epoch_seconds([row.last_reviewed for row in rows])
+    retrievability = engine.retrievability(stability, elapsed_days(last_review, now.timestamp()))
+    
+    count = _bulk_update_cards([
+        {'flashcard_id': row.flashcard_id, 'retrievability': r}
+        for row, r in zip(rows, retrievability.tolist())
+    ])
+    if commit:
+        db.session.commit()
+    return count
+
+def retrievability_sql(now=None):
+    """
+    Retrievability of each card at ``now`` as a SQL expression
+    
+    Same formula as the vectorized engine; NULL for cards never reviewed.
+    """
+    from models import Flashcards, sql_elapsed_days
+    from sqlalchemy import and_, case, func
+    from services.fsrs_vectorized import DECAY, FACTOR
+    
+    now = now or get_current_time()
+    elapsed = sql_elapsed_days(Flashcards.last_reviewed, now)
+    reviewed = and_(Flashcards.stability > 0, Flashcards.last_reviewed.isnot(None))
+    return case((reviewed, func.power(1 + FACTOR * elapsed / Flashcards.stability, DECAY)))
+
+def sweep_overdue_cards(deck_id, now=None):
+    """
+    Move a deck's overdue learning and mastered cards to the forgotten state
+    
+    Cards go to relearning step 0 and get their current retrievability. The
+    caller commits and, since this bypasses the ORM, refreshes deck counters.
+    
+    Returns:
+        List of updated flashcard IDs
+    """
+    from models import Flashcards
+    from services.fsrs_vectorized import to_epoch_seconds, elapsed_days
+    
+    now = now or get_current_time()
+    rows = _bulk_card_rows(
+        Flashcards.flashcard_deck_id == deck_id,
+        Flashcards.due_date < now,
+        Flashcards.state != NEW_STATE,  # Skip new cards
+        Flashcards.state != 3  # Skip already forgotten cards
+    )
+    if not rows:
+        return []
+    
+    engine = get_vectorized_engine()
+    stability = np.array([row.stability or 0.0 for row in rows], dtype=np.float64)
+    last_review = to_epoch_seconds([row.last_reviewed for row in rows])
+    retrievability = engine.retrievability(stability, elapsed_days(last_review, now.timestamp()))
+    
+    updates = []
+    for row, r in zip(rows, retrievability.tolist()):
+        fsrs_state = dict(row.fsrs_state or {})
+        fsrs_state['state'] = 3
+        fsrs_state['step'] = 0
+        updates.append({
+            'flashcard_id': row.flashcard_id,
+            'state': 3,
+            'fsrs_state': fsrs_state,
+            'retrievability': r
+        })
+    
+    _bulk_update_cards(updates)
+    return [row.flashcard_id for row in rows]
+
+# Study queue composition: each page takes an equal share of forgotten, learning
+# and new cards, fills shortages from the other states in this priority order,
+# and tops up with mastered cards last
+STUDY_STATE_ORDER = (3, 1, 0)
+STUDY_FILL_ORDER = {3: (1, 0, 2), 1: (3, 0, 2), 0: (3, 1, 2)}
+# Largest subtree read deck by deck; each deck adds up to 8 reads to one
+# UNION ALL, which SQLite caps at 500 terms
+STUDY_MERGE_MAX_DECKS = 48
+
+def encode_study_cursor(positions):
+    """
+    Encode per-state keyset positions as an opaque URL-safe token
+    
+    Args:
+        positions: Dict mapping state -> (due_date, flashcard_id) of the last card served
+    """
+    payload = {
+        str(state): [due_date.isoformat() if due_date else None, card_id]
+        for state, (due_date, card_id) in positions.items()
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_study_cursor(token):
+    """Decode a token from encode_study_cursor; raises ValueError if it is malformed"""
+    if not token:
+        return {}
+    
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        return {
+            int(state): (datetime.fromisoformat(due_date) if due_date else None, int(card_id))
+            for state, (due_date, card_id) in payload.items()
+        }
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid study cursor: {e}")
+
+def get_due_cards_page(deck_id, due_only=False, per_page=None, cursor=None):
+    """
+    Get one page of the study queue for a deck and its sub-decks
+    
+    A single query reads each state's next cards deck by deck from the study
+    queue index, starting after the per-state keyset positions in the cursor,
+    and ranks the merged candidates with ROW_NUMBER(). A page reads at most
+    per_page cards per deck and state, so its cost grows with the number of
+    decks in the subtree, not with their cards or the page depth (subtrees
+    over STUDY_MERGE_MAX_DECKS decks fall back to sorting each state).
     
     Args:
         deck_id: The deck ID to fetch cards from
         due_only: Whether to only include cards that are due
-        excluded_ids: DEPRECATED - No longer used, kept for backwards compatibility
-        page: The page number for pagination (1-based)
-        per_page: Number of cards per page, if None returns all cards
+        per_page: Number of cards per page (None uses the default page of 45)
+        cursor: Opaque token returned as next_cursor by the previous page
+    
+    Returns:
+        Tuple of (cards, next_cursor); next_cursor is None when nothing is left
     """
-    from models import FlashcardDecks, Flashcards
-    from sqlalchemy import case
+    from models import DeckClosure, Flashcards
+    from sqlalchemy import select, union_all, func, tuple_, literal
     from sqlalchemy.orm import load_only
     
-    # Only log at debug level, not in production
-    if logger.isEnabledFor(logging.DEBUG):
-        logger.debug(f"Starting get_due_cards for deck_id={deck_id}, due_only={due_only}")
+    positions = decode_study_cursor(cursor)
+    
+    # Targets for each state, distributing the remainder to forgotten then learning
+    cards_per_state = per_page // 3 if per_page else 15
+    remainder = per_page % 3 if per_page else 0
+    targets = {3: cards_per_state, 1: cards_per_state, 0: cards_per_state}
+    if remainder > 0:
+        targets[3] += 1
+        if remainder > 1:
+            targets[1] += 1
+    total_target = sum(targets.values())
+    
+    current_time = get_current_time() if due_only else None
+    subtree = [row[0] for row in DeckClosure.subtree_ids(deck_id).all()]
+    if len(subtree) <= STUDY_MERGE_MAX_DECKS:
+        # Merge per-deck reads, each an ordered range of the study queue index
+        deck_filters = [Flashcards.flashcard_deck_id == subtree_deck for subtree_deck in subtree]
+    else:
+        # Too many reads for one statement: filter the whole subtree and sort
+        deck_filters = [Flashcards.flashcard_deck_id.in_(subtree)]
+    
+    # Study order within a state: cards without a due date first, then by due date
+    def queue_order(due_date, flashcard_id):
+        return (due_date.asc().nulls_first(), flashcard_id.asc())
+    
+    def card_columns():
+        return select(
+            Flashcards.flashcard_id.label('flashcard_id'),
+            Flashcards.state.label('bucket'),
+            Flashcards.due_date.label('due_date')
+        )
     
-    # Optimize queries by selecting only needed columns
-    query = Flashcards.query.options(
+    # Per deck and state, up to total_target cards after the last card served
+    # from that state (any one state may have to fill the whole page): undated
+    # cards by ID, then dated cards by (due_date, ID). Each read is a range of
+    # the (deck, state, due_date, id) index, whichever way the database sorts NULLs.
+    branches = []
+    for state in (0, 1, 2, 3):
+        last_due, last_id = positions.get(state, (None, None))
+        for deck_filter in deck_filters:
+            if last_due is None:
+                undated = card_columns().where(deck_filter, Flashcards.state == state, Flashcards.due_date == None)
+                if last_id is not None:
+                    undated = undated.where(Flashcards.flashcard_id > last_id)
+                branches.append(undated.order_by(Flashcards.flashcard_id).limit(total_target))
+            
+            dated = card_columns().where(deck_filter, Flashcards.state == state, Flashcards.due_date != None)
+            if due_only:
+                dated = dated.where(Flashcards.due_date <= current_time)
+            if last_due is not None:
+                dated = dated.where(tuple_(Flashcards.due_date, Flashcards.flashcard_id) > tuple_(
+                    literal(last_due, Flashcards.due_date.type), literal(last_id, Flashcards.flashcard_id.type)
+                ))
+            branches.append(dated.order_by(Flashcards.due_date, Flashcards.flashcard_id).limit(total_target))
+    branches = [select(branch.subquery()) for branch in branches]
+    
+    # Rank the candidates within each state in the same round trip
+    candidates = union_all(*branches).subquery()
+    ranked = select(
+        candidates.c.flashcard_id,
+        candidates.c.bucket,
+        func.row_number().over(
+            partition_by=candidates.c.bucket,
+            order_by=queue_order(candidates.c.due_date, candidates.c.flashcard_id)
+        ).label('rn')
+    ).subquery()
+    
+    # Any one state may have to fill the whole page, so load up to total_target of each
+    rows = db.session.query(Flashcards, ranked.c.bucket).options(
         load_only(
-            Flashcards.flashcard_id, 
+            Flashcards.flashcard_id,
             Flashcards.question,
             Flashcards.correct_answer,
             Flashcards.incorrect_answers,
@@ -169,252 +555,209 @@ def get_due_cards(deck_id, due_only=False, excluded_ids=None, page=1, per_page=N
             Flashcards.flashcard_deck_id,
             Flashcards.retrievability
         )
-    )
-    
-    # Create recursive CTE to find all decks including this one and its sub-decks
-    cte = db.session.query(
-        FlashcardDecks.flashcard_deck_id.label('id')
+    ).join(
+        ranked, ranked.c.flashcard_id == Flashcards.flashcard_id
     ).filter(
-        FlashcardDecks.flashcard_deck_id == deck_id
-    ).cte(name='study_decks', recursive=True)
-
-    cte = cte.union_all(
-        db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.parent_deck_id == cte.c.id
-        )
-    )
+        ranked.c.rn <= total_target
+    ).order_by(ranked.c.bucket, ranked.c.rn).all()
+    
+    queues = {0: [], 1: [], 2: [], 3: []}
+    for card, bucket in rows:
+        queues[bucket].append(card)
+    taken = {state: 0 for state in queues}
+    
+    def take(state, count):
+        cards = queues[state][taken[state]:taken[state] + max(count, 0)]
+        taken[state] += len(cards)
+        return cards
+    
+    # 1. Allocate the primary target for each state, then
+    # 2. fill shortages from the other states in priority order
+    selected = {state: take(state, targets[state]) for state in STUDY_STATE_ORDER}
+    for state in STUDY_STATE_ORDER:
+        for donor in STUDY_FILL_ORDER[state]:
+            shortage = targets[state] - len(selected[state])
+            if shortage <= 0:
+                break
+            selected[state].extend(take(donor, shortage))
+    
+    # Interleave forgotten, learning and new cards to mix states
+    balanced_cards = []
+    for i in range(max(len(cards) for cards in selected.values())):
+        for state in STUDY_STATE_ORDER:
+            if i < len(selected[state]):
+                balanced_cards.append(selected[state][i])
     
-    # Start with a query for all cards in these decks
-    query = query.filter(
-        Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id))
-    )
+    # If we still don't have enough cards to reach our target, add mastered cards
+    balanced_cards.extend(take(2, total_target - len(balanced_cards)))
     
-    # If due_only is True, filter for only cards that are due today
-    if due_only:
-        current_time = get_current_time()
-        query = query.filter(
-            (Flashcards.due_date <= current_time) | 
-            (Flashcards.due_date == None)  # Include cards without due date
-        )
+    # Advance the keyset for every state that served cards
+    next_positions = dict(positions)
+    for state, count in taken.items():
+        if count:
+            last = queues[state][count - 1]
+            next_positions[state] = (last.due_date, last.flashcard_id)
     
-    # Removed: Excluded IDs filtering code
+    next_cursor = encode_study_cursor(next_positions) if balanced_cards else None
     
-    # Target counts for each state - calculate based on per_page
-    cards_per_state = per_page // 3 if per_page else 15
-    target_forgotten = cards_per_state
-    target_learning = cards_per_state
-    target_new = cards_per_state
-    target_mastered = cards_per_state
+    logger.debug(f"get_due_cards_page returning {len(balanced_cards)} cards for deck {deck_id}")
+    
+    return balanced_cards, next_cursor
 
-    # Handle remainder to reach exact per_page
-    remainder = per_page % 3 if per_page else 0
-    if remainder > 0:
-        target_forgotten += 1
-        if remainder > 1:
-            target_learning += 1
+def get_due_cards(deck_id, due_only=False, excluded_ids=None, page=1, per_page=None, cursor=None):
+    """
+    Get cards that are due for review from a deck and its sub-decks
+    
+    Args:
+        deck_id: The deck ID to fetch cards from
+        due_only: Whether to only include cards that are due
+        excluded_ids: DEPRECATED - No longer used, kept for backwards compatibility
+        page: The page number for pagination (1-based), used when no cursor is given
+        per_page: Number of cards per page, if None returns the default page of 45
+        cursor: Opaque keyset cursor from get_due_cards_page
+    """
+    if cursor is None and page > 1:
+        # Without a cursor, walk forward page by page (each step is one cheap query)
+        for _ in range(page - 1):
+            cards, cursor = get_due_cards_page(deck_id, due_only, per_page, cursor)
+            if cursor is None:
+                return []
+    
+    cards, _ = get_due_cards_page(deck_id, due_only, per_page, cursor)
+    return cards
 
-    # Calculate the total target count (missing variable)
-    total_target = target_forgotten + target_learning + target_new
-    
-    # If we're paginating, adjust targets based on page number
-    if per_page is not None:
-        # For page 1, use default targets
-        # For subsequent pages, adjust proportion of each state
-        if page > 1:
-            # For later pages, we can change the distribution if needed
-            # Here we're keeping it the same
-            pass
-    
-    # Apply pagination at the SQL level if per_page is specified
-    if per_page is not None:
-        # Calculate offset based on page number (1-based indexing)
-        offset = (page - 1) * per_page
-        
-        # Calculate buffer size based on per_page
-        buffer = max(10, per_page // 6)  # Minimum buffer of 10, scales with per_page
-        
-        # Apply LIMIT and OFFSET to the queries to get paginated results
-        forgotten_cards = query.filter(Flashcards.state == 3).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).offset(offset).limit(target_forgotten + buffer).all()  # Add a few extra in case we need them
-        
-        learning_cards = query.filter(Flashcards.state == 1).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).offset(offset).limit(target_learning + buffer).all()  # Add a few extra in case we need them
-        
-        new_cards = query.filter(Flashcards.state == 0).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).offset(offset).limit(target_new + buffer).all()  # Add a few extra in case we need them
-        
-        # For mastered cards, we're less concerned about pagination
-        # since they're only used to fill in when there aren't enough other cards
-        mastered_cards = query.filter(Flashcards.state == 2).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).limit(target_mastered + buffer).all()
-    else:
-        # Use existing code for non-paginated queries
-        forgotten_cards = query.filter(Flashcards.state == 3).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).all()
-        
-        learning_cards = query.filter(Flashcards.state == 1).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).all()
-        
-        new_cards = query.filter(Flashcards.state == 0).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).all()
-        
-        mastered_cards = query.filter(Flashcards.state == 2).order_by(
-            case((Flashcards.due_date == None, 0), else_=1),
-            Flashcards.due_date.asc(),
-            Flashcards.flashcard_id.asc()
-        ).all()
-    
-    # Track available cards for each state
-    available_forgotten = len(forgotten_cards)
-    available_learning = len(learning_cards)
-    available_new = len(new_cards)
-    available_mastered = len(mastered_cards)
-    
-    logger.debug(f"Available cards - Forgotten: {available_forgotten}, Learning: {available_learning}, " +
-                f"New: {available_new}, Mastered: {available_mastered}")
-    
-    # Initialize lists for final selection
-    selected_forgotten = []
-    selected_learning = []
-    selected_new = []
-    
-    # 1. First, allocate the primary target for each state if available
-    selected_forgotten = forgotten_cards[:target_forgotten]
-    selected_learning = learning_cards[:target_learning]
-    selected_new = new_cards[:target_new]
-    
-    # Calculate shortfalls
-    shortage_forgotten = target_forgotten - len(selected_forgotten)
-    shortage_learning = target_learning - len(selected_learning)
-    shortage_new = target_new - len(selected_new)
-    
-    # 2. If there's a shortage in forgotten cards, fill with other types in priority order
-    if shortage_forgotten > 0:
-        logger.debug(f"Shortage of {shortage_forgotten} forgotten cards, filling with other types")
-        
-        # First try to fill with learning cards
-        learning_for_forgotten = min(shortage_forgotten, max(0, available_learning - len(selected_learning)))
-        if learning_for_forgotten > 0:
-            additional_learning = learning_cards[len(selected_learning):len(selected_learning) + learning_for_forgotten]
-            selected_forgotten.extend(additional_learning)
-            shortage_forgotten -= learning_for_forgotten
-        
-        # Then try to fill with new cards
-        if shortage_forgotten > 0:
-            new_for_forgotten = min(shortage_forgotten, max(0, available_new - len(selected_new)))
-            if new_for_forgotten > 0:
-                additional_new = new_cards[len(selected_new):len(selected_new) + new_for_forgotten]
-                selected_forgotten.extend(additional_new)
-                shortage_forgotten -= new_for_forgotten
-        
-        # Finally try with mastered cards
-        if shortage_forgotten > 0:
-            mastered_for_forgotten = min(shortage_forgotten, available_mastered)
-            if mastered_for_forgotten > 0:
-                selected_forgotten.extend(mastered_cards[:mastered_for_forgotten])
-                mastered_cards = mastered_cards[mastered_for_forgotten:]  # Update remaining mastered cards
-    
-    # 3. If there's a shortage in learning cards, fill with other types in priority order
-    if shortage_learning > 0:
-        logger.debug(f"Shortage of {shortage_learning} learning cards, filling with other types")
-        
-        # First try to fill with forgotten cards beyond what we've already used
-        forgotten_for_learning = min(shortage_learning, max(0, available_forgotten - len(selected_forgotten)))
-        if forgotten_for_learning > 0:
-            additional_forgotten = forgotten_cards[len(selected_forgotten):len(selected_forgotten) + forgotten_for_learning]
-            selected_learning.extend(additional_forgotten)
-            shortage_learning -= forgotten_for_learning
-        
-        # Then try to fill with new cards
-        if shortage_learning > 0:
-            new_for_learning = min(shortage_learning, max(0, available_new - len(selected_new)))
-            if new_for_learning > 0:
-                additional_new = new_cards[len(selected_new):len(selected_new) + new_for_learning]
-                selected_learning.extend(additional_new)
-                shortage_learning -= new_for_learning
-        
-        # Finally try with mastered cards
-        if shortage_learning > 0:
-            mastered_for_learning = min(shortage_learning, len(mastered_cards))
-            if mastered_for_learning > 0:
-                selected_learning.extend(mastered_cards[:mastered_for_learning])
-                mastered_cards = mastered_cards[mastered_for_learning:]  # Update remaining mastered cards
-    
-    # 4. If there's a shortage in new cards, fill with other types in priority order
-    if shortage_new > 0:
-        logger.debug(f"Shortage of {shortage_new} new cards, filling with other types")
-        
-        # First try to fill with forgotten cards beyond what we've already used
-        forgotten_for_new = min(shortage_new, max(0, available_forgotten - len(selected_forgotten)))
-        if forgotten_for_new > 0:
-            additional_forgotten = forgotten_cards[len(selected_forgotten):len(selected_forgotten) + forgotten_for_new]
-            selected_new.extend(additional_forgotten)
-            shortage_new -= forgotten_for_new
-        
-        # Then try to fill with learning cards
-        if shortage_new > 0:
-            learning_for_new = min(shortage_new, max(0, available_learning - len(selected_learning)))
-            if learning_for_new > 0:
-                additional_learning = learning_cards[len(selected_learning):len(selected_learning) + learning_for_new]
-                selected_new.extend(additional_learning)
-                shortage_new -= learning_for_new
-        
-        # Finally try with mastered cards
-        if shortage_new > 0:
-            mastered_for_new = min(shortage_new, len(mastered_cards))
-            if mastered_for_new > 0:
-                selected_new.extend(mastered_cards[:mastered_for_new])
-                mastered_cards = mastered_cards[mastered_for_new:]  # Update remaining mastered cards
-    
-    # Combine all cards with a balanced distribution
-    balanced_cards = []
+# Retention histogram buckets: 0-10%, 10-20%, ... 90-100%
+RETENTION_BUCKETS = 10
+
+def _retention_histogram(row):
+    """
+    Decile histogram and mean of retrievability from the stats row
     
-    # Create an interleaved pattern to mix states
-    # We'll alternate between forgotten, learning and new
-    max_cards = max(len(selected_forgotten), len(selected_learning), len(selected_new))
+    Returns:
+        Tuple of (distribution, reviewed_count, mean): distribution maps
+        labels like '30-40%' to card counts; mean is None without data
+    """
+    counts = [int(row[f'bucket_{i}']) for i in range(RETENTION_BUCKETS)]
+    reviewed_count = int(row['reviewed'])
+    total = row['retrievability_sum'] or 0.0
     
-    for i in range(max_cards):
-        if i < len(selected_forgotten):
-            balanced_cards.append(selected_forgotten[i])
-        if i < len(selected_learning):
-            balanced_cards.append(selected_learning[i])
-        if i < len(selected_new):
-            balanced_cards.append(selected_new[i])
+    step = 100 // RETENTION_BUCKETS
+    distribution = {f'{i * step}-{(i + 1) * step}%': counts[i] for i in range(RETENTION_BUCKETS)}
+    return distribution, reviewed_count, (total / reviewed_count if reviewed_count else None)
+
+def _compute_stats(deck_id=None, now=None):
+    """
+    Aggregate FSRS stats in one conditional-aggregation query
     
-    # If we still don't have enough cards to reach our target, add any remaining mastered cards
-    if len(balanced_cards) < total_target and len(mastered_cards) > 0:
-        balanced_cards.extend(mastered_cards[:total_target - len(balanced_cards)])
+    Returns:
+        Tuple of (stats, valid_until): the stats dict and the next time any of
+        the time-dependent figures change on their own (a card falling due or
+        entering the 7-day window, or the day ending), or None if never
+    """
+    from models import DeckClosure, Flashcards, sql_floor
+    from sqlalchemy import func, case, and_, or_
     
-    # Make sure we don't return more than per_page cards if pagination is enabled
-    if per_page is not None and len(balanced_cards) > per_page:
-        balanced_cards = balanced_cards[:per_page]
+    now = now or get_current_time()
+    next_week = now + timedelta(days=7)
+    today_start = datetime.combine(now.date(), datetime.min.time(), timezone.utc)
     
-    logger.debug(f"get_due_cards returning {len(balanced_cards)} cards for page {page}, per_page {per_page}")
+    filters = []
+    if deck_id:
+        # Include all nested sub-decks via the closure table
+        filters.append(Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(deck_id)))
+    
+    def count_where(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+    
+    # Reviewed cards, bucketed by retrievability decile (1.0 lands in the top bucket)
+    reviewed = and_(Flashcards.retrievability > 0, Flashcards.last_reviewed.isnot(None))
+    bucket = sql_floor(Flashcards.retrievability * RETENTION_BUCKETS)
+    buckets = [
+        count_where(and_(reviewed, bucket == i if i < RETENTION_BUCKETS - 1 else bucket >= i)).label(f'bucket_{i}')
+        for i in range(RETENTION_BUCKETS)
+    ]
     
-    return balanced_cards
+    # Upcoming reviews over the next week, one column per calendar day the window touches
+    upcoming_days = [
+        count_where(and_(
+            Flashcards.due_date > now,
+            Flashcards.due_date <= next_week,
+            Flashcards.due_date >= today_start + timedelta(days=offset),
+            Flashcards.due_date < today_start + timedelta(days=offset + 1)
+        )).label(f'day_{offset}')
+        for offset in range(8)
+    ]
+    
+    totals = db.session.query(
+        func.count(Flashcards.flashcard_id).label('total'),
+        # Cards with uninitialized state count as new
+        count_where(or_(Flashcards.state == 0, Flashcards.state.is_(None))).label('new'),
+        count_where(Flashcards.state == 1).label('learning'),
+        count_where(Flashcards.state == 2).label('mastered'),
+        count_where(Flashcards.state == 3).label('forgotten'),
+        count_where(Flashcards.due_date <= now).label('due'),
+        func.min(case((Flashcards.due_date > now, Flashcards.due_date))).label('next_due'),
+        func.min(case((Flashcards.due_date > next_week, Flashcards.due_date))).label('next_in_window'),
+        count_where(reviewed).label('reviewed'),
+        func.sum(case((reviewed, Flashcards.retrievability))).label('retrievability_sum'),
+        *buckets,
+        *upcoming_days
+    ).filter(*filters).one()._mapping
+    
+    total_cards = totals['total'] or 0
+    
+    # Retention histogram and mean over reviewed cards
+    distribution, reviewed_count, mean_retrievability = _retention_histogram(totals)
+    
+    # Percentage of cards reviewed
+    review_coverage = (reviewed_count / total_cards * 100) if total_cards > 0 else 0
+    
+    # Upcoming reviews: today's due cards, then the next week by day
+    upcoming = {}
+    if totals['due']:
+        upcoming[now.date().isoformat()] = int(totals['due'])
+    for offset in range(8):
+        count = int(totals[f'day_{offset}'])
+        if count:
+            key = (now.date() + timedelta(days=offset)).isoformat()
+            upcoming[key] = upcoming.get(key, 0) + count
+    
+    stats = {
+        'total_cards': total_cards,
+        'due_count': int(totals['due']),
+        'reviewed_count': reviewed_count,
+        'review_coverage': round(review_coverage, 1),  # Percentage of cards reviewed
+        'average_retention': mean_retrievability,
+        'has_retention_data': reviewed_count > 0,
+        'has_significant_retention_data': reviewed_count >= 20 or (total_cards > 0 and review_coverage >= 10),
+        'state_counts': {
+            'new': int(totals['new']),
+            'learning': int(totals['learning']),
+            'mastered': int(totals['mastered']),
+            'forgotten': int(totals['forgotten'])
+        },
+        'upcoming_reviews': [
+            {'date': date, 'count': count}
+            for date, count in sorted(upcoming.items())
+        ],
+        'retention_distribution': distribution if reviewed_count else {}
+    }
+    
+    def as_utc(value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    
+    end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    next_in_window = as_utc(totals['next_in_window'])
+    candidates = [end_of_day, as_utc(totals['next_due'])]
+    if next_in_window is not None:
+        candidates.append(next_in_window - timedelta(days=7))
+    valid_until = min(c for c in candidates if c is not None)
+    
+    return stats, valid_until
 
 def get_stats(deck_id=None):
     """
@@ -426,113 +769,44 @@ def get_stats(deck_id=None):
     Returns:
         Dictionary of stats
     """
-    from models import FlashcardDecks, Flashcards
-    from sqlalchemy import func
-    
-    query = Flashcards.query
-    
-    if deck_id:
-        # Use recursive CTE to find all nested sub-decks
-        cte = db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.flashcard_deck_id == deck_id
-        ).cte(name='study_decks', recursive=True)
+    stats, _ = _compute_stats(deck_id)
+    return stats
 
-        cte = cte.union_all(
-            db.session.query(
-                FlashcardDecks.flashcard_deck_id.label('id')
-            ).filter(
-                FlashcardDecks.parent_deck_id == cte.c.id
-            )
-        )
-        
-        query = query.filter(Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id)))
-    
-    # Count cards by state - be more explicit with filtering conditions
-    state_counts = {
-        'new': query.filter(Flashcards.state == 0).count(),
-        'learning': query.filter(Flashcards.state == 1).count(),
-        'mastered': query.filter(Flashcards.state == 2).count(),
-        'forgotten': query.filter(Flashcards.state == 3).count()
-    }
-    
-    # Add a check for cards with uninitialized state
-    uninitialized_count = query.filter(Flashcards.state.is_(None)).count()
-    if uninitialized_count > 0:
-        # Add these to new cards
-        state_counts['new'] += uninitialized_count
-    
-    # Verify the totals add up correctly
-    total = sum(state_counts.values())
-    total_cards = query.count()
-    
-    # Count due cards - use timezone-aware datetime
-    now = get_current_time()
-    due_count = query.filter(Flashcards.due_date <= now).count()
-    
-    # Calculate average retrievability only for cards that have been reviewed
-    reviewed_cards = query.filter(
-        Flashcards.retrievability > 0,
-        Flashcards.last_reviewed.isnot(None)  # Only include cards that have been reviewed
-    )
-    
-    reviewed_count = reviewed_cards.count()
-    
-    # Calculate percentage of cards reviewed
-    review_coverage = (reviewed_count / total_cards * 100) if total_cards > 0 else 0
+def get_cached_stats(deck_id, user_id):
+    """
+    Get stats for a deck from the cache, scoped to the deck owner
     
-    # Only calculate average retention if there are actually reviewed cards
-    # and at least 10% of cards have been reviewed
-    if reviewed_count > 0:
-        avg_retrievability = db.session.query(
-            func.avg(Flashcards.retrievability)
-        ).filter(
-            Flashcards.retrievability > 0,
-            Flashcards.last_reviewed.isnot(None)
-        ).scalar() or 0
-    else:
-        # No review history available
-        avg_retrievability = None
+    Entries live until the owner's next review or deck/card change (which
+    bump their cache version) or until the stats would change with time
+    alone, whichever comes first.
+    """
+    from services.cache_service import get_cache
     
-    # Get upcoming reviews - include already due cards too
-    upcoming = {}
+    cache = get_cache()
+    if cache is None:
+        return get_stats(deck_id)
     
-    # First add today's due cards
-    today = now.date()
-    today_count = query.filter(
-        Flashcards.due_date <= now
-    ).count()
+    key = cache.make_key('stats', f'deck:{deck_id}', user_id)
+    stats = cache.get(key)
+    if stats is None:
+        now = get_current_time()
+        stats, valid_until = _compute_stats(deck_id, now)
+        cache.set(key, stats, timeout=max(1, int((valid_until - now).total_seconds())))
+    return stats
+
+def rollup_deck_stats(now=None, deck_ids=None):
+    """
+    Write today's deck_stats_daily snapshot (all decks, or the given ones)
     
-    if today_count > 0:
-        upcoming[today] = today_count
+    The mean retrievability is computed at the snapshot time in SQL; cards
+    are not written.
     
-    # Then add upcoming cards for the next week
-    next_week = now + timedelta(days=7)
-    future_reviews = query.filter(
-        Flashcards.due_date > now,
-        Flashcards.due_date <= next_week
-    ).all()
-    
-    for card in future_reviews:
-        # Extract just the date part
-        due_date = card.due_date.date()
-        upcoming[due_date] = upcoming.get(due_date, 0) + 1
-    
-    # Format for JSON response
-    formatted_upcoming = [
-        {'date': date.isoformat(), 'count': count}
-        for date, count in sorted(upcoming.items())
-    ]
+    Returns:
+        Number of deck snapshots written
+    """
+    from models import DeckStatsDaily
     
-    return {
-        'total_cards': total_cards,
-        'due_count': due_count,
-        'reviewed_count': reviewed_count,
-        'review_coverage': round(review_coverage, 1),  # Percentage of cards reviewed
-        'average_retention': float(avg_retrievability) if avg_retrievability is not None else None,
-        'has_retention_data': reviewed_count > 0,
-        'has_significant_retention_data': reviewed_count >= 20 or (total_cards > 0 and review_coverage >= 10),
-        'state_counts': state_counts,
-        'upcoming_reviews': formatted_upcoming
-    }
+    now = now or get_current_time()
+    written = DeckStatsDaily.rollup(now, deck_ids)
+    db.session.commit()
+    return written
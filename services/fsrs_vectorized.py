@@ -0,0 +1,366 @@
+"""
+Vectorized FSRS engine for Memoria application.
+Evaluates the FSRS model of the ``fsrs`` package over NumPy arrays, so
+schedules for whole decks can be recomputed in a handful of array operations
+instead of one ``Scheduler.review_card`` call per card.
+"""
+
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fsrs import Card, Rating, Scheduler, State
+
+SECONDS_PER_DAY = 86400.0
+
+# Same constants as the fsrs package
+DECAY = -0.5
+FACTOR = 0.9 ** (1 / DECAY) - 1
+FUZZ_RANGES = (
+    (2.5, 7.0, 0.15),
+    (7.0, 20.0, 0.1),
+    (20.0, math.inf, 0.05),
+)
+
+
+def to_epoch_seconds(values):
+    """Convert datetimes (naive ones are taken as UTC) to an array of epoch seconds; None becomes NaN"""
+    return np.array([
+        np.nan if value is None
+        else (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+        for value in values
+    ], dtype=np.float64)
+
+
+def elapsed_days(last_review, now):
+    """Whole days between last reviews and now, as the fsrs package counts them (NaN when never reviewed)"""
+    last_review = np.asarray(last_review, dtype=np.float64)
+    return np.maximum(np.floor((now - last_review) / SECONDS_PER_DAY), 0.0)
+
+
+class VectorizedFSRS:
+    """
+    FSRS model over arrays of cards
+
+    Mirrors the formulas and state machine of ``fsrs.Scheduler`` (5.x) with the
+    same parameters, desired retention, learning steps and maximum interval.
+    Cards are described by parallel arrays: FSRS state (1=Learning, 2=Review,
+    3=Relearning), step (-1 for none), stability and difficulty (NaN for none),
+    elapsed whole days since the last review (NaN for never reviewed) and the
+    rating (1=Again ... 4=Easy).
+    """
+
+    def __init__(self, parameters, desired_retention=0.9, learning_steps=(),
+                 relearning_steps=(), maximum_interval=36500):
+        self.w = np.asarray(parameters, dtype=np.float64)
+        self.desired_retention = desired_retention
+        self.learning_steps = np.array([s.total_seconds() for s in learning_steps], dtype=np.float64)
+        self.relearning_steps = np.array([s.total_seconds() for s in relearning_steps], dtype=np.float64)
+        self.maximum_interval = maximum_interval
+
+    @classmethod
+    def from_scheduler(cls, scheduler, desired_retention=None):
+        """Build an engine with the configuration of an ``fsrs.Scheduler``"""
+        return cls(
+            parameters=scheduler.parameters,
+            desired_retention=scheduler.desired_retention if desired_retention is None else desired_retention,
+            learning_steps=scheduler.learning_steps,
+            relearning_steps=scheduler.relearning_steps,
+            maximum_interval=scheduler.maximum_interval
+        )
+
+    # Memory model
+
+    def retrievability(self, stability, elapsed):
+        """Probability of recall after ``elapsed`` whole days (0 for cards never reviewed)"""
+        stability = np.asarray(stability, dtype=np.float64)
+        elapsed = np.asarray(elapsed, dtype=np.float64)
+        reviewed = ~np.isnan(elapsed) & (stability > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = (1 + FACTOR * elapsed / stability) ** DECAY
+        return np.where(reviewed, r, 0.0)
+
+    def initial_stability(self, rating):
+        return np.maximum(self.w[np.asarray(rating) - 1], 0.1)
+
+    def initial_difficulty(self, rating):
+        rating = np.asarray(rating, dtype=np.float64)
+        return np.clip(self.w[4] - np.exp(self.w[5] * (rating - 1)) + 1, 1.0, 10.0)
+
+    def next_difficulty(self, difficulty, rating):
+        rating = np.asarray(rating, dtype=np.float64)
+        delta = -(self.w[6] * (rating - 3))
+        damped = difficulty + (10.0 - difficulty) * delta / 9.0
+        reverted = self.w[7] * self.initial_difficulty(Rating.Easy) + (1 - self.w[7]) * damped
+        return np.clip(reverted, 1.0, 10.0)
+
+    def short_term_stability(self, stability, rating):
+        rating = np.asarray(rating, dtype=np.float64)
+        return stability * np.exp(self.w[17] * (rating - 3 + self.w[18]))
+
+    def next_forget_stability(self, difficulty, stability, retrievability):
+        long_term = (
+            self.w[11]
+            * difficulty ** -self.w[12]
+            * ((stability + 1) ** self.w[13] - 1)
+            * np.exp((1 - retrievability) * self.w[14])
+        )
+        short_term = stability / np.exp(self.w[17] * self.w[18])
+        return np.minimum(long_term, short_term)
+
+    def next_recall_stability(self, difficulty, stability, retrievability, rating):
+        rating = np.asarray(rating)
+        hard_penalty = np.where(rating == Rating.Hard, self.w[15], 1.0)
+        easy_bonus = np.where(rating == Rating.Easy, self.w[16], 1.0)
+        return stability * (
+            1
+            + np.exp(self.w[8])
+            * (11 - difficulty)
+            * stability ** -self.w[9]
+            * (np.exp((1 - retrievability) * self.w[10]) - 1)
+            * hard_penalty
+            * easy_bonus
+        )
+
+    def next_stability(self, difficulty, stability, retrievability, rating):
+        rating = np.asarray(rating)
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            return np.where(
+                rating == Rating.Again,
+                self.next_forget_stability(difficulty, stability, retrievability),
+                self.next_recall_stability(difficulty, stability, retrievability, rating)
+            )
+
+    # Intervals
+
+    def next_interval(self, stability, desired_retention=None):
+        """Review intervals in whole days for the given stabilities"""
+        retention = self.desired_retention if desired_retention is None else desired_retention
+        stability = np.asarray(stability, dtype=np.float64)
+        interval = (stability / FACTOR) * (retention ** (1 / DECAY) - 1)
+        # np.round rounds half to even, like Python's round()
+        return np.clip(np.round(interval), 1, self.maximum_interval).astype(np.int64)
+
+    def fuzz_range(self, interval_days):
+        """Lower and upper fuzz bounds for review intervals, as in the fsrs package"""
+        interval_days = np.asarray(interval_days, dtype=np.float64)
+        delta = np.ones_like(interval_days)
+        for start, end, factor in FUZZ_RANGES:
+            delta += factor * np.maximum(np.minimum(interval_days, end) - start, 0.0)
+
+        min_ivl = np.maximum(2, np.round(interval_days - delta))
+        max_ivl = np.minimum(np.round(interval_days + delta), self.maximum_interval)
+        min_ivl = np.minimum(min_ivl, max_ivl)
+        return min_ivl, max_ivl
+
+    def fuzz_interval(self, interval_days, rng=None):
+        """Spread review intervals of 3 days or more over their fuzz range"""
+        rng = rng if rng is not None else np.random.default_rng()
+        interval_days = np.asarray(interval_days, dtype=np.int64)
+        min_ivl, max_ivl = self.fuzz_range(interval_days)
+        fuzzed = rng.random(interval_days.shape) * (max_ivl - min_ivl + 1) + min_ivl
+        fuzzed = np.minimum(np.round(fuzzed), self.maximum_interval).astype(np.int64)
+        return np.where(interval_days < 2.5, interval_days, fuzzed)
+
+    # Reviews
+
+    def _step_intervals(self, steps, step, rating, stability, next_state, next_step, interval, mask):
+        """Learning/relearning step transitions for the cards selected by mask"""
+        count = len(steps)
+        step = np.where(step < 0, 0, step)
+
+        if count == 0:
+            graduate = mask
+        else:
+            graduate = mask & (
+                ((step >= count) & (rating >= Rating.Hard))
+                | (rating == Rating.Easy)
+                | ((rating == Rating.Good) & (step + 1 == count))
+            )
+
+            again = mask & ~graduate & (rating == Rating.Again)
+            next_step[again] = 0
+            interval[again] = steps[0]
+
+            hard = mask & ~graduate & (rating == Rating.Hard)
+            first_hard = steps[0] * 1.5 if count == 1 else (steps[0] + steps[1]) / 2.0
+            interval[hard] = np.where(step[hard] == 0, first_hard, steps[np.minimum(step[hard], count - 1)])
+            next_step[hard] = step[hard]
+
+            good = mask & ~graduate & (rating == Rating.Good)
+            next_step[good] = step[good] + 1
+            interval[good] = steps[np.minimum(step[good] + 1, count - 1)]
+
+        next_state[graduate] = State.Review
+        next_step[graduate] = -1
+        interval[graduate] = self.next_interval(stability[graduate]) * SECONDS_PER_DAY
+
+    def review(self, state, step, stability, difficulty, elapsed, rating):
+        """
+        Review many cards at once
+
+        Returns a dict of arrays: state, step (-1 for none), stability,
+        difficulty and interval in seconds until the next due date. Review
+        intervals are whole days and not fuzzed; pass them through
+        fuzz_interval() to match a scheduler with fuzzing enabled.
+        """
+        state = np.asarray(state, dtype=np.int64)
+        step = np.asarray(step, dtype=np.int64)
+        stability = np.asarray(stability, dtype=np.float64)
+        difficulty = np.asarray(difficulty, dtype=np.float64)
+        elapsed = np.asarray(elapsed, dtype=np.float64)
+        rating = np.asarray(rating, dtype=np.int64)
+
+        # Stability and difficulty
+        initial = (state == State.Learning) & np.isnan(stability) & np.isnan(difficulty)
+        same_day = ~initial & (elapsed < 1)
+        retrievability = self.retrievability(stability, elapsed)
+
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            new_stability = np.where(
+                initial,
+                self.initial_stability(rating),
+                np.where(
+                    same_day,
+                    self.short_term_stability(stability, rating),
+                    self.next_stability(difficulty, stability, retrievability, rating)
+                )
+            )
+            new_difficulty = np.where(
+                initial,
+                self.initial_difficulty(rating),
+                self.next_difficulty(difficulty, rating)
+            )
+
+        # State transitions and intervals
+        next_state = state.copy()
+        next_step = step.copy()
+        interval = np.zeros(state.shape, dtype=np.float64)
+
+        self._step_intervals(self.learning_steps, step, rating, new_stability,
+                             next_state, next_step, interval, state == State.Learning)
+        self._step_intervals(self.relearning_steps, step, rating, new_stability,
+                             next_state, next_step, interval, state == State.Relearning)
+
+        in_review = state == State.Review
+        lapsed = in_review & (rating == Rating.Again) & (len(self.relearning_steps) > 0)
+        next_state[lapsed] = State.Relearning
+        next_step[lapsed] = 0
+        if len(self.relearning_steps):
+            interval[lapsed] = self.relearning_steps[0]
+        kept = in_review & ~lapsed
+        next_step[kept] = -1
+        interval[kept] = self.next_interval(new_stability[kept]) * SECONDS_PER_DAY
+
+        return {
+            'state': next_state,
+            'step': next_step,
+            'stability': new_stability,
+            'difficulty': new_difficulty,
+            'interval': interval
+        }
+
+
+def validate_against_reference(scheduler, samples=5000, seed=0, rtol=1e-9):
+    """
+    Compare the engine with ``fsrs.Scheduler.review_card`` on random cards
+
+    Runs the reference scheduler (with fuzzing turned off) and the engine on
+    the same cards and ratings, checks fuzzed intervals stay inside the
+    engine's fuzz ranges, and returns a report with the largest differences.
+    """
+    reference = Scheduler(
+        parameters=scheduler.parameters,
+        desired_retention=scheduler.desired_retention,
+        learning_steps=scheduler.learning_steps,
+        relearning_steps=scheduler.relearning_steps,
+        maximum_interval=scheduler.maximum_interval,
+        enable_fuzzing=False
+    )
+    engine = VectorizedFSRS.from_scheduler(scheduler)
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    states, steps, stabilities, difficulties, elapsed, ratings = [], [], [], [], [], []
+    expected = {'state': [], 'step': [], 'stability': [], 'difficulty': [], 'interval': []}
+    retrievability_expected = []
+
+    for index in range(samples):
+        state = rng.choice((State.Learning, State.Review, State.Relearning))
+        if state == State.Learning and rng.random() < 0.25:
+            stability = difficulty = last_review = None
+        else:
+            stability = math.exp(rng.uniform(math.log(0.1), math.log(1000)))
+            difficulty = rng.uniform(1.0, 10.0)
+            # Same-day reviews exercise the short-term formulas
+            last_review = now - timedelta(days=rng.choice((0, rng.uniform(0, 1), rng.uniform(1, 400))))
+
+        if state == State.Review:
+            step = None
+        else:
+            step_count = len(reference.learning_steps if state == State.Learning else reference.relearning_steps)
+            step = rng.randrange(step_count + 1)
+
+        card = Card(card_id=index + 1, state=state, step=step, stability=stability,
+                    difficulty=difficulty, due=now, last_review=last_review)
+        rating = rng.choice(tuple(Rating))
+        reviewed, _ = reference.review_card(card, rating, now)
+
+        states.append(int(state))
+        steps.append(-1 if step is None else step)
+        stabilities.append(np.nan if stability is None else stability)
+        difficulties.append(np.nan if difficulty is None else difficulty)
+        elapsed.append(np.nan if last_review is None else (now - last_review).days)
+        ratings.append(int(rating))
+
+        expected['state'].append(int(reviewed.state))
+        expected['step'].append(-1 if reviewed.step is None else reviewed.step)
+        expected['stability'].append(reviewed.stability)
+        expected['difficulty'].append(reviewed.difficulty)
+        expected['interval'].append((reviewed.due - now).total_seconds())
+        retrievability_expected.append(card.get_retrievability(now))
+
+    result = engine.review(states, steps, stabilities, difficulties, elapsed, ratings)
+    expected = {key: np.asarray(values) for key, values in expected.items()}
+
+    def relative_error(actual, wanted):
+        return float(np.max(np.abs(actual - wanted) / np.maximum(np.abs(wanted), 1e-12)))
+
+    report = {
+        'samples': samples,
+        'state_mismatches': int(np.count_nonzero(result['state'] != expected['state'])),
+        'step_mismatches': int(np.count_nonzero(result['step'] != expected['step'])),
+        'interval_mismatches': int(np.count_nonzero(result['interval'] != expected['interval'])),
+        'max_stability_error': relative_error(result['stability'], expected['stability']),
+        'max_difficulty_error': relative_error(result['difficulty'], expected['difficulty']),
+        'max_retrievability_error': float(np.max(np.abs(
+            engine.retrievability(stabilities, elapsed) - np.asarray(retrievability_expected)
+        )))
+    }
+
+    # Fuzzing is random, so check the reference's fuzzed intervals fall in the engine's range
+    fuzz_days = np.arange(1, scheduler.maximum_interval + 1)
+    min_ivl, max_ivl = engine.fuzz_range(fuzz_days)
+    fuzzing = Scheduler(
+        parameters=scheduler.parameters,
+        maximum_interval=scheduler.maximum_interval,
+        enable_fuzzing=True
+    )
+    fuzz_errors = 0
+    for days, low, high in zip(fuzz_days, min_ivl, max_ivl):
+        fuzzed = fuzzing._get_fuzzed_interval(timedelta(days=int(days))).days
+        if days >= 3 and not (low <= fuzzed <= min(high + 1, scheduler.maximum_interval)):
+            fuzz_errors += 1
+    report['fuzz_range_mismatches'] = fuzz_errors
+
+    report['passed'] = (
+        report['state_mismatches'] == 0
+        and report['step_mismatches'] == 0
+        and report['interval_mismatches'] == 0
+        and report['max_stability_error'] <= rtol
+        and report['max_difficulty_error'] <= rtol
+        and report['max_retrievability_error'] <= rtol
+        and fuzz_errors == 0
+    )
+    return report
@@ -0,0 +1,488 @@
+"""
+Job service for Memoria application.
+Durable queue for background imports: one ImportJob row per chunk. Workers
+in any process claim jobs under a lease kept alive by heartbeats, so an
+import survives worker restarts and resumes from its unfinished chunks.
+Failed chunks are retried with exponential backoff and dead-lettered after
+IMPORT_JOB_MAX_ATTEMPTS; a task settles once none of its jobs are open.
+
+Claiming locks candidate rows with SELECT ... FOR UPDATE SKIP LOCKED on
+PostgreSQL. SQLite has no row locks (the clause is dropped), so every claim
+is also a conditional UPDATE that only succeeds while the job is still
+claimable; SQLite serializes writers, which makes that a safe
+compare-and-set.
+"""
+
+import os
+import uuid
+import socket
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, case, func, and_, or_
+from sqlalchemy.orm import aliased
+from config import Config
+from models import db, ImportJob, ImportTask, ImportFile, ImportChunk
+from services.background_service import TaskStatus
+from services.cache_service import invalidate_user_cache
+
+logger = logging.getLogger("job_service")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+# Candidate rows read per claim for each job wanted; the extra ones cover
+# candidates skipped for their task's concurrency limit
+_CANDIDATES_PER_CLAIM = 4
+
+_embedded_worker = None
+_embedded_worker_lock = threading.Lock()
+
+
+def _claimable(now):
+    """Queued jobs past their backoff, and running jobs whose lease ran out"""
+    return or_(
+        and_(ImportJob.status == QUEUED, ImportJob.run_after <= now),
+        and_(ImportJob.status == RUNNING, ImportJob.lease_expires_at <= now)
+    )
+
+
+def enqueue_import_jobs(task_id, file_key, total_chunks):
+    """
+    Queue a job for every chunk of a task that has none yet
+
+    Returns:
+        Number of jobs added
+    """
+    existing = {index for (index,) in db.session.query(ImportJob.chunk_index).filter_by(task_id=task_id)}
+    now = datetime.utcnow()
+    rows = [{
+        'task_id': task_id,
+        'file_key': file_key,
+        'chunk_index': index,
+        'status': QUEUED,
+        'attempts': 0,
+        'run_after': now,
+        'created_at': now,
+        'updated_at': now
+    } for index in range(total_chunks) if index not in existing]
+
+    if rows:
+        db.session.execute(ImportJob.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Lease up to limit claimable jobs to a worker
+
+    No task gets more than IMPORT_CHUNK_CONCURRENCY leased jobs from one
+    claim; concurrent claims by several workers can overshoot that slightly.
+
+    Returns:
+        Rows of (id, task_id, file_key, chunk_index) for the claimed jobs
+    """
+    now = datetime.utcnow()
+    _bury_expired(now)
+
+    leased = aliased(ImportJob)
+    running = select(func.count()).select_from(leased).where(
+        leased.task_id == ImportJob.task_id,
+        leased.status == RUNNING,
+        leased.lease_expires_at > now
+    ).scalar_subquery()
+
+    per_task = max(1, Config.IMPORT_CHUNK_CONCURRENCY)
+    candidates = db.session.execute(
+        select(ImportJob.id, ImportJob.task_id, running.label('running')).where(
+            _claimable(now),
+            running < per_task
+        ).order_by(ImportJob.run_after, ImportJob.id).limit(
+            limit * _CANDIDATES_PER_CLAIM
+        ).with_for_update(skip_locked=True, of=ImportJob)
+    ).all()
+
+    claimed = []
+    taken = {}
+    lease_until = now + timedelta(seconds=Config.IMPORT_JOB_LEASE)
+    for candidate in candidates:
+        if len(claimed) >= limit:
+            break
+        in_flight = taken.get(candidate.task_id, candidate.running)
+        if in_flight >= per_task:
+            continue
+
+        result = db.session.execute(
+            update(ImportJob).where(ImportJob.id == candidate.id, _claimable(now)).values(
+                status=RUNNING,
+                lease_owner=worker_id,
+                lease_expires_at=lease_until,
+                attempts=ImportJob.attempts + 1,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(candidate.id)
+            taken[candidate.task_id] = in_flight + 1
+    db.session.commit()
+
+    if not claimed:
+        return []
+    return db.session.execute(
+        select(ImportJob.id, ImportJob.task_id, ImportJob.file_key, ImportJob.chunk_index).where(
+            ImportJob.id.in_(claimed)
+        ).order_by(ImportJob.id)
+    ).all()
+
+
+def heartbeat_jobs(worker_id, job_ids):
+    """Extend the leases a worker still holds on the given jobs"""
+    if not job_ids:
+        return
+    db.session.execute(
+        update(ImportJob).where(
+            ImportJob.id.in_(list(job_ids)),
+            ImportJob.lease_owner == worker_id,
+            ImportJob.status == RUNNING
+        ).values(
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=Config.IMPORT_JOB_LEASE)
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def complete_job(job_id, worker_id, task_id):
+    """Mark a leased job done and refresh its task's progress"""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(ImportJob).where(
+            ImportJob.id == job_id,
+            ImportJob.lease_owner == worker_id,
+            ImportJob.status == RUNNING
+        ).values(
+            status=DONE,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=None,
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # The lease was lost and the job belongs to another worker now
+        db.session.rollback()
+        return
+
+    _update_progress(task_id, now)
+    db.session.commit()
+    settle_task(task_id)
+
+
+def fail_job(job_id, worker_id, error):
+    """Put a failed job back in the queue after a backoff, or dead-letter it"""
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.lease_owner != worker_id or job.status != RUNNING:
+        db.session.rollback()
+        return
+
+    now = datetime.utcnow()
+    dead = job.attempts >= Config.IMPORT_JOB_MAX_ATTEMPTS
+    backoff = min(Config.IMPORT_JOB_BACKOFF * 2 ** (job.attempts - 1), Config.IMPORT_JOB_BACKOFF_MAX)
+    task_id = job.task_id
+    db.session.execute(
+        update(ImportJob).where(
+            ImportJob.id == job_id,
+            ImportJob.lease_owner == worker_id,
+            ImportJob.status == RUNNING
+        ).values(
+            status=DEAD if dead else QUEUED,
+            run_after=now if dead else now + timedelta(seconds=backoff),
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=error,
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    if dead:
+        settle_task(task_id)
+
+
+def _bury_expired(now):
+    """Dead-letter jobs that lost their lease on their last allowed attempt"""
+    expired = db.session.execute(
+        select(ImportJob.id, ImportJob.task_id).where(
+            ImportJob.status == RUNNING,
+            ImportJob.lease_expires_at <= now,
+            ImportJob.attempts >= Config.IMPORT_JOB_MAX_ATTEMPTS
+        )
+    ).all()
+    if not expired:
+        return
+
+    db.session.execute(
+        update(ImportJob).where(
+            ImportJob.id.in_([job.id for job in expired]),
+            ImportJob.status == RUNNING,
+            ImportJob.lease_expires_at <= now
+        ).values(
+            status=DEAD,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error='Worker lease expired',
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    for task_id in {job.task_id for job in expired}:
+        settle_task(task_id)
+
+
+def _update_progress(task_id, now):
+    """Recount a task's finished chunks and saved cards in one statement"""
+    done = select(func.count()).select_from(ImportJob).where(
+        ImportJob.task_id == task_id,
+        ImportJob.status == DONE
+    ).scalar_subquery()
+    saved = select(ImportFile.total_saved_cards).where(
+        ImportFile.file_key == ImportTask.file_key
+    ).scalar_subquery()
+    db.session.execute(
+        update(ImportTask).where(ImportTask.id == task_id).values(
+            current_chunk=done,
+            progress=case((ImportTask.total_chunks > 0, done * 100 // ImportTask.total_chunks), else_=0),
+            saved_cards=func.coalesce(saved, ImportTask.saved_cards),
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def settle_task(task_id):
+    """
+    Complete or fail a task once none of its jobs are queued or running
+
+    Runs after the caller's commit, so whichever job finishes last sees all
+    the others finished. The update only applies to a task that is still
+    open, which makes repeated calls harmless.
+    """
+    counts = dict(db.session.query(ImportJob.status, func.count()).filter(
+        ImportJob.task_id == task_id
+    ).group_by(ImportJob.status).all())
+    if counts.get(QUEUED) or counts.get(RUNNING):
+        return
+
+    now = datetime.utcnow()
+    dead = counts.get(DEAD, 0)
+    error = None
+    if dead:
+        last_error = db.session.query(ImportJob.last_error).filter(
+            ImportJob.task_id == task_id, ImportJob.status == DEAD
+        ).order_by(ImportJob.updated_at.desc()).limit(1).scalar()
+        error = f"{dead} chunk(s) failed: {last_error}"
+
+    _update_progress(task_id, now)
+    values = {'status': TaskStatus.FAILED, 'error': error} if dead else {'status': TaskStatus.COMPLETED, 'progress': 100}
+    db.session.execute(
+        update(ImportTask).where(
+            ImportTask.id == task_id,
+            ImportTask.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING])
+        ).values(completed_at=now, updated_at=now, **values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def has_claimable_jobs():
+    """Whether any job could be claimed now or after its backoff"""
+    now = datetime.utcnow()
+    return db.session.query(ImportJob.id).filter(or_(
+        ImportJob.status == QUEUED,
+        and_(ImportJob.status == RUNNING, ImportJob.lease_expires_at <= now)
+    )).first() is not None
+
+
+def requeue_dead_jobs(task_ids=None):
+    """
+    Give dead-lettered jobs a fresh set of attempts and reopen their tasks
+
+    Tasks left running without jobs (started before the queue existed) get
+    jobs for their chunks as well.
+
+    Returns:
+        Number of jobs requeued or added
+    """
+    now = datetime.utcnow()
+    query = db.session.query(ImportJob.task_id).filter(ImportJob.status == DEAD)
+    if task_ids:
+        query = query.filter(ImportJob.task_id.in_(task_ids))
+    reopen = {task_id for (task_id,) in query.distinct()}
+
+    stranded = db.session.query(ImportTask).filter(
+        ImportTask.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING]),
+        ~select(ImportJob.id).where(ImportJob.task_id == ImportTask.id).exists()
+    )
+    if task_ids:
+        stranded = stranded.filter(ImportTask.id.in_(task_ids))
+    stranded = stranded.all()
+
+    requeued = 0
+    if reopen:
+        requeued += db.session.execute(
+            update(ImportJob).where(
+                ImportJob.task_id.in_(reopen),
+                ImportJob.status == DEAD
+            ).values(
+                status=QUEUED, attempts=0, run_after=now, updated_at=now
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.execute(
+            update(ImportTask).where(ImportTask.id.in_(reopen)).values(
+                status=TaskStatus.RUNNING, error=None, completed_at=None, updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    for task in stranded:
+        import_file = ImportFile.query.filter_by(file_key=task.file_key).first()
+        if import_file is not None:
+            task.status = TaskStatus.RUNNING
+            task.total_chunks = import_file.total_chunks
+            requeued += enqueue_import_jobs(task.id, task.file_key, import_file.total_chunks)
+    db.session.commit()
+
+    return requeued
+
+
+class ImportWorker:
+    """
+    Claims import jobs and runs them on a pool of threads
+
+    The loop claims jobs while threads are free, renews the leases of the
+    running ones every IMPORT_JOB_HEARTBEAT seconds and otherwise sleeps for
+    IMPORT_WORKER_POLL seconds (or until woken). A job whose chunk was
+    already processed, because a previous worker died after saving it but
+    before completing the job, is completed without calling the model again.
+    """
+
+    def __init__(self, app, concurrency=None, worker_id=None):
+        self.app = app
+        self.concurrency = max(1, concurrency or Config.IMPORT_WORKERS)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+
+    def wake(self):
+        """Claim new jobs now instead of at the next poll"""
+        self.wake_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def run(self, drain=False):
+        """
+        Process jobs until stopped
+
+        Args:
+            drain: Return once no job is running or waiting to be claimed
+        """
+        active = {}
+        last_heartbeat = datetime.utcnow()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='import-job')
+        logger.info(f"Import worker {self.worker_id} started with {self.concurrency} threads")
+
+        with self.app.app_context():
+            try:
+                while not self.stop_event.is_set():
+                    claimed = []
+                    try:
+                        if len(active) < self.concurrency:
+                            claimed = claim_jobs(self.worker_id, self.concurrency - len(active))
+                        for job in claimed:
+                            active[pool.submit(self._run, job)] = job.id
+
+                        if active and datetime.utcnow() - last_heartbeat >= timedelta(seconds=Config.IMPORT_JOB_HEARTBEAT):
+                            heartbeat_jobs(self.worker_id, list(active.values()))
+                            last_heartbeat = datetime.utcnow()
+
+                        if drain and not active and not has_claimable_jobs():
+                            break
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"Import worker {self.worker_id} error: {str(e)}")
+
+                    if claimed and len(active) < self.concurrency:
+                        continue
+                    if active:
+                        finished, _ = wait(list(active), timeout=Config.IMPORT_WORKER_POLL, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            active.pop(future)
+                    else:
+                        self.wake_event.wait(Config.IMPORT_WORKER_POLL)
+                        self.wake_event.clear()
+            finally:
+                pool.shutdown(wait=True)
+                logger.info(f"Import worker {self.worker_id} stopped")
+
+    def _run(self, job):
+        from services.chunk_service import process_file_chunk_batch
+
+        with self.app.app_context():
+            try:
+                task = db.session.get(ImportTask, job.task_id)
+                if not _chunk_processed(job.file_key, job.chunk_index):
+                    result = process_file_chunk_batch(self.app.gemini_client, job.file_key, job.chunk_index)
+                    if 'error' in result:
+                        raise RuntimeError(result['error'])
+                    # Cards were saved outside of a request, so invalidate the owner's cache here
+                    if task is not None and result.get('cards_saved'):
+                        invalidate_user_cache(task.user_id)
+                complete_job(job.id, self.worker_id, job.task_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Import job {job.id} (chunk {job.chunk_index}) failed: {str(e)}")
+                try:
+                    fail_job(job.id, self.worker_id, str(e))
+                except Exception as fail_error:
+                    # The lease runs out and the job is claimed again
+                    db.session.rollback()
+                    logger.error(f"Could not record failure of import job {job.id}: {str(fail_error)}")
+
+
+def _chunk_processed(file_key, chunk_index):
+    return db.session.query(ImportChunk.id).join(
+        ImportFile, ImportFile.id == ImportChunk.file_id
+    ).filter(
+        ImportFile.file_key == file_key,
+        ImportChunk.index == chunk_index,
+        ImportChunk.is_processed.is_(True)
+    ).first() is not None
+
+
+def start_import_worker(app):
+    """
+    Run an ImportWorker in a daemon thread of this process (once)
+
+    Does nothing in multiprocessing children (the PDF and optimizer pools),
+    which import the app but must never claim jobs.
+    """
+    global _embedded_worker
+    if _embedded_worker is not None or multiprocessing.parent_process() is not None:
+        return _embedded_worker
+    with _embedded_worker_lock:
+        if _embedded_worker is None:
+            _embedded_worker = ImportWorker(app)
+            thread = threading.Thread(target=_embedded_worker.run, name='import-worker')
+            thread.daemon = True
+            thread.start()
+        return _embedded_worker
+
+
+def wake_import_worker():
+    """Have this process's embedded worker, if any, look for new jobs now"""
+    if _embedded_worker is not None:
+        _embedded_worker.wake()
@@ -0,0 +1,242 @@
+"""
+LLM service for Memoria application.
+Single gateway for Gemini calls. Call sites that opt in (by passing a
+cache_site name) share a disk-backed response cache keyed on the model,
+generation config and prompt, with age- and size-based eviction and
+per-site hit/miss counters.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger("llm_service")
+
+_cache = None
+_cache_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class LLMResponse:
+    """Cached stand-in for a Gemini response; call sites only read .text"""
+
+    def __init__(self, text):
+        self.text = text
+        self.cached = True
+
+
+class LLMResponseCache:
+    """
+    Response texts in a local SQLite file shared by all worker processes
+
+    Entries older than max_age seconds are dropped when read and on every
+    write; when the stored texts exceed max_bytes the least recently used
+    entries are evicted down to 90% of the limit.
+    """
+
+    def __init__(self, path, max_bytes, max_age):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now - self.max_age:
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, model, text):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text, len(text.encode('utf-8')), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM llm_responses WHERE created_at <= ?", (now - self.max_age,))
+        total = conn.execute("SELECT total(size) FROM llm_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - 0.9 * self.max_bytes
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM llm_responses ORDER BY accessed_at"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM llm_responses WHERE key = ?", doomed)
+        logger.info(f"Evicted {len(doomed)} cached LLM responses")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def usage(self):
+        """Number of entries and bytes of response text stored"""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT count(*), total(size) FROM llm_responses").fetchone()
+        return {'entries': entries, 'bytes': int(size)}
+
+
+def get_llm_cache():
+    """Return the shared response cache, or None when it is disabled or unavailable"""
+    global _cache
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = LLMResponseCache(
+                    Config.LLM_CACHE_PATH,
+                    max_bytes=Config.LLM_CACHE_MAX_MB * 1024 * 1024,
+                    max_age=Config.LLM_CACHE_MAX_AGE_DAYS * 86400
+                )
+            except Exception as e:
+                logger.error(f"LLM response cache unavailable: {e}")
+                return None
+        return _cache
+
+
+def _site_enabled(site):
+    return site is not None and ('*' in Config.LLM_CACHE_SITES or site in Config.LLM_CACHE_SITES)
+
+
+def _canonical(value):
+    """JSON-serializable form of prompt contents and generation configs"""
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(mode='json', exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    return value
+
+
+def cache_key(model, contents, config=None):
+    """SHA-256 over the model, generation config and prompt"""
+    payload = json.dumps(
+        {'model': model, 'config': _canonical(config), 'contents': _canonical(contents)},
+        sort_keys=True, default=repr
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _count(site, name):
+    with _stats_lock:
+        counters = _stats.setdefault(site, {'hits': 0, 'misses': 0, 'calls': 0, 'stores': 0, 'errors': 0})
+        counters[name] += 1
+
+
+def _cacheable_text(response, config):
+    """The response text if it is worth keeping: non-empty, and valid JSON when JSON was requested"""
+    try:
+        text = response.text
+    except Exception:
+        return None
+    if not text or not text.strip():
+        return None
+    if getattr(config, 'response_mime_type', None) == 'application/json':
+        try:
+            json.loads(text)
+        except ValueError:
+            return None
+    return text
+
+
+def generate(client, model, contents, config=None, cache_site=None):
+    """
+    Call Gemini's generate_content, through the response cache when enabled
+
+    Args:
+        client: google.genai client
+        model, contents, config: As for client.models.generate_content
+        cache_site: Name of the call site; responses are only cached for
+            named sites enabled in Config.LLM_CACHE_SITES
+
+    Returns:
+        The Gemini response, or an LLMResponse holding the cached text
+    """
+    site = cache_site or 'uncached'
+    cache = get_llm_cache() if _site_enabled(cache_site) else None
+
+    key = None
+    if cache is not None:
+        key = cache_key(model, contents, config)
+        try:
+            text = cache.get(key)
+        except Exception as e:
+            logger.error(f"LLM cache read failed: {e}")
+            text = None
+        if text is not None:
+            _count(site, 'hits')
+            return LLMResponse(text)
+        _count(site, 'misses')
+
+    try:
+        response = client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception:
+        _count(site, 'errors')
+        raise
+    _count(site, 'calls')
+
+    if cache is not None:
+        text = _cacheable_text(response, config)
+        if text is not None:
+            try:
+                cache.set(key, model, text)
+                _count(site, 'stores')
+            except Exception as e:
+                logger.error(f"LLM cache write failed: {e}")
+    return response
+
+
+def get_llm_stats():
+    """Per-site counters for this worker plus the shared cache's size"""
+    with _stats_lock:
+        sites = {site: dict(counters) for site, counters in _stats.items()}
+    for counters in sites.values():
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+
+    cache = get_llm_cache()
+    return {
+        'enabled': cache is not None,
+        'sites': sites,
+        'cache': cache.usage() if cache is not None else None
+    }
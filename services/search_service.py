@@ -0,0 +1,584 @@
+"""
+Search service for Memoria application.
+Full-text search over flashcards and decks, backed by SQLite FTS5 tables or
+Postgres tsvector columns with GIN indexes. Matching, ranking (bm25 /
+ts_rank), visibility scoping and pagination all happen in the query.
+
+When the exact query finds only a few results, a trigram similarity search
+(pg_trgm, or a trigram postings table on SQLite) tops them up so typos
+still find something.
+"""
+
+import re
+import logging
+from sqlalchemy import (
+    text, table, column, literal, literal_column, func, or_, select, union_all, case, event, inspect
+)
+from sqlalchemy.orm import Session
+from models import db, FlashcardDecks, Flashcards
+
+logger = logging.getLogger("search_service")
+
+# Postgres text search configuration. Unstemmed on both backends: queries are
+# prefix matches, and a stemmed prefix misses longer forms ("mitochondria*"
+# would not match the stem of "mitochondrial")
+TS_CONFIG = 'simple'
+
+# bm25 column weights (SQLite): questions/deck names outrank answers/descriptions, which outrank distractors
+CARD_WEIGHTS = (10.0, 5.0, 3.0)    # question, correct_answer, incorrect_answers
+DECK_WEIGHTS = (10.0, 5.0)         # name, description
+
+# SQLite: FTS5 tables whose rowid is the base table's primary key,
+# maintained by triggers so ORM writes, bulk SQL and cascades all stay in sync
+_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS flashcards_fts USING fts5(
+        question, correct_answer, incorrect_answers,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS flashcards_fts_insert AFTER INSERT ON flashcards BEGIN
+        INSERT INTO flashcards_fts (rowid, question, correct_answer, incorrect_answers)
+        VALUES (new.flashcard_id, new.question, new.correct_answer, new.incorrect_answers);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flashcards_fts_update
+    AFTER UPDATE OF question, correct_answer, incorrect_answers ON flashcards BEGIN
+        DELETE FROM flashcards_fts WHERE rowid = old.flashcard_id;
+        INSERT INTO flashcards_fts (rowid, question, correct_answer, incorrect_answers)
+        VALUES (new.flashcard_id, new.question, new.correct_answer, new.incorrect_answers);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flashcards_fts_delete AFTER DELETE ON flashcards BEGIN
+        DELETE FROM flashcards_fts WHERE rowid = old.flashcard_id;
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS flashcard_decks_fts USING fts5(
+        name, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS flashcard_decks_fts_insert AFTER INSERT ON flashcard_decks BEGIN
+        INSERT INTO flashcard_decks_fts (rowid, name, description)
+        VALUES (new.flashcard_deck_id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flashcard_decks_fts_update
+    AFTER UPDATE OF name, description ON flashcard_decks BEGIN
+        DELETE FROM flashcard_decks_fts WHERE rowid = old.flashcard_deck_id;
+        INSERT INTO flashcard_decks_fts (rowid, name, description)
+        VALUES (new.flashcard_deck_id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flashcard_decks_fts_delete AFTER DELETE ON flashcard_decks BEGIN
+        DELETE FROM flashcard_decks_fts WHERE rowid = old.flashcard_deck_id;
+    END""",
+)
+
+_SQLITE_REBUILD = (
+    "DELETE FROM flashcards_fts",
+    """INSERT INTO flashcards_fts (rowid, question, correct_answer, incorrect_answers)
+    SELECT flashcard_id, question, correct_answer, incorrect_answers FROM flashcards""",
+    "INSERT INTO flashcards_fts (flashcards_fts) VALUES ('optimize')",
+    "DELETE FROM flashcard_decks_fts",
+    """INSERT INTO flashcard_decks_fts (rowid, name, description)
+    SELECT flashcard_deck_id, name, description FROM flashcard_decks""",
+    "INSERT INTO flashcard_decks_fts (flashcard_decks_fts) VALUES ('optimize')",
+)
+
+# Postgres: stored generated tsvector columns, so the database keeps them in sync
+_POSTGRES_DDL = (
+    f"""ALTER TABLE flashcards ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(correct_answer, '')), 'B') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(incorrect_answers::text, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS idx_flashcards_search_vector ON flashcards USING GIN (search_vector)",
+    f"""ALTER TABLE flashcard_decks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS idx_flashcard_decks_search_vector ON flashcard_decks USING GIN (search_vector)",
+)
+
+_POSTGRES_REBUILD = (
+    "REINDEX INDEX idx_flashcards_search_vector",
+    "REINDEX INDEX idx_flashcard_decks_search_vector",
+)
+
+_POSTGRES_TRIGRAM_REBUILD = (
+    "REINDEX INDEX idx_flashcards_question_trgm",
+    "REINDEX INDEX idx_flashcards_answer_trgm",
+    "REINDEX INDEX idx_flashcard_decks_name_trgm",
+)
+
+# Fuzzy fallback: runs when the exact query matches fewer results than this
+FUZZY_FALLBACK_THRESHOLD = 5
+# Share of the query's trigrams a result must contain
+FUZZY_SIMILARITY_THRESHOLD = 0.5
+# Most fuzzy results returned, and most query trigrams considered
+FUZZY_RESULT_LIMIT = 100
+MAX_QUERY_TRIGRAMS = 32
+# SQLite: postings read per query trigram, which bounds the work of a fuzzy
+# query regardless of corpus size (very common trigrams are truncated)
+TRIGRAM_POSTINGS_LIMIT = 2000
+
+# Document types in the SQLite trigram postings table
+TRIGRAM_DOC_CARD = 1
+TRIGRAM_DOC_DECK = 2
+# Queue entries for the cards of a deck whose owner or visibility changed
+_TRIGRAM_DECK_CARDS = 3
+
+# Postings are keyed by who may see the document: public decks and their cards
+# under TRIGRAM_SCOPE_PUBLIC, private ones under the owner's user id. A search
+# reads the searcher's scope and the public one, so each trigram read is an
+# index range over visible documents only and the limit applies after scoping.
+TRIGRAM_SCOPE_PUBLIC = 0
+TRIGRAM_SCOPE_NONE = -1  # Private decks without an owner
+
+_SQLITE_TRIGRAM_DDL = (
+    """CREATE TABLE IF NOT EXISTS search_trigrams (
+        doc_type SMALLINT NOT NULL,
+        scope INTEGER NOT NULL,
+        trigram TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        PRIMARY KEY (doc_type, scope, trigram, doc_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_search_trigrams_doc ON search_trigrams (doc_type, doc_id)",
+)
+
+_POSTGRES_TRIGRAM_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS idx_flashcards_question_trgm ON flashcards USING GIN (question gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_flashcards_answer_trgm ON flashcards USING GIN (correct_answer gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_flashcard_decks_name_trgm ON flashcard_decks USING GIN (name gin_trgm_ops)",
+)
+
+_TRIGRAM_QUEUE_KEY = '_search_trigram_queue'
+# Documents read per batch when rebuilding the postings
+TRIGRAM_BATCH_SIZE = 1000
+
+_flashcards_fts = table('flashcards_fts', column('rowid'))
+_decks_fts = table('flashcard_decks_fts', column('rowid'))
+_search_trigrams = table('search_trigrams', column('doc_type'), column('scope'), column('trigram'), column('doc_id'))
+
+_pg_trgm_installed = None
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def ensure_search_index():
+    """
+    Create the full-text and trigram index structures if they are missing
+
+    On SQLite the FTS tables and trigram postings are filled from the base
+    tables the first time they are created; Postgres computes generated
+    columns and trigram indexes itself.
+    """
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'sqlite':
+            existing = connection.execute(
+                text("SELECT name FROM sqlite_master WHERE name IN ('flashcards_fts', 'flashcard_decks_fts')")
+            ).scalars().all()
+            trigram_columns = connection.execute(
+                text("SELECT name FROM pragma_table_info('search_trigrams')")
+            ).scalars().all()
+            if trigram_columns and 'scope' not in trigram_columns:
+                # Postings from before they were keyed by visibility
+                connection.execute(text("DROP TABLE search_trigrams"))
+            has_trigrams = 'scope' in trigram_columns
+            for ddl in _SQLITE_DDL + _SQLITE_TRIGRAM_DDL:
+                connection.execute(text(ddl))
+            if len(existing) < 2:
+                for statement in _SQLITE_REBUILD:
+                    connection.execute(text(statement))
+                logger.info("Built full-text search index.")
+            if not has_trigrams:
+                _rebuild_trigrams(connection)
+                logger.info("Built trigram search index.")
+        elif dialect == 'postgresql':
+            for ddl in _POSTGRES_DDL:
+                connection.execute(text(ddl))
+        else:
+            logger.warning(f"Full-text search is not supported on {dialect}")
+
+    if dialect == 'postgresql':
+        # Separate transaction: the extension may need privileges the app lacks
+        try:
+            with db.engine.begin() as connection:
+                for ddl in _POSTGRES_TRIGRAM_DDL:
+                    connection.execute(text(ddl))
+        except Exception as e:
+            logger.warning(f"pg_trgm unavailable, fuzzy search disabled: {e}")
+
+
+def _has_pg_trgm():
+    """Whether the pg_trgm extension is installed (checked once per process)"""
+    global _pg_trgm_installed
+    if _pg_trgm_installed is None:
+        _pg_trgm_installed = db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _pg_trgm_installed
+
+
+def rebuild_search_index():
+    """Rebuild the full-text and trigram indexes from the flashcards and decks tables"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'sqlite':
+            statements = _SQLITE_REBUILD
+        else:
+            statements = _POSTGRES_REBUILD + (_POSTGRES_TRIGRAM_REBUILD if _has_pg_trgm() else ())
+        for statement in statements:
+            connection.execute(text(statement))
+        if dialect == 'sqlite':
+            _rebuild_trigrams(connection)
+
+    return {
+        'cards': db.session.query(func.count(Flashcards.flashcard_id)).scalar(),
+        'decks': db.session.query(func.count(FlashcardDecks.flashcard_deck_id)).scalar()
+    }
+
+
+def trigrams(value):
+    """
+    Trigrams of a text, as pg_trgm extracts them
+
+    Words are lower-cased alphanumeric runs padded with two leading spaces
+    and one trailing space, so "cat" gives "  c", " ca", "cat" and "at ".
+    """
+    grams = set()
+    for word in re.findall(r'[^\W_]+', (value or '').lower()):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _card_text(question, answer):
+    return f'{question or ""} {answer or ""}'
+
+
+def _trigram_scope():
+    """Postings scope of a deck and its cards"""
+    return case(
+        (FlashcardDecks.is_public.is_(True), TRIGRAM_SCOPE_PUBLIC),
+        else_=func.coalesce(FlashcardDecks.user_id, TRIGRAM_SCOPE_NONE)
+    )
+
+
+def _trigram_sources():
+    """(doc_type, statement) pairs selecting (doc_id, scope, text...) for each document type"""
+    return (
+        (TRIGRAM_DOC_CARD, select(
+            Flashcards.flashcard_id, _trigram_scope(), Flashcards.question, Flashcards.correct_answer
+        ).join(FlashcardDecks, Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id)),
+        (TRIGRAM_DOC_DECK, select(
+            FlashcardDecks.flashcard_deck_id, _trigram_scope(), FlashcardDecks.name
+        )),
+    )
+
+
+def _document(doc_type, row):
+    """(doc_id, scope, text) of a row from _trigram_sources()"""
+    if doc_type == TRIGRAM_DOC_CARD:
+        return row[0], row[1], _card_text(row[2], row[3])
+    return row[0], row[1], row[2]
+
+
+def _write_trigrams(connection, doc_type, doc_ids, documents):
+    """Replace the postings of doc_ids with those of (doc_id, scope, text) documents"""
+    # Plain DBAPI executemany: postings run to dozens of rows per document.
+    # New documents are cleared too, as SQLite can reuse a deleted row's id.
+    if doc_ids:
+        connection.exec_driver_sql(
+            "DELETE FROM search_trigrams WHERE doc_type = ? AND doc_id = ?",
+            [(doc_type, doc_id) for doc_id in doc_ids]
+        )
+    rows = [
+        (doc_type, scope, gram, doc_id)
+        for doc_id, scope, value in documents
+        for gram in trigrams(value)
+    ]
+    if rows:
+        connection.exec_driver_sql(
+            "INSERT INTO search_trigrams (doc_type, scope, trigram, doc_id) VALUES (?, ?, ?, ?)", rows
+        )
+
+
+def _rebuild_trigrams(connection):
+    """Rebuild the SQLite trigram postings, reading the base tables in batches"""
+    connection.execute(_search_trigrams.delete())
+    for doc_type, statement in _trigram_sources():
+        last_id = 0
+        key = statement.selected_columns[0]
+        statement = statement.order_by(key)
+        while True:
+            batch = connection.execute(
+                statement.where(key > last_id).limit(TRIGRAM_BATCH_SIZE)
+            ).all()
+            if not batch:
+                break
+            _write_trigrams(connection, doc_type, [], [_document(doc_type, row) for row in batch])
+            last_id = batch[-1][0]
+
+
+def _queue_trigrams(target, doc_type, doc_id):
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault(_TRIGRAM_QUEUE_KEY, set()).add((doc_type, doc_id))
+
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@event.listens_for(Flashcards, 'after_insert')
+@event.listens_for(Flashcards, 'after_delete')
+def _card_trigrams_changed(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _queue_trigrams(target, TRIGRAM_DOC_CARD, target.flashcard_id)
+
+
+@event.listens_for(Flashcards, 'after_update')
+def _card_trigrams_after_update(mapper, connection, target):
+    # Moving a card to another deck can change who may see it
+    if connection.dialect.name == 'sqlite' and _changed(target, 'question', 'correct_answer', 'flashcard_deck_id'):
+        _queue_trigrams(target, TRIGRAM_DOC_CARD, target.flashcard_id)
+
+
+@event.listens_for(FlashcardDecks, 'after_insert')
+@event.listens_for(FlashcardDecks, 'after_delete')
+def _deck_trigrams_changed(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        _queue_trigrams(target, TRIGRAM_DOC_DECK, target.flashcard_deck_id)
+
+
+@event.listens_for(FlashcardDecks, 'after_update')
+def _deck_trigrams_after_update(mapper, connection, target):
+    if connection.dialect.name != 'sqlite':
+        return
+    if _changed(target, 'name', 'user_id', 'is_public'):
+        _queue_trigrams(target, TRIGRAM_DOC_DECK, target.flashcard_deck_id)
+    if _changed(target, 'user_id', 'is_public'):
+        # The deck's cards move to the new scope with it
+        _queue_trigrams(target, _TRIGRAM_DECK_CARDS, target.flashcard_deck_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _flush_trigrams(session, flush_context):
+    """
+    Rewrite the postings of queued documents in the flush's transaction
+
+    Text and scope are read back from the flushed rows, so documents that no
+    longer exist simply lose their postings.
+    """
+    queued = session.info.pop(_TRIGRAM_QUEUE_KEY, None)
+    if not queued:
+        return
+
+    connection = session.connection()
+    deck_ids = sorted(doc_id for kind, doc_id in queued if kind == _TRIGRAM_DECK_CARDS)
+    for doc_type, statement in _trigram_sources():
+        key = statement.selected_columns[0]
+        doc_ids = sorted(doc_id for kind, doc_id in queued if kind == doc_type)
+        for start in range(0, len(doc_ids), TRIGRAM_BATCH_SIZE):
+            batch = doc_ids[start:start + TRIGRAM_BATCH_SIZE]
+            rows = connection.execute(statement.where(key.in_(batch))).all()
+            _write_trigrams(connection, doc_type, batch, [_document(doc_type, row) for row in rows])
+
+        if doc_type == TRIGRAM_DOC_CARD and deck_ids:
+            rows = connection.execute(statement.where(Flashcards.flashcard_deck_id.in_(deck_ids))).all()
+            _write_trigrams(connection, doc_type, [row[0] for row in rows],
+                            [_document(doc_type, row) for row in rows])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_trigrams(session):
+    session.info.pop(_TRIGRAM_QUEUE_KEY, None)
+
+
+def search_terms(query):
+    """Lower-cased word tokens of a user query (operators and punctuation dropped)"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _match_expression(terms, dialect):
+    """Any-term prefix query: ``"a"* OR "b"*`` for FTS5, ``a:* | b:*`` for tsquery"""
+    if dialect == 'sqlite':
+        return ' OR '.join(f'"{term}"*' for term in terms)
+    return ' | '.join(f'{term}:*' for term in terms)
+
+
+def visible_decks_filter(user_id=None):
+    """Decks a user may search: their own plus public ones (public only when anonymous)"""
+    if user_id is None:
+        return FlashcardDecks.is_public.is_(True)
+    return or_(FlashcardDecks.user_id == user_id, FlashcardDecks.is_public.is_(True))
+
+
+def _ranked(model, fts_table, weights, terms):
+    """Match condition, join target and rank (lower is better) for a model"""
+    dialect = _dialect()
+    expression = _match_expression(terms, dialect)
+    if dialect == 'sqlite':
+        name = literal_column(fts_table.name)
+        return (
+            name.op('MATCH')(expression),
+            (fts_table, fts_table.c.rowid == model.__mapper__.primary_key[0]),
+            func.bm25(name, *weights)
+        )
+
+    # Postgres weights come from the setweight() labels in the generated column
+    vector = literal_column(f'{model.__tablename__}.search_vector')
+    tsquery = func.to_tsquery(TS_CONFIG, expression)
+    return vector.op('@@')(tsquery), None, -func.ts_rank(vector, tsquery)
+
+
+def _fuzzy_candidates(query, doc_type, key_column, text_columns, user_id=None):
+    """
+    Subquery of (doc_id, score) for documents similar to the query, or None
+
+    Postgres scores with pg_trgm word_similarity through the trigram GIN
+    indexes. SQLite counts the query trigrams each document shares in the
+    postings table, reading at most TRIGRAM_POSTINGS_LIMIT postings per
+    trigram from the user's scope and from the public one; the score is the
+    shared fraction of the query's trigrams.
+    """
+    if _dialect() == 'postgresql':
+        if not _has_pg_trgm():
+            return None
+        db.session.execute(select(func.set_config(
+            'pg_trgm.word_similarity_threshold', str(FUZZY_SIMILARITY_THRESHOLD), True
+        )))
+        score = func.greatest(*[func.word_similarity(query, col) for col in text_columns])
+        return select(key_column.label('doc_id'), score.label('score')).where(
+            or_(*[literal(query).op('<%')(col) for col in text_columns])
+        ).subquery()
+
+    grams = sorted(trigrams(query))[:MAX_QUERY_TRIGRAMS]
+    if not grams:
+        return None
+
+    scopes = [TRIGRAM_SCOPE_PUBLIC] if user_id is None else [user_id, TRIGRAM_SCOPE_PUBLIC]
+    postings = union_all(*[
+        select(part.c.doc_id) for part in (
+            select(_search_trigrams.c.doc_id).where(
+                _search_trigrams.c.doc_type == doc_type,
+                _search_trigrams.c.scope == scope,
+                _search_trigrams.c.trigram == gram
+            ).order_by(_search_trigrams.c.doc_id).limit(TRIGRAM_POSTINGS_LIMIT).subquery()
+            for gram in grams for scope in scopes
+        )
+    ]).subquery()
+    shared = func.count()
+    return select(
+        postings.c.doc_id.label('doc_id'),
+        (shared * 1.0 / len(grams)).label('score')
+    ).group_by(postings.c.doc_id).having(
+        shared >= max(1, round(len(grams) * FUZZY_SIMILARITY_THRESHOLD))
+    ).subquery()
+
+
+def _paginate(exact_query, order, fuzzy_query, key, page, per_page):
+    """
+    Page through exact matches, topped up with fuzzy ones when they are few
+
+    fuzzy_query is only called for the fallback and may return None.
+
+    Returns:
+        Tuple of (rows for the page, total). With the fallback the total is
+        bounded by FUZZY_FALLBACK_THRESHOLD + FUZZY_RESULT_LIMIT.
+    """
+    total = exact_query.order_by(None).count()
+    fallback = fuzzy_query() if total < FUZZY_FALLBACK_THRESHOLD else None
+    if fallback is None:
+        rows = exact_query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+        return rows, total
+
+    rows = exact_query.order_by(*order).all()
+    seen = {key(row) for row in rows}
+    for row in fallback.limit(FUZZY_RESULT_LIMIT + len(rows)).all():
+        if key(row) not in seen:
+            seen.add(key(row))
+            rows.append(row)
+
+    start = (page - 1) * per_page
+    return rows[start:start + per_page], len(rows)
+
+
+def search_decks(query, page=1, per_page=20, user_id=None):
+    """
+    Full-text search over deck names and descriptions, typo-tolerant on names
+
+    Returns:
+        Tuple of (decks for the page, total matches)
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], 0
+
+    match, join, rank = _ranked(FlashcardDecks, _decks_fts, DECK_WEIGHTS, terms)
+    deck_query = FlashcardDecks.query
+    if join is not None:
+        deck_query = deck_query.join(*join)
+    deck_query = deck_query.filter(match, visible_decks_filter(user_id))
+
+    def fuzzy_query():
+        candidates = _fuzzy_candidates(query, TRIGRAM_DOC_DECK, FlashcardDecks.flashcard_deck_id,
+                                       [FlashcardDecks.name], user_id)
+        if candidates is None:
+            return None
+        return FlashcardDecks.query.join(
+            candidates, candidates.c.doc_id == FlashcardDecks.flashcard_deck_id
+        ).filter(visible_decks_filter(user_id)).order_by(
+            candidates.c.score.desc(), FlashcardDecks.flashcard_deck_id
+        )
+
+    return _paginate(deck_query, (rank, FlashcardDecks.flashcard_deck_id), fuzzy_query,
+                     lambda deck: deck.flashcard_deck_id, page, per_page)
+
+
+def search_flashcards(query, page=1, per_page=20, user_id=None):
+    """
+    Full-text search over flashcard questions, answers and distractors,
+    typo-tolerant on questions and answers
+
+    Returns:
+        Tuple of (flashcards for the page, total matches); each card carries
+        its deck as ``card.deck``
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], 0
+
+    match, join, rank = _ranked(Flashcards, _flashcards_fts, CARD_WEIGHTS, terms)
+    card_query = db.session.query(Flashcards, FlashcardDecks)
+    if join is not None:
+        card_query = card_query.select_from(Flashcards).join(*join)
+    card_query = card_query.join(
+        FlashcardDecks,
+        Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
+    ).filter(match, visible_decks_filter(user_id))
+
+    def fuzzy_query():
+        candidates = _fuzzy_candidates(query, TRIGRAM_DOC_CARD, Flashcards.flashcard_id,
+                                       [Flashcards.question, Flashcards.correct_answer], user_id)
+        if candidates is None:
+            return None
+        return db.session.query(Flashcards, FlashcardDecks).join(
+            candidates, candidates.c.doc_id == Flashcards.flashcard_id
+        ).join(
+            FlashcardDecks,
+            Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
+        ).filter(visible_decks_filter(user_id)).order_by(
+            candidates.c.score.desc(), Flashcards.flashcard_id
+        )
+
+    rows, total_cards = _paginate(card_query, (rank, Flashcards.flashcard_id), fuzzy_query,
+                                  lambda row: row[0].flashcard_id, page, per_page)
+
+    results = []
+    for card, deck in rows:
+        card.deck = deck
+        results.append(card)
+    return results, total_cards
@@ -0,0 +1,324 @@
+"""
+Similarity service for Memoria application.
+"Related cards" from a per-user TF-IDF index over card questions and answers,
+computed locally with NumPy (no network calls). An index is built from one
+query the first time a user asks for similar cards and is then kept current
+by ORM events on cards and decks committed in this process.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+import numpy as np
+from sqlalchemy import select
+from models import db, FlashcardDecks, Flashcards
+from services.search_service import visible_decks_filter
+from services.user_index_service import UserIndexRegistry
+
+# Users whose index is kept in memory (least recently used are dropped)
+SIMILAR_MAX_USERS = 16
+# Indexes are rebuilt after this many seconds, which bounds how stale they get
+# from writes committed by other worker processes
+SIMILAR_INDEX_MAX_AGE = 600
+# Most related cards returned for one query
+SIMILAR_MAX_RESULTS = 50
+# Cosine similarity below which a card is not considered related
+SIMILAR_MIN_SCORE = 0.1
+# Cards changed since the matrix was compiled are scored one by one; past this
+# share of the index (or _MIN_RECOMPILE cards) the matrix is recompiled
+SIMILAR_RECOMPILE_FRACTION = 0.05
+_MIN_RECOMPILE = 64
+
+# Function words dropped before weighting; on short questions their idf is
+# high enough to relate cards that share nothing else
+STOPWORDS = frozenset('''
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can could did do does doing
+    down during each few for from further had has have having he her here hers
+    him his how if in into is it its itself just me more most my no nor not
+    now of off on once only or other our ours out over own same she should so
+    some such than that the their theirs them then there these they this those
+    through to too under until up very was we were what when where which while
+    who whom why will with would you your yours
+'''.split())
+
+
+def _terms(text):
+    """Lower-cased words of at least two characters, without stopwords"""
+    return [word for word in re.findall(r'[^\W_]+', (text or '').lower())
+            if len(word) > 1 and word not in STOPWORDS]
+
+
+def _card_text(question, answer):
+    return f'{question or ""} {answer or ""}'
+
+
+class TfidfIndex:
+    """
+    TF-IDF vectors of one user's cards
+
+    Term counts are kept per card so that changes only touch the document
+    frequencies of their own terms. Scoring runs against a compiled,
+    column-major sparse matrix (indptr / row indices / weights arrays) of
+    L2-normalized (1 + log tf) * idf vectors; cards changed since it was
+    compiled are masked out of it and scored separately until the next
+    compile.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.built_at = time.monotonic()
+        self._columns = {}                          # term -> column
+        self._df = np.zeros(1024, dtype=np.int32)   # column -> cards containing the term
+        self._docs = {}                             # card id -> (columns, counts)
+        self._card_decks = {}                       # card id -> deck id
+        self._deck_cards = {}                       # deck id -> set of card ids
+        self._stale = set()                         # card ids changed since the last compile
+        self._lock = threading.RLock()
+        self._compile()
+
+    @classmethod
+    def build(cls, user_id):
+        """Load a user's card text in one query"""
+        index = cls(user_id)
+        decks = db.session.execute(
+            select(FlashcardDecks.flashcard_deck_id).where(FlashcardDecks.user_id == user_id)
+        ).scalars().all()
+        cards = db.session.execute(
+            select(
+                Flashcards.flashcard_id,
+                Flashcards.flashcard_deck_id,
+                Flashcards.question,
+                Flashcards.correct_answer
+            ).join(
+                FlashcardDecks, Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
+            ).where(FlashcardDecks.user_id == user_id)
+        ).all()
+
+        for deck_id in decks:
+            index._deck_cards.setdefault(deck_id, set())
+        for card_id, deck_id, question, answer in cards:
+            index._add_doc(card_id, deck_id, _card_text(question, answer))
+        index._compile()
+        return index
+
+    def _vector(self, text, grow):
+        """Column and count arrays for text; unknown terms are added only when grow is set"""
+        counts = Counter(_terms(text))
+        columns = []
+        values = []
+        for term, count in counts.items():
+            column = self._columns.get(term)
+            if column is None:
+                if not grow:
+                    continue
+                column = self._columns[term] = len(self._columns)
+            columns.append(column)
+            values.append(count)
+        return np.array(columns, dtype=np.int32), np.array(values, dtype=np.float32)
+
+    def _add_doc(self, card_id, deck_id, text):
+        self._remove_doc(card_id)
+        columns, counts = self._vector(text, grow=True)
+        if len(self._columns) > len(self._df):
+            self._df = np.concatenate([self._df, np.zeros(max(len(self._df), 1024), dtype=np.int32)])
+        self._df[columns] += 1
+        self._docs[card_id] = (columns, counts)
+        self._card_decks[card_id] = deck_id
+        self._deck_cards.setdefault(deck_id, set()).add(card_id)
+        self._stale.add(card_id)
+
+    def _remove_doc(self, card_id):
+        doc = self._docs.pop(card_id, None)
+        if doc is None:
+            return
+        self._df[doc[0]] -= 1
+        deck_id = self._card_decks.pop(card_id, None)
+        if deck_id is not None:
+            self._deck_cards.get(deck_id, set()).discard(card_id)
+        self._stale.add(card_id)
+
+    def _idf(self):
+        """Smoothed inverse document frequency of every column"""
+        df = self._df[:len(self._columns)].astype(np.float32)
+        return np.log((1 + len(self._docs)) / (1 + df)) + 1
+
+    @staticmethod
+    def _weights(counts, idf_values):
+        weights = (1 + np.log(counts)) * idf_values
+        norm = np.sqrt(np.dot(weights, weights))
+        return weights / norm if norm else weights
+
+    def _compile(self):
+        """Rebuild the column-major weight matrix from the in-memory term counts"""
+        card_ids = np.fromiter(self._docs.keys(), dtype=np.int64, count=len(self._docs))
+        docs = list(self._docs.values())
+        lengths = np.fromiter((len(columns) for columns, _ in docs), dtype=np.int64, count=len(docs))
+        columns = np.concatenate([c for c, _ in docs]) if docs else np.empty(0, dtype=np.int32)
+        counts = np.concatenate([c for _, c in docs]) if docs else np.empty(0, dtype=np.float32)
+        rows = np.repeat(np.arange(len(docs), dtype=np.int32), lengths)
+
+        weights = (1 + np.log(counts)) * self._idf()[columns]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(docs)))
+        weights = (weights / np.where(norms > 0, norms, 1)[rows]).astype(np.float32)
+
+        order = np.argsort(columns, kind='stable')
+        self._matrix_rows = rows[order]
+        self._matrix_weights = weights[order]
+        self._indptr = np.zeros(len(self._columns) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=len(self._columns)), out=self._indptr[1:])
+        self._row_cards = card_ids
+        self._card_rows = dict(zip(card_ids.tolist(), range(len(card_ids))))
+        self._stale = set()
+
+    def card_vector(self, card_id):
+        """Stored term counts of an indexed card, or None"""
+        return self._docs.get(card_id)
+
+    def owns_deck(self, deck_id):
+        return deck_id in self._deck_cards
+
+    def has_card(self, card_id):
+        return card_id in self._card_decks
+
+    def put_card(self, card_id, deck_id, text):
+        with self._lock:
+            self._add_doc(card_id, deck_id, text)
+
+    def remove_card(self, card_id):
+        with self._lock:
+            self._remove_doc(card_id)
+
+    def put_deck(self, deck_id, text=None):
+        with self._lock:
+            self._deck_cards.setdefault(deck_id, set())
+
+    def remove_deck(self, deck_id):
+        """Drop a deck and the cards still indexed under it"""
+        with self._lock:
+            for card_id in list(self._deck_cards.pop(deck_id, ())):
+                self._remove_doc(card_id)
+
+    def similar(self, text=None, card_id=None, limit=SIMILAR_MAX_RESULTS, min_score=SIMILAR_MIN_SCORE):
+        """
+        Cards most similar to an indexed card or to free text
+
+        Returns:
+            List of (card id, cosine similarity) tuples, best first, never
+            including card_id itself
+        """
+        with self._lock:
+            if len(self._stale) > max(_MIN_RECOMPILE, SIMILAR_RECOMPILE_FRACTION * len(self._docs)):
+                self._compile()
+
+            vector = self._docs.get(card_id) if card_id is not None else None
+            columns, counts = vector if vector is not None else self._vector(text, grow=False)
+            if not len(columns):
+                return []
+            idf = self._idf()
+            query = self._weights(counts, idf[columns])
+
+            # Compiled rows: gather the postings of the query terms and sum per row
+            compiled_columns = columns < len(self._indptr) - 1
+            slices = [
+                (self._indptr[column], self._indptr[column + 1], weight)
+                for column, weight in zip(columns[compiled_columns], query[compiled_columns])
+            ]
+            scores = np.zeros(len(self._row_cards), dtype=np.float32)
+            if slices:
+                rows = np.concatenate([self._matrix_rows[start:end] for start, end, _ in slices])
+                weights = np.concatenate([self._matrix_weights[start:end] * weight for start, end, weight in slices])
+                scores += np.bincount(rows, weights=weights, minlength=len(self._row_cards)).astype(np.float32)
+
+            for stale_id in self._stale:
+                row = self._card_rows.get(stale_id)
+                if row is not None:
+                    scores[row] = 0
+            if card_id in self._card_rows:
+                scores[self._card_rows[card_id]] = 0
+
+            top = min(limit, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top] if top else np.empty(0, dtype=np.int64)
+            results = [
+                (int(self._row_cards[row]), float(scores[row]))
+                for row in best if scores[row] >= min_score
+            ]
+
+            # Cards changed since the compile, scored with the current idf
+            query_weights = dict(zip(columns.tolist(), query.tolist()))
+            for stale_id in self._stale:
+                doc = self._docs.get(stale_id)
+                if doc is None or stale_id == card_id:
+                    continue
+                doc_weights = self._weights(doc[1], idf[doc[0]])
+                score = sum(query_weights.get(column, 0.0) * weight
+                            for column, weight in zip(doc[0].tolist(), doc_weights.tolist()))
+                if score >= min_score:
+                    results.append((stale_id, score))
+
+            results.sort(key=lambda item: (-item[1], item[0]))
+            return results[:limit]
+
+
+_registry = UserIndexRegistry(
+    'similarity', TfidfIndex.build, SIMILAR_MAX_USERS, SIMILAR_INDEX_MAX_AGE,
+    deck_text=lambda deck: None,
+    card_text=lambda card: _card_text(card.question, card.correct_answer),
+    card_fields=('question', 'correct_answer')
+)
+
+
+def get_similarity_index(user_id):
+    """Return the user's index, building it when missing or too old"""
+    return _registry.get(user_id)
+
+
+def visible_card(user_id, card_id):
+    """The card if it is in one of the user's decks or a public deck, else None"""
+    return Flashcards.query.join(
+        FlashcardDecks, Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
+    ).filter(
+        Flashcards.flashcard_id == card_id,
+        visible_decks_filter(user_id)
+    ).first()
+
+
+def similar_cards(user_id, query=None, card_id=None, page=1, per_page=20):
+    """
+    The user's cards most similar to a card or to free text
+
+    A card outside the user's own decks (e.g. in a public deck) is matched
+    by its text.
+
+    Returns:
+        Tuple of (list of Flashcards with a similarity attribute, total count)
+    """
+    if user_id is None:
+        return [], 0
+
+    index = get_similarity_index(user_id)
+    if card_id is not None and index.card_vector(card_id) is None:
+        card = visible_card(user_id, card_id)
+        if card is None:
+            return [], 0
+        query = _card_text(card.question, card.correct_answer)
+        matches = [match for match in index.similar(text=query) if match[0] != card_id]
+    else:
+        matches = index.similar(text=query, card_id=card_id)
+
+    page_matches = matches[(page - 1) * per_page:page * per_page]
+    cards = {
+        card.flashcard_id: card
+        for card in Flashcards.query.filter(
+            Flashcards.flashcard_id.in_([match_id for match_id, _ in page_matches])
+        )
+    } if page_matches else {}
+
+    results = []
+    for match_id, score in page_matches:
+        card = cards.get(match_id)
+        if card is not None:
+            card.similarity = round(score, 4)
+            results.append(card)
+    return results, len(matches)
@@ -5,8 +5,18 @@ from flask_login import current_user
 
 from config import Config
 from services.file_service import FileProcessor
-from utils import chunk_text
-from models import db, ImportFile, ImportChunk, ImportFlashcard
+from datetime import datetime
+from sqlalchemy import insert, select, update, delete, func
+from utils import iter_chunks
+from models import db, ImportFile, ImportChunk, ImportFlashcard, ContentFile, ContentChunk
+
+def _dialect_insert(model):
+    """INSERT for the bound dialect, which supports ON CONFLICT on SQLite and PostgreSQL"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert(model.__table__)
 
 class ProcessingState:
     """Store processing state in database between requests"""
@@ -17,8 +27,21 @@ class ProcessingState:
         return hashlib.md5(filepath.encode('utf-8')).hexdigest()
     
     @staticmethod
-    def init_file_state(filepath):
-        """Initialize processing state for a file in the database"""
+    def init_file_state(filepath, content=None, file_hash=None):
+        """
+        Initialize processing state for a file in the database
+        
+        Text is streamed through the chunker and chunks are inserted in
+        batches of CHUNK_INSERT_BATCH, so memory stays proportional to
+        CHUNK_SIZE rather than to the file. When file_hash matches an earlier
+        upload, its chunks are copied from the content store instead and
+        content is never read.
+        
+        Args:
+            filepath: Path (or unique name) of the uploaded file, used for the file key
+            content: Iterable of text pieces; read from filepath when omitted
+            file_hash: SHA-256 of the uploaded bytes, if known
+        """
         try:
             # Create a unique key for this file
             file_key = ProcessingState.get_file_key(filepath)
@@ -30,33 +53,29 @@ class ProcessingState:
                 db.session.delete(existing_file)
                 db.session.commit()
             
-            # Read content and divide into chunks
-            content = FileProcessor.read_content(filepath)
-            chunks = chunk_text(content)
-            
-            # Create a new import file record
+            # Create a new import file record; the chunk count is known at the end
             import_file = ImportFile(
                 file_key=file_key,
                 filename=filepath.split('/')[-1],
                 user_id=current_user.id,
-                total_chunks=len(chunks),
+                total_chunks=0,
                 current_index=0,
-                is_complete=False
+                is_complete=False,
+                content_hash=file_hash
             )
             
             db.session.add(import_file)
             db.session.flush()  # Get the id without committing
             
-            # Store all chunks in the database
-            for i, chunk_content in enumerate(chunks):
-                chunk = ImportChunk(
-                    file_id=import_file.id,
-                    index=i,
-                    content=chunk_content,
-                    is_processed=False,
-                    is_saved=False
-                )
-                db.session.add(chunk)
+            total_chunks = ProcessingState._reuse_chunks(import_file.id, file_hash) if file_hash else None
+            if total_chunks is None:
+                if content is None:
+                    content = FileProcessor.iter_content(filepath)
+                total_chunks = ProcessingState._store_chunks(import_file.id, iter_chunks(content), file_hash)
+            else:
+                current_app.logger.info(f"Reused {total_chunks} extracted chunks for file {file_hash[:12]}")
+            
+            import_file.total_chunks = total_chunks
             
             # Commit all changes
             db.session.commit()
@@ -68,6 +87,112 @@ class ProcessingState:
             db.session.rollback()
             raise
     
+    @staticmethod
+    def _store_chunks(file_id, chunks, file_hash=None):
+        """
+        Insert an upload's chunks in batches, adding new text to the content store
+        
+        Returns:
+            Number of chunks
+        """
+        chunk_hashes = []
+        batch = []
+        
+        def flush(batch):
+            hashes = {row['content_hash'] for row in batch}
+            known = set(db.session.execute(
+                select(ContentChunk.content_hash).where(ContentChunk.content_hash.in_(hashes))
+            ).scalars())
+            new_content = {}
+            for row in batch:
+                if row['content_hash'] not in known:
+                    new_content.setdefault(row['content_hash'], row['content'])
+            if new_content:
+                # A concurrent upload may store the same text first; its row is kept
+                statement = _dialect_insert(ContentChunk)
+                db.session.execute(statement.on_conflict_do_nothing(index_elements=['content_hash']), [
+                    {'content_hash': content_hash, 'content': text}
+                    for content_hash, text in new_content.items()
+                ])
+            if known:
+                # Keep shared chunks out of the purge while this upload uses them
+                db.session.execute(
+                    update(ContentChunk).where(ContentChunk.content_hash.in_(known))
+                    .values(used_at=datetime.utcnow())
+                )
+            db.session.execute(insert(ImportChunk), batch)
+        
+        for chunk_content in chunks:
+            content_hash = ContentChunk.hash_text(chunk_content)
+            batch.append({
+                'file_id': file_id,
+                'index': len(chunk_hashes),
+                'content': chunk_content,
+                'content_hash': content_hash,
+                'is_processed': False,
+                'is_saved': False
+            })
+            chunk_hashes.append(content_hash)
+            if len(batch) >= Config.CHUNK_INSERT_BATCH:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        
+        if file_hash:
+            # Overwrites a stale entry whose chunks were purged, or one stored concurrently
+            statement = _dialect_insert(ContentFile)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['content_hash'],
+                set_={'chunk_hashes': statement.excluded.chunk_hashes, 'used_at': statement.excluded.used_at}
+            ), [{'content_hash': file_hash, 'chunk_hashes': chunk_hashes, 'used_at': datetime.utcnow()}])
+        return len(chunk_hashes)
+    
+    @staticmethod
+    def _reuse_chunks(file_id, file_hash):
+        """
+        Copy the chunks of an earlier upload with the same bytes from the content store
+        
+        Returns:
+            Number of chunks, or None when the file (or any of its chunks) is not stored
+        """
+        content_file = db.session.get(ContentFile, file_hash)
+        if content_file is None:
+            return None
+        
+        chunk_hashes = content_file.chunk_hashes
+        batches = [chunk_hashes[start:start + Config.CHUNK_INSERT_BATCH]
+                   for start in range(0, len(chunk_hashes), Config.CHUNK_INSERT_BATCH)]
+        
+        # Part of the file may have been purged; then it is extracted again
+        for hashes in batches:
+            stored = db.session.query(func.count(ContentChunk.content_hash)).filter(
+                ContentChunk.content_hash.in_(set(hashes))
+            ).scalar()
+            if stored < len(set(hashes)):
+                return None
+        
+        now = datetime.utcnow()
+        for number, hashes in enumerate(batches):
+            texts = dict(db.session.execute(
+                select(ContentChunk.content_hash, ContentChunk.content).where(
+                    ContentChunk.content_hash.in_(set(hashes))
+                )
+            ).all())
+            db.session.execute(insert(ImportChunk), [{
+                'file_id': file_id,
+                'index': number * Config.CHUNK_INSERT_BATCH + offset,
+                'content': texts[content_hash],
+                'content_hash': content_hash,
+                'is_processed': False,
+                'is_saved': False
+            } for offset, content_hash in enumerate(hashes)])
+            db.session.execute(
+                update(ContentChunk).where(ContentChunk.content_hash.in_(set(hashes))).values(used_at=now)
+            )
+        content_file.used_at = now
+        return len(chunk_hashes)
+    
     @staticmethod
     def get_state(file_key):
         """Get processing state for a file from the database"""
@@ -76,12 +201,17 @@ class ProcessingState:
         if not import_file:
             return None
             
+        # Chunk flags only; loading the chunks themselves would pull in all their content
+        chunk_flags = db.session.query(
+            ImportChunk.index, ImportChunk.is_processed, ImportChunk.is_saved
+        ).filter(ImportChunk.file_id == import_file.id).order_by(ImportChunk.index).all()
+        
         # Convert to dictionary format for backward compatibility
         state = {
             'file_key': import_file.file_key,
             'total_chunks': import_file.total_chunks,
-            'processed_chunks': [c.index for c in import_file.chunks if c.is_processed],
-            'saved_chunks': [c.index for c in import_file.chunks if c.is_saved],
+            'processed_chunks': [c.index for c in chunk_flags if c.is_processed],
+            'saved_chunks': [c.index for c in chunk_flags if c.is_saved],
             'total_saved_cards': import_file.total_saved_cards,
             'current_index': import_file.current_index,
             'is_complete': import_file.is_complete,
@@ -256,6 +386,11 @@ class ProcessingState:
         # Delete them
         for file in old_files:
             db.session.delete(file)  # This should cascade to chunks and flashcards
+        
+        # Content store entries nobody has uploaded for a while
+        content_cutoff = datetime.utcnow() - timedelta(days=Config.CONTENT_CACHE_DAYS)
+        db.session.execute(delete(ContentFile).where(ContentFile.used_at < content_cutoff))
+        db.session.execute(delete(ContentChunk).where(ContentChunk.used_at < content_cutoff))
             
         # Commit changes
         db.session.commit()
@@ -0,0 +1,233 @@
+"""
+Suggest service for Memoria application.
+Search-as-you-type suggestions from a per-user, in-process prefix index of
+deck names and card questions. An index is built from two queries the first
+time a user asks for suggestions, then kept current by ORM events on decks
+and cards committed in this process.
+"""
+
+import re
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import select, func
+from models import db, FlashcardDecks, Flashcards
+from services.user_index_service import UserIndexRegistry
+
+# Users whose index is kept in memory (least recently used are dropped)
+SUGGEST_MAX_USERS = 16
+# Indexes are rebuilt after this many seconds, which bounds how stale they get
+# from writes committed by other worker processes
+SUGGEST_INDEX_MAX_AGE = 600
+# Card questions are indexed and shown up to this many characters
+SUGGEST_LABEL_LENGTH = 120
+# Most entries ranked per lookup; keeps one-letter prefixes on huge accounts cheap
+SUGGEST_SCAN_LIMIT = 2000
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+
+def _normalize(value):
+    return ' '.join((value or '').lower().split())
+
+
+def _words(value):
+    return set(re.findall(r'[^\W_]+', (value or '').lower()))
+
+
+class SuggestIndex:
+    """
+    Prefix index over one user's deck names and card questions
+
+    A sorted vocabulary of words (bisected for a prefix range) maps to
+    posting sets of entry ids; decks are stored under negative ids and cards
+    under their flashcard id.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.built_at = time.monotonic()
+        self._entries = {}          # entry id -> (label, normalized label)
+        self._card_decks = {}       # card id -> deck id
+        self._deck_cards = {}       # deck id -> set of card ids
+        self._vocabulary = []       # sorted distinct words
+        self._postings = {}         # word -> set of entry ids
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, user_id):
+        """Load a user's deck names and card questions in two queries"""
+        index = cls(user_id)
+        decks = db.session.execute(
+            select(FlashcardDecks.flashcard_deck_id, FlashcardDecks.name).where(
+                FlashcardDecks.user_id == user_id
+            )
+        ).all()
+        cards = db.session.execute(
+            select(
+                Flashcards.flashcard_id,
+                Flashcards.flashcard_deck_id,
+                func.substr(Flashcards.question, 1, SUGGEST_LABEL_LENGTH)
+            ).join(
+                FlashcardDecks, Flashcards.flashcard_deck_id == FlashcardDecks.flashcard_deck_id
+            ).where(FlashcardDecks.user_id == user_id)
+        ).all()
+
+        # Bulk load: fill postings first and sort the vocabulary once
+        for deck_id, name in decks:
+            index._add_entry(-deck_id, name, sort=False)
+            index._deck_cards.setdefault(deck_id, set())
+        for card_id, deck_id, question in cards:
+            index._add_entry(card_id, question, sort=False)
+            index._card_decks[card_id] = deck_id
+            index._deck_cards.setdefault(deck_id, set()).add(card_id)
+        index._vocabulary = sorted(index._postings)
+        return index
+
+    def _add_entry(self, entry_id, text, sort=True):
+        label = (text or '')[:SUGGEST_LABEL_LENGTH]
+        self._entries[entry_id] = (label, _normalize(label))
+        for word in _words(label):
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = set()
+                if sort:
+                    insort(self._vocabulary, word)
+            posting.add(entry_id)
+
+    def _remove_entry(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for word in _words(entry[0]):
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[word]
+                position = bisect_left(self._vocabulary, word)
+                if position < len(self._vocabulary) and self._vocabulary[position] == word:
+                    del self._vocabulary[position]
+
+    def owns_deck(self, deck_id):
+        return deck_id in self._deck_cards
+
+    def has_card(self, card_id):
+        return card_id in self._card_decks
+
+    def put_deck(self, deck_id, name):
+        with self._lock:
+            self._remove_entry(-deck_id)
+            self._add_entry(-deck_id, name)
+            self._deck_cards.setdefault(deck_id, set())
+
+    def remove_deck(self, deck_id):
+        """Drop a deck and the cards still indexed under it"""
+        with self._lock:
+            self._remove_entry(-deck_id)
+            for card_id in self._deck_cards.pop(deck_id, ()):
+                self._remove_entry(card_id)
+                self._card_decks.pop(card_id, None)
+
+    def put_card(self, card_id, deck_id, question):
+        with self._lock:
+            self.remove_card(card_id)
+            self._add_entry(card_id, question)
+            self._card_decks[card_id] = deck_id
+            self._deck_cards.setdefault(deck_id, set()).add(card_id)
+
+    def remove_card(self, card_id):
+        with self._lock:
+            self._remove_entry(card_id)
+            deck_id = self._card_decks.pop(card_id, None)
+            if deck_id is not None:
+                self._deck_cards.get(deck_id, set()).discard(card_id)
+
+    def _prefix_matches(self, prefix, limit):
+        """Entry ids with a word starting with prefix, at most about limit of them"""
+        matches = set()
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and len(matches) < limit:
+            word = self._vocabulary[position]
+            if not word.startswith(prefix):
+                break
+            matches.update(self._postings[word])
+            position += 1
+        return matches
+
+    def lookup(self, query, limit=SUGGEST_DEFAULT_LIMIT):
+        """
+        Top entries for a typed query
+
+        Every word of the query must start a word of the entry (the last one
+        is usually still being typed). Entries whose text starts with the
+        whole query rank first, then decks before cards, then shorter labels.
+
+        Returns:
+            List of (entry id, label) tuples
+        """
+        words = re.findall(r'[^\W_]+', (query or '').lower())
+        if not words:
+            return []
+        normalized = _normalize(query)
+
+        with self._lock:
+            candidate_sets = sorted(
+                (self._prefix_matches(word, SUGGEST_SCAN_LIMIT) for word in set(words)),
+                key=len
+            )
+            candidates = set(candidate_sets[0])
+            for other in candidate_sets[1:]:
+                candidates &= other
+                if not candidates:
+                    return []
+
+            def rank(entry_id):
+                label, label_normalized = self._entries[entry_id]
+                return (
+                    not label_normalized.startswith(normalized),
+                    entry_id > 0,
+                    len(label),
+                    label_normalized,
+                    entry_id
+                )
+
+            best = heapq.nsmallest(limit, candidates, key=rank)
+            return [(entry_id, self._entries[entry_id][0]) for entry_id in best]
+
+    def deck_of_card(self, card_id):
+        return self._card_decks.get(card_id)
+
+
+_registry = UserIndexRegistry(
+    'suggest', SuggestIndex.build, SUGGEST_MAX_USERS, SUGGEST_INDEX_MAX_AGE,
+    deck_text=lambda deck: deck.name,
+    card_text=lambda card: card.question,
+    deck_fields=('name',),
+    card_fields=('question',)
+)
+
+
+def get_suggest_index(user_id):
+    """Return the user's index, building it when missing or too old"""
+    return _registry.get(user_id)
+
+
+def suggest(user_id, query, limit=SUGGEST_DEFAULT_LIMIT):
+    """
+    Deck and card suggestions for a prefix
+
+    Returns:
+        List of dicts with type ('deck' or 'card'), id, text and deck_id
+    """
+    index = get_suggest_index(user_id)
+    suggestions = []
+    for entry_id, label in index.lookup(query, limit):
+        if entry_id < 0:
+            suggestions.append({'type': 'deck', 'id': -entry_id, 'text': label, 'deck_id': -entry_id})
+        else:
+            suggestions.append({'type': 'card', 'id': entry_id, 'text': label,
+                                'deck_id': index.deck_of_card(entry_id)})
+    return suggestions
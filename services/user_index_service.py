@@ -0,0 +1,175 @@
+"""
+User index service for Memoria application.
+Registry for per-user, in-process indexes over deck and card text (search
+suggestions, related cards). An index is built the first time its user
+needs it and then kept current by ORM events on decks and cards committed
+in this process; least recently used and old indexes are dropped.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import FlashcardDecks, Flashcards
+
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+class UserIndexRegistry:
+    """
+    Loaded per-user indexes of one kind, kept current by committed changes
+
+    An index provides owns_deck(deck_id), has_card(card_id),
+    put_deck(deck_id, text), remove_deck(deck_id), put_card(card_id,
+    deck_id, text) and remove_card(card_id). Changes are buffered on the
+    session and applied after its commit. A deck that changes owner, or a
+    card moved into another user's deck, drops the indexes of both users
+    instead; they are rebuilt on next use.
+    """
+
+    def __init__(self, name, build, max_users, max_age, deck_text, card_text,
+                 deck_fields=(), card_fields=()):
+        """
+        Args:
+            name: Short name, used for the session buffer key
+            build: Called with a user id to build that user's index
+            max_users: Indexes kept in memory
+            max_age: Seconds after which an index is rebuilt, which bounds how
+                stale it gets from writes committed by other worker processes
+            deck_text: Text indexed for a FlashcardDecks object
+            card_text: Text indexed for a Flashcards object
+            deck_fields: Deck attributes whose changes re-index the deck
+            card_fields: Card attributes whose changes re-index the card
+        """
+        self.build = build
+        self.max_users = max_users
+        self.max_age = max_age
+        self.deck_text = deck_text
+        self.card_text = card_text
+        self.deck_fields = tuple(deck_fields)
+        self.card_fields = tuple(card_fields)
+        self._pending_key = f'_{name}_pending'
+        self._indexes = OrderedDict()
+        self._generations = {}      # user id -> invalidation count
+        self._lock = threading.Lock()
+
+        event.listen(FlashcardDecks, 'after_insert', self._deck_saved)
+        event.listen(FlashcardDecks, 'after_update', self._deck_updated)
+        event.listen(FlashcardDecks, 'after_delete', self._deck_deleted)
+        event.listen(Flashcards, 'after_insert', self._card_saved)
+        event.listen(Flashcards, 'after_update', self._card_updated)
+        event.listen(Flashcards, 'after_delete', self._card_deleted)
+        event.listen(Session, 'after_commit', self._apply)
+        event.listen(Session, 'after_rollback', self._discard)
+
+    def get(self, user_id):
+        """Return the user's index, building it when missing or too old"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and time.monotonic() - index.built_at < self.max_age:
+                self._indexes.move_to_end(user_id)
+                return index
+            generation = self._generations.get(user_id, 0)
+
+        # Build outside the lock so other users' lookups aren't held up
+        index = self.build(user_id)
+        with self._lock:
+            # An index invalidated while it was being built is used once, not kept
+            if self._generations.get(user_id, 0) == generation:
+                self._indexes[user_id] = index
+                self._indexes.move_to_end(user_id)
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, *user_ids):
+        """Drop the indexes of the given users"""
+        with self._lock:
+            for user_id in user_ids:
+                self._indexes.pop(user_id, None)
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        """Drop every loaded index"""
+        with self._lock:
+            user_ids = list(self._indexes)
+        self.invalidate(*user_ids)
+
+    def loaded(self):
+        with self._lock:
+            return list(self._indexes.values())
+
+    def _queue(self, target, change):
+        # Nothing to keep current until some index is loaded in this process
+        if not self._indexes:
+            return
+        session = inspect(target).session
+        if session is not None:
+            session.info.setdefault(self._pending_key, []).append(change)
+
+    def _deck_saved(self, mapper, connection, target):
+        self._queue(target, ('deck', target.flashcard_deck_id, target.user_id, self.deck_text(target)))
+
+    def _deck_updated(self, mapper, connection, target):
+        history = inspect(target).attrs.user_id.history
+        if history.has_changes():
+            owners = tuple(history.deleted) + (target.user_id,)
+            self._queue(target, ('deck_owner', target.flashcard_deck_id, owners, None))
+        elif _changed(target, *self.deck_fields):
+            self._deck_saved(mapper, connection, target)
+
+    def _deck_deleted(self, mapper, connection, target):
+        self._queue(target, ('deck_deleted', target.flashcard_deck_id, target.user_id, None))
+
+    def _card_saved(self, mapper, connection, target):
+        self._queue(target, ('card', target.flashcard_id, target.flashcard_deck_id, self.card_text(target)))
+
+    def _card_updated(self, mapper, connection, target):
+        if _changed(target, 'flashcard_deck_id', *self.card_fields):
+            self._card_saved(mapper, connection, target)
+
+    def _card_deleted(self, mapper, connection, target):
+        self._queue(target, ('card_deleted', target.flashcard_id, None, None))
+
+    def _apply(self, session):
+        """Apply committed deck and card changes to the loaded indexes"""
+        changes = session.info.pop(self._pending_key, None)
+        if not changes:
+            return
+
+        indexes = self.loaded()
+        by_user = {index.user_id: index for index in indexes}
+        stale = set()
+        for kind, object_id, owner, text in changes:
+            if kind == 'deck_owner':
+                # The deck's cards change hands with it
+                stale.update(user_id for user_id in owner if user_id is not None)
+                stale.update(index.user_id for index in indexes if index.owns_deck(object_id))
+            elif kind == 'deck':
+                if owner in by_user:
+                    by_user[owner].put_deck(object_id, text)
+            elif kind == 'deck_deleted':
+                if owner in by_user:
+                    by_user[owner].remove_deck(object_id)
+            elif kind == 'card':
+                targets = [index for index in indexes if index.owns_deck(owner)]
+                previous = [index for index in indexes
+                            if index.has_card(object_id) and not index.owns_deck(owner)]
+                if previous:
+                    # Moved into another user's deck
+                    stale.update(index.user_id for index in previous + targets)
+                for index in targets:
+                    index.put_card(object_id, owner, text)
+            elif kind == 'card_deleted':
+                for index in indexes:
+                    if index.has_card(object_id):
+                        index.remove_card(object_id)
+        if stale:
+            self.invalidate(*stale)
+
+    def _discard(self, session):
+        session.info.pop(self._pending_key, None)
@@ -1,4 +1,5 @@
-import { shuffleArray, updateProgress } from '../utils.js';
+import { shuffleArray } from '../utils.js';
+import { ReviewBuffer } from './ReviewBuffer.js';
 import { UIManager } from './UIManager.js';
 import { NavigationManager } from './NavigationManager.js';
 import { EventManager } from './EventManager.js';
@@ -19,6 +20,12 @@ export class FlashcardManager {
         this.currentCard = null;  // Store the current card data
         this.currentBatch = parseInt(document.getElementById('currentBatch')?.value || 1);
         this.cardsPerBatch = 45;  // Each batch loads 45 cards
+        this.nextCursor = null;  // Keyset cursor returned by the server for the next batch
+        
+        // Answers are buffered and submitted in batches
+        this.reviewBuffer = new ReviewBuffer({
+            onResults: (results) => this.applyReviewResults(results)
+        });
         this.totalSessionCompleted = 0; // Track total cards completed across all batches
         
         // Initialize event system
@@ -151,12 +158,31 @@ export class FlashcardManager {
         }
     }
 
+    /**
+     * Update cached card data with the FSRS results of submitted answers
+     * @param {Array<Object>} results - Per-card results from the batch endpoint
+     */
+    applyReviewResults(results) {
+        results.forEach(result => {
+            if (!result.success) return;
+            
+            const card = this.flashcards.find(c => c.id === result.flashcard_id);
+            if (card) {
+                card.state = this.getFsrsStateNumber(result.state);
+                card.retrievability = result.retrievability || 0;
+            }
+        });
+    }
+
     async loadFlashcardBatch(batchNumber) {
         try {
             if (this.isLoading) return;
             
             this.isLoading = true;
             
+            // Submit pending answers so the next batch reflects them
+            await this.reviewBuffer.flush();
+            
             // Build the URL for loading cards with pagination
             const url = new URL(`/deck/study/${this.deckId}`, window.location.origin);
             
@@ -169,6 +195,11 @@ export class FlashcardManager {
             url.searchParams.append('page', batchNumber.toString());
             url.searchParams.append('per_page', this.cardsPerBatch.toString());
             
+            // Continue from where the previous batch ended
+            if (batchNumber > 1 && this.nextCursor) {
+                url.searchParams.append('cursor', this.nextCursor);
+            }
+            
             console.log(`Loading batch ${batchNumber} flashcards from: ${url}`);
             
             const response = await fetch(url, {
@@ -188,6 +219,7 @@ export class FlashcardManager {
             // Store flashcards in the order they were received
             this.flashcards = data.flashcards;
             this.currentBatch = batchNumber;
+            this.nextCursor = data.next_cursor || null;
             
             // Only log the success message with the actual data received
             console.log(`Successfully loaded ${this.flashcards.length} flashcards (batch ${batchNumber}) out of ${data.total} total`);
@@ -454,18 +486,8 @@ export class FlashcardManager {
         const isCorrect = selectedAnswer === card.correct_answer;
         console.log(`Answer is ${isCorrect ? 'correct' : 'incorrect'}`);
         
-        try {
-            // Update server-side progress first
-            const result = await updateProgress(card.id, isCorrect);
-            
-            if (result.success) {
-                // Update FSRS specific data in our cached data
-                card.state = this.getFsrsStateNumber(result.state);
-                card.retrievability = result.retrievability || 0;
-            }
-        } catch (error) {
-            console.error("Failed to update progress:", error);
-        }
+        // Queue the answer; it is sent to the server with the next batch
+        this.reviewBuffer.add(card.id, isCorrect);
         
         // Mark this card as completed in this session (regardless of correctness)
         if (!this.completedCards.has(card.id)) {
@@ -624,12 +646,15 @@ export class FlashcardManager {
         
         // In "Study All" mode, we know we've completed everything, so no need to check server
         if (!isDueOnly) {
+            this.reviewBuffer.flush();
             this.ui.showFinalCompletion(this.deckId, this.totalSessionCompleted, this.totalDueCards, isDueOnly, 0);
             return;
         }
         
         // In "Due Only" mode, check if there are more due cards that were added since we started
-        fetch(`/deck/api/due-count/${this.deckId}`)
+        // (after submitting pending answers so they are not counted as due)
+        this.reviewBuffer.flush()
+            .then(() => fetch(`/deck/api/due-count/${this.deckId}`))
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
@@ -0,0 +1,123 @@
+import { submitReviewBatch } from '../utils.js';
+
+// Most answers per request; the server rejects larger batches (MAX_REVIEW_BATCH)
+const MAX_BATCH_SIZE = 200;
+
+/**
+ * Buffers study answers and submits them to the server in batches
+ *
+ * Answers are flushed every few seconds, once enough have queued up, and
+ * whenever the page is hidden or closed, so fast reviewers send one request
+ * for many cards instead of one per card.
+ *
+ * Batches that fail on the network or with a server error (5xx) are queued
+ * again for the next flush; batches the server rejects (4xx) would fail the
+ * same way again, so they are dropped and reported instead.
+ */
+export class ReviewBuffer {
+    /**
+     * @param {Object} options
+     * @param {number} options.flushInterval - Milliseconds between automatic flushes
+     * @param {number} options.maxSize - Number of queued answers that triggers a flush
+     * @param {Function} options.onResults - Called with the per-card results of each flush
+     * @param {Function} options.onRejected - Called with the answers and error of a dropped batch
+     */
+    constructor({ flushInterval = 5000, maxSize = 10, onResults = null, onRejected = null } = {}) {
+        this.flushInterval = flushInterval;
+        this.maxSize = maxSize;
+        this.onResults = onResults;
+        this.onRejected = onRejected;
+        this.pending = [];
+        this.inFlight = null;
+        this.timer = null;
+
+        // Don't lose answers when the user leaves the page
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.flush({ keepalive: true });
+            }
+        });
+        window.addEventListener('pagehide', () => this.flush({ keepalive: true }));
+    }
+
+    /**
+     * Queue an answer for submission
+     * @param {number} flashcardId - The flashcard that was answered
+     * @param {boolean} isCorrect - Whether the answer was correct
+     */
+    add(flashcardId, isCorrect) {
+        this.pending.push({
+            flashcard_id: flashcardId,
+            is_correct: isCorrect,
+            answered_at: new Date().toISOString()
+        });
+
+        if (this.pending.length >= this.maxSize) {
+            this.flush();
+        } else if (!this.timer) {
+            this.timer = setTimeout(() => this.flush(), this.flushInterval);
+        }
+    }
+
+    /**
+     * Submit everything queued so far
+     * @param {Object} fetchOptions - Extra fetch options (e.g. keepalive on page exit)
+     * @returns {Promise<void>} - Resolves once the queued answers have been sent
+     */
+    async flush(fetchOptions = {}) {
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+
+        // Keep submissions in order: wait for the previous batch first
+        if (this.inFlight) {
+            await this.inFlight.catch(() => {});
+        }
+
+        if (this.pending.length === 0) {
+            return;
+        }
+
+        const reviews = this.pending;
+        this.pending = [];
+
+        this.inFlight = this.send(reviews, fetchOptions).finally(() => {
+            this.inFlight = null;
+        });
+
+        return this.inFlight;
+    }
+
+    /**
+     * Submit answers in order, in batches the server accepts
+     * @param {Array<Object>} reviews - Queued answers
+     * @param {Object} fetchOptions - Extra fetch options
+     * @returns {Promise<void>}
+     */
+    async send(reviews, fetchOptions) {
+        for (let start = 0; start < reviews.length; start += MAX_BATCH_SIZE) {
+            const batch = reviews.slice(start, start + MAX_BATCH_SIZE);
+            try {
+                const data = await submitReviewBatch(batch, fetchOptions);
+                if (data.success && this.onResults) {
+                    this.onResults(data.results || []);
+                }
+            } catch (error) {
+                if (error.status >= 400 && error.status < 500) {
+                    // Retrying would be rejected again and hold up later answers
+                    console.error(`Dropped ${batch.length} reviews rejected by the server:`, error);
+                    if (this.onRejected) {
+                        this.onRejected(batch, error);
+                    }
+                    continue;
+                }
+
+                // Network or server error: keep this batch and the rest, in order, for the next flush
+                console.error('Failed to submit buffered reviews:', error);
+                this.pending = reviews.slice(start).concat(this.pending);
+                return;
+            }
+        }
+    }
+}
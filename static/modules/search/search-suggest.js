@@ -0,0 +1,130 @@
+/**
+ * Search-as-you-type suggestions for search inputs, backed by /search/suggest
+ */
+
+const SUGGEST_URL = '/search/suggest';
+const DEBOUNCE_MS = 120;
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+export function initializeSearchSuggest(input, options = {}) {
+    if (!input || input.dataset.suggestInitialized === 'true') return;
+    input.dataset.suggestInitialized = 'true';
+    input.setAttribute('autocomplete', 'off');
+
+    const limit = options.limit || 8;
+    const anchor = input.closest('.input-group') || input.parentNode;
+    anchor.classList.add('search-suggest-anchor');
+
+    const dropdown = document.createElement('div');
+    dropdown.className = 'search-suggest-dropdown list-group';
+    anchor.appendChild(dropdown);
+
+    let timer = null;
+    let controller = null;
+    let items = [];
+    let activeIndex = -1;
+    // Prefix -> suggestions already fetched on this page
+    const cache = new Map();
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, DEBOUNCE_MS);
+    });
+    input.addEventListener('keydown', handleKeys);
+    input.addEventListener('blur', () => setTimeout(hide, 150));
+
+    async function fetchSuggestions() {
+        const query = input.value.trim();
+        if (!query) {
+            hide();
+            return;
+        }
+
+        if (cache.has(query)) {
+            render(cache.get(query));
+            return;
+        }
+
+        // Only the latest keystroke's request matters
+        if (controller) controller.abort();
+        controller = new AbortController();
+
+        try {
+            const params = new URLSearchParams({ q: query, limit });
+            const response = await fetch(`${SUGGEST_URL}?${params}`, { signal: controller.signal });
+            const data = await response.json();
+            if (!data.success) return;
+            cache.set(query, data.suggestions);
+            if (input.value.trim() === query) render(data.suggestions);
+        } catch (error) {
+            if (error.name !== 'AbortError') console.error('Error fetching suggestions:', error);
+        }
+    }
+
+    function render(suggestions) {
+        items = suggestions;
+        activeIndex = -1;
+        dropdown.innerHTML = '';
+        if (!suggestions.length) {
+            hide();
+            return;
+        }
+
+        suggestions.forEach((item, index) => {
+            const link = document.createElement('a');
+            link.href = item.url;
+            link.className = 'list-group-item list-group-item-action search-suggest-item';
+            link.dataset.index = index;
+            const icon = item.type === 'deck' ? 'bi-folder2' : 'bi-card-text';
+            link.innerHTML = `<i class="bi ${icon} me-2 text-muted"></i>${escapeHtml(item.text)}`;
+            // mousedown fires before the input's blur hides the list
+            link.addEventListener('mousedown', (event) => {
+                event.preventDefault();
+                window.location.href = item.url;
+            });
+            dropdown.appendChild(link);
+        });
+        dropdown.classList.add('show');
+    }
+
+    function hide() {
+        dropdown.classList.remove('show');
+        activeIndex = -1;
+    }
+
+    function setActive(index) {
+        const links = dropdown.querySelectorAll('.search-suggest-item');
+        links.forEach((link, i) => link.classList.toggle('active', i === index));
+        activeIndex = index;
+    }
+
+    function handleKeys(event) {
+        if (!dropdown.classList.contains('show')) return;
+
+        switch (event.key) {
+            case 'ArrowDown':
+                event.preventDefault();
+                setActive(Math.min(activeIndex + 1, items.length - 1));
+                break;
+            case 'ArrowUp':
+                event.preventDefault();
+                setActive(Math.max(activeIndex - 1, -1));
+                break;
+            case 'Enter':
+                // Without a highlighted suggestion Enter submits the full search
+                if (activeIndex >= 0) {
+                    event.preventDefault();
+                    window.location.href = items[activeIndex].url;
+                }
+                break;
+            case 'Escape':
+                hide();
+                break;
+        }
+    }
+}
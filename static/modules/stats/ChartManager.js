@@ -5,6 +5,7 @@ export class ChartManager {
     constructor() {
         this.stateChart = null;
         this.upcomingChart = null;
+        this.historyChart = null;
     }
     
     /**
@@ -224,6 +225,110 @@ export class ChartManager {
         });
     }
     
+    /**
+     * Updates the history line chart from daily snapshots
+     */
+    updateHistoryChart(series) {
+        const ctx = document.getElementById('historyChart').getContext('2d');
+        
+        // Use theme-appropriate colors
+        const isDarkMode = document.documentElement.getAttribute('data-bs-theme') === 'dark';
+        const textColor = isDarkMode ? '#e0e0e0' : '#212529';
+        const gridColor = isDarkMode ? '#444' : '#ddd';
+        
+        if (this.historyChart) {
+            this.historyChart.destroy();
+            this.historyChart = null;
+        }
+        
+        // Handle empty data case
+        if (!series || series.length === 0) {
+            ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+            ctx.font = '16px Arial';
+            ctx.fillStyle = isDarkMode ? '#e0e0e0' : '#666';
+            ctx.textAlign = 'center';
+            ctx.fillText('No history yet', ctx.canvas.width / 2, ctx.canvas.height / 2);
+            return;
+        }
+        
+        // Snapshot days are UTC calendar dates; label them without shifting time zones
+        const labels = series.map(item => new Date(`${item.date}T00:00:00Z`).toLocaleDateString(undefined, {
+            month: 'short',
+            day: 'numeric',
+            timeZone: 'UTC'
+        }));
+        
+        const line = (label, key, color) => ({
+            label: label,
+            data: series.map(item => item[key]),
+            borderColor: color,
+            backgroundColor: color,
+            tension: 0.2,
+            yAxisID: 'y'
+        });
+        
+        this.historyChart = new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: labels,
+                datasets: [
+                    line('Mastered', 'mastered', isDarkMode ? '#198754' : '#28a745'),
+                    line('Learning', 'learning', isDarkMode ? '#e6b400' : '#ffc107'),
+                    line('Forgotten', 'forgotten', isDarkMode ? '#bb2d3b' : '#dc3545'),
+                    line('Due', 'due', isDarkMode ? 'rgba(13, 110, 253, 0.8)' : '#0d6efd'),
+                    {
+                        type: 'bar',
+                        label: 'Reviews',
+                        data: series.map(item => item.reviews),
+                        backgroundColor: isDarkMode ? 'rgba(108, 117, 125, 0.5)' : 'rgba(108, 117, 125, 0.3)',
+                        yAxisID: 'y'
+                    },
+                    {
+                        label: 'Mean retention',
+                        data: series.map(item => item.mean_retrievability === null ? null : Math.round(item.mean_retrievability * 100)),
+                        borderColor: isDarkMode ? '#b197fc' : '#6f42c1',
+                        backgroundColor: isDarkMode ? '#b197fc' : '#6f42c1',
+                        borderDash: [5, 5],
+                        tension: 0.2,
+                        yAxisID: 'retention'
+                    }
+                ]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                interaction: {
+                    mode: 'index',
+                    intersect: false
+                },
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        grid: { color: gridColor },
+                        ticks: { precision: 0, color: textColor }
+                    },
+                    retention: {
+                        position: 'right',
+                        min: 0,
+                        max: 100,
+                        grid: { drawOnChartArea: false },
+                        ticks: { color: textColor, callback: value => `${value}%` }
+                    },
+                    x: {
+                        grid: { color: gridColor },
+                        ticks: { color: textColor }
+                    }
+                },
+                plugins: {
+                    legend: {
+                        position: 'bottom',
+                        labels: { color: textColor }
+                    }
+                }
+            }
+        });
+    }
+    
     /**
      * Clean up chart resources to prevent memory leaks
      */
@@ -237,5 +342,10 @@ export class ChartManager {
             this.upcomingChart.destroy();
             this.upcomingChart = null;
         }
+        
+        if (this.historyChart) {
+            this.historyChart.destroy();
+            this.historyChart = null;
+        }
     }
 }
@@ -92,6 +92,20 @@ export class StatsLoader {
         }
     }
     
+    /**
+     * Load daily stats snapshots for the history chart
+     */
+    async loadHistory(days = 30) {
+        try {
+            const response = await fetch(`/stats/deck/${this.deckId}/history?days=${days}`);
+            const history = await response.json();
+            return history.series || [];
+        } catch (error) {
+            console.error('Error loading stats history:', error);
+            throw error;
+        }
+    }
+    
     /**
      * Load retention distribution data - can be used for additional charts
      */
@@ -30,6 +30,9 @@ export class StatsManager {
         // Load initial data
         this.loadAllStats();
         
+        // History only changes with the daily snapshot, so it isn't polled
+        this.loadHistory();
+        
         // Handle browser back/forward navigation
         window.addEventListener('popstate', () => {
             // Re-extract the page from URL when navigating with browser buttons
@@ -56,6 +59,7 @@ export class StatsManager {
                 if (mutation.attributeName === 'data-bs-theme') {
                     // Redraw charts when theme changes
                     this.loadAllStats();
+                    this.loadHistory();
                 }
             });
         });
@@ -85,6 +89,18 @@ export class StatsManager {
         }
     }
     
+    /**
+     * Load daily snapshots and draw the history chart
+     */
+    async loadHistory() {
+        try {
+            const series = await this.statsLoader.loadHistory(30);
+            this.chartManager.updateHistoryChart(series);
+        } catch (error) {
+            console.error('Error loading stats history:', error);
+        }
+    }
+    
     /**
      * Load upcoming reviews and update the table
      * No longer takes a filter parameter, just page number
@@ -31,6 +31,37 @@ export async function updateProgress(flashcardId, isCorrect) {
     }
 }
 
+/**
+ * Submit several study answers in one request
+ * @param {Array<Object>} reviews - Items of {flashcard_id, is_correct, answered_at}
+ * @param {Object} options - Extra fetch options (e.g. keepalive)
+ * @returns {Promise<Object>} - Promise resolving to the server response; on an
+ *     HTTP error the rejection carries the response status as error.status
+ */
+export async function submitReviewBatch(reviews, options = {}) {
+    try {
+        const response = await fetch('/flashcard/update_progress/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ reviews }),
+            ...options
+        });
+        
+        if (!response.ok) {
+            const error = new Error(`Failed to submit reviews (${response.status})`);
+            error.status = response.status;
+            throw error;
+        }
+        
+        return await response.json();
+    } catch (error) {
+        console.error('Error submitting reviews:', error);
+        throw error;
+    }
+}
+
 /**
  * Delete a deck with the given ID
  * @param {number} deckId - The ID of the deck to delete
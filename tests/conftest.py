@@ -0,0 +1,89 @@
+"""
+Shared fixtures: the application on a throwaway SQLite database
+
+The environment is set before the app is imported because Config reads it
+at import time. Imports run in external worker mode so no embedded worker
+claims the jobs a test creates.
+"""
+
+import os
+import sys
+import tempfile
+import pytest
+from sqlalchemy import text
+
+_data_dir = tempfile.mkdtemp(prefix='memoria-tests-')
+os.environ['DB_TYPE'] = 'sqlite'
+os.environ['SQLITE_DB_PATH'] = os.path.join(_data_dir, 'memoria.db')
+os.environ['CACHE_SQLITE_PATH'] = os.path.join(_data_dir, 'cache.db')
+os.environ['LLM_CACHE_PATH'] = os.path.join(_data_dir, 'llm_cache.db')
+os.environ['IMPORT_WORKER_MODE'] = 'external'
+os.environ['DECK_STATS_ROLLUP_INTERVAL'] = '0'
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as memoria_app
+from models import db, User, FlashcardDecks, Flashcards
+from services import similarity_service, suggest_service
+
+
+@pytest.fixture
+def app():
+    """App context on an empty database"""
+    with memoria_app.app_context():
+        yield memoria_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        # Trigram postings are not ORM-mapped, so bulk deletes leave them behind
+        db.session.execute(text('DELETE FROM search_trigrams'))
+        db.session.commit()
+        db.session.remove()
+        # Ids are reused once the tables are empty, so indexes must not outlive a test
+        suggest_service._registry.clear()
+        similarity_service._registry.clear()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='learner', email='learner@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def make_deck(user):
+    """Factory for decks owned by the test user"""
+    def make_deck(name, parent=None):
+        deck = FlashcardDecks(
+            name=name,
+            user_id=user.id,
+            parent_deck_id=parent.flashcard_deck_id if parent is not None else None
+        )
+        db.session.add(deck)
+        db.session.commit()
+        return deck
+    return make_deck
+
+
+@pytest.fixture
+def make_cards(app):
+    """Factory for cards in a deck with a given FSRS state and due date"""
+    def make_cards(deck, count, state=0, due_date=None):
+        cards = []
+        for number in range(count):
+            card = Flashcards(
+                question=f'Question {deck.flashcard_deck_id}-{number}',
+                correct_answer='Answer',
+                incorrect_answers=['Wrong 1', 'Wrong 2', 'Wrong 3'],
+                flashcard_deck_id=deck.flashcard_deck_id,
+                state=state,
+                due_date=due_date
+            )
+            db.session.add(card)
+            cards.append(card)
+        db.session.commit()
+        return cards
+    return make_cards
@@ -0,0 +1,68 @@
+"""Denormalized deck card counters against a full recount"""
+
+from models import db, FlashcardDecks, Flashcards
+
+COUNTER_COLUMNS = ('card_count',) + FlashcardDecks.SUBTREE_COUNTER_COLUMNS
+
+
+def counters():
+    db.session.expire_all()
+    return {
+        deck.flashcard_deck_id: tuple(getattr(deck, column) for column in COUNTER_COLUMNS)
+        for deck in FlashcardDecks.query
+    }
+
+
+def recounted():
+    """Counters as refresh_card_counters() computes them from the cards table"""
+    FlashcardDecks.refresh_card_counters()
+    rows = counters()
+    db.session.rollback()
+    return rows
+
+
+def test_counters_follow_card_changes(make_deck, make_cards):
+    root = make_deck('Root')
+    child = make_deck('Child', root)
+    make_cards(root, 2, state=0)
+    learning = make_cards(child, 3, state=1)
+    assert counters() == recounted()
+
+    learning[0].state = 2
+    learning[1].state = 3
+    db.session.commit()
+    assert counters() == recounted()
+
+    learning[2].flashcard_deck_id = root.flashcard_deck_id
+    db.session.commit()
+    assert counters() == recounted()
+
+    db.session.delete(learning[0])
+    db.session.commit()
+    assert counters() == recounted()
+
+    root = db.session.get(FlashcardDecks, root.flashcard_deck_id)
+    assert (root.card_count, root.total_card_count) == (3, 4)
+    assert (root.new_card_count, root.learning_card_count,
+            root.mastered_card_count, root.forgotten_card_count) == (2, 1, 0, 1)
+
+
+def test_counters_follow_deck_moves_and_deletes(make_deck, make_cards):
+    first = make_deck('First')
+    second = make_deck('Second')
+    child = make_deck('Child', first)
+    grandchild = make_deck('Grandchild', child)
+    make_cards(child, 2, state=1)
+    make_cards(grandchild, 3, state=2)
+
+    child.parent_deck_id = second.flashcard_deck_id
+    db.session.commit()
+    assert counters() == recounted()
+    assert counters()[first.flashcard_deck_id][1] == 0
+    assert counters()[second.flashcard_deck_id][1] == 5
+
+    db.session.delete(grandchild)
+    db.session.commit()
+    assert counters() == recounted()
+    assert counters()[second.flashcard_deck_id][1] == 2
+    assert Flashcards.query.count() == 2
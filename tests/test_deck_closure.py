@@ -0,0 +1,61 @@
+"""Deck closure table kept in step with the deck hierarchy by ORM events"""
+
+from models import db, DeckClosure, FlashcardDecks
+
+
+def closure_rows():
+    return sorted((row.ancestor_id, row.descendant_id, row.depth) for row in DeckClosure.query.all())
+
+
+def rebuilt_rows():
+    """The rows DeckClosure.rebuild() derives from parent_deck_id alone"""
+    DeckClosure.rebuild()
+    rows = closure_rows()
+    db.session.rollback()
+    return rows
+
+
+def test_insert_adds_ancestor_paths(make_deck):
+    root = make_deck('Root')
+    child = make_deck('Child', root)
+    grandchild = make_deck('Grandchild', child)
+
+    assert closure_rows() == rebuilt_rows()
+    assert {deck_id for (deck_id,) in DeckClosure.subtree_ids(root.flashcard_deck_id)} == {
+        root.flashcard_deck_id, child.flashcard_deck_id, grandchild.flashcard_deck_id
+    }
+    assert DeckClosure.root_id(grandchild.flashcard_deck_id) == root.flashcard_deck_id
+    assert DeckClosure.is_ancestor(root.flashcard_deck_id, grandchild.flashcard_deck_id)
+    assert not DeckClosure.is_ancestor(grandchild.flashcard_deck_id, root.flashcard_deck_id)
+
+
+def test_move_rewrites_the_moved_subtree(make_deck):
+    first = make_deck('First')
+    second = make_deck('Second')
+    child = make_deck('Child', first)
+    make_deck('Grandchild', child)
+
+    child.parent_deck_id = second.flashcard_deck_id
+    db.session.commit()
+    assert closure_rows() == rebuilt_rows()
+    assert not DeckClosure.is_ancestor(first.flashcard_deck_id, child.flashcard_deck_id)
+
+    child.parent_deck_id = None
+    db.session.commit()
+    assert closure_rows() == rebuilt_rows()
+    assert DeckClosure.root_id(child.flashcard_deck_id) == child.flashcard_deck_id
+
+
+def test_delete_removes_the_subtree(make_deck):
+    root = make_deck('Root')
+    child = make_deck('Child', root)
+    make_deck('Grandchild', child)
+    other = make_deck('Other')
+
+    db.session.delete(child)
+    db.session.commit()
+
+    assert closure_rows() == rebuilt_rows()
+    assert {row.flashcard_deck_id for row in FlashcardDecks.query} == {
+        root.flashcard_deck_id, other.flashcard_deck_id
+    }
@@ -0,0 +1,65 @@
+"""Daily deck snapshots: subtree aggregates, retrievability at snapshot time, review counts"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from models import db, DeckStatsDaily, Flashcards, ReviewLogs
+from services.fsrs_scheduler import rollup_deck_stats
+from services.fsrs_vectorized import FACTOR, DECAY
+
+NOW = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def review(card, at):
+    db.session.add(ReviewLogs(flashcard_id=card.flashcard_id, rating=3, reviewed_at=at,
+                              state_before=0, state_after=1))
+    db.session.commit()
+
+
+def snapshot(deck, day):
+    db.session.expire_all()
+    return db.session.get(DeckStatsDaily, (deck.flashcard_deck_id, day))
+
+
+def test_mean_retrievability_is_computed_at_snapshot_time(make_deck, make_cards):
+    parent = make_deck('Languages')
+    child = make_deck('Spanish', parent=parent)
+    make_cards(parent, 2)
+    reviewed = make_cards(child, 2, state=2)
+    for card, stability, days in zip(reviewed, (5.0, 20.0), (3.5, 10.2)):
+        card.stability = stability
+        card.last_reviewed = (NOW - timedelta(days=days)).replace(tzinfo=None)
+        card.retrievability = 1.0
+    db.session.commit()
+
+    assert rollup_deck_stats(NOW) == 2
+
+    expected = np.mean([(1 + FACTOR * elapsed / stability) ** DECAY
+                        for stability, elapsed in ((5.0, 3), (20.0, 10))])
+    row = snapshot(parent, NOW.date())
+    assert (row.total_count, row.new_count, row.mastered_count) == (4, 2, 2)
+    assert row.mean_retrievability == pytest.approx(expected)
+    assert snapshot(child, NOW.date()).mean_retrievability == pytest.approx(expected)
+    # Cards keep the retrievability stored at review time
+    assert [card.retrievability for card in Flashcards.query.filter(Flashcards.stability > 0)] == [1.0, 1.0]
+
+
+def test_past_days_are_finalized_from_review_logs(make_deck, make_cards):
+    deck = make_deck('History')
+    other = make_deck('Empty')
+    (card,) = make_cards(deck, 1)
+    yesterday = NOW - timedelta(days=1)
+
+    review(card, yesterday.replace(hour=8, tzinfo=None))
+    rollup_deck_stats(yesterday.replace(hour=9))
+    assert snapshot(deck, yesterday.date()).review_count == 1
+
+    review(card, yesterday.replace(hour=20, tzinfo=None))
+    review(card, NOW.replace(hour=7, tzinfo=None))
+    rollup_deck_stats(NOW)
+
+    assert snapshot(deck, yesterday.date()).review_count == 2
+    assert snapshot(deck, NOW.date()).review_count == 1
+    assert snapshot(other, yesterday.date()).review_count == 0
@@ -0,0 +1,49 @@
+"""Per-deck retention targets saved by rescheduling and used by later reviews"""
+
+from datetime import datetime, timedelta, timezone
+
+from models import db, FlashcardDecks, Flashcards
+from services.fsrs_scheduler import process_review, reschedule_cards
+
+NOW = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def review_state(cards):
+    """Put cards in the review state, last seen ten days ago with the same memory"""
+    for card in cards:
+        card.init_fsrs_state()
+        card.state = 2
+        card.stability = 10.0
+        card.difficulty = 5.0
+        card.last_reviewed = NOW - timedelta(days=10)
+        card.fsrs_state = dict(card.fsrs_state, state=2, step=None, stability=10.0, difficulty=5.0,
+                               last_review=card.last_reviewed.isoformat())
+    db.session.commit()
+
+
+def test_reschedule_saves_the_target_on_the_subtree(make_deck, make_cards):
+    parent = make_deck('Languages')
+    child = make_deck('Spanish', parent=parent)
+    review_state(make_cards(child, 3))
+
+    assert reschedule_cards(parent.flashcard_deck_id, 0.8, now=NOW) == 3
+
+    db.session.expire_all()
+    assert [deck.desired_retention for deck in FlashcardDecks.query.order_by(FlashcardDecks.flashcard_deck_id)] == [0.8, 0.8]
+
+
+def test_reviews_use_the_decks_saved_target(make_deck, make_cards):
+    relaxed = make_deck('Relaxed')
+    default = make_deck('Default')
+    (relaxed_card,) = make_cards(relaxed, 1)
+    (default_card,) = make_cards(default, 1)
+    review_state([relaxed_card, default_card])
+    reschedule_cards(relaxed.flashcard_deck_id, 0.8, now=NOW)
+    db.session.expire_all()
+
+    relaxed_due, _ = process_review(db.session.get(Flashcards, relaxed_card.flashcard_id), True, review_time=NOW)
+    default_due, _ = process_review(db.session.get(Flashcards, default_card.flashcard_id), True, review_time=NOW)
+
+    # A lower target spaces reviews out further (due dates come back naive after the commit)
+    start = NOW.replace(tzinfo=None)
+    assert relaxed_due.replace(tzinfo=None) - start > 1.5 * (default_due.replace(tzinfo=None) - start)
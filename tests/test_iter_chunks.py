@@ -0,0 +1,40 @@
+"""Streaming chunker used for uploads"""
+
+from utils import chunk_text, iter_chunks
+
+
+def test_matches_chunk_text_however_the_text_is_split():
+    text = ' '.join(f'word{number}' for number in range(500))
+    expected = chunk_text(text, size=100)
+
+    for piece_size in (1, 7, 64, 1000):
+        pieces = [text[start:start + piece_size] for start in range(0, len(text), piece_size)]
+        assert list(iter_chunks(pieces, size=100)) == expected
+
+
+def test_chunks_stay_within_size_and_keep_every_word():
+    words = [f'term{number}' for number in range(300)]
+
+    chunks = list(iter_chunks([' '.join(words[:150]) + ' ', ' '.join(words[150:])], size=60))
+
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert ' '.join(chunks).split() == words
+
+
+def test_whitespace_between_pieces_separates_words():
+    assert list(iter_chunks(['alpha ', 'beta', ' gamma'], size=100)) == ['alpha beta gamma']
+    assert list(iter_chunks(['alpha', 'beta'], size=100)) == ['alphabeta']
+
+
+def test_empty_input_yields_nothing():
+    assert list(iter_chunks([])) == []
+    assert list(iter_chunks(['', '   ', '\n'])) == []
+
+
+def test_long_runs_without_whitespace_are_cut():
+    run = 'x' * 5000
+
+    chunks = list(iter_chunks([run[start:start + 100] for start in range(0, 5000, 100)], size=10))
+
+    assert ''.join(chunks) == run
+    assert max(len(chunk) for chunk in chunks) <= 100
@@ -0,0 +1,133 @@
+"""Durable import job queue: leases, retries and task settlement"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from models import db, ImportFile, ImportJob, ImportTask
+from services.background_service import TaskStatus
+from services.job_service import (
+    DEAD, DONE, QUEUED, RUNNING,
+    claim_jobs, complete_job, enqueue_import_jobs, fail_job, settle_task
+)
+
+
+@pytest.fixture
+def make_task(user, make_deck):
+    """Factory for a running import task with one queued job per chunk"""
+    deck = make_deck('Imported')
+
+    def make_task(total_chunks):
+        file_key = uuid.uuid4().hex
+        db.session.add(ImportFile(file_key=file_key, filename='notes.txt', user_id=user.id,
+                                  total_chunks=total_chunks))
+        task = ImportTask(id=str(uuid.uuid4()), file_key=file_key, filename='notes.txt',
+                          deck_id=deck.flashcard_deck_id, deck_name=deck.name, user_id=user.id,
+                          status=TaskStatus.RUNNING, total_chunks=total_chunks)
+        db.session.add(task)
+        db.session.commit()
+        enqueue_import_jobs(task.id, file_key, total_chunks)
+        return task.id
+    return make_task
+
+
+def job(job_id):
+    db.session.expire_all()
+    return db.session.get(ImportJob, job_id)
+
+
+def task(task_id):
+    db.session.expire_all()
+    return db.session.get(ImportTask, task_id)
+
+
+def test_enqueue_is_idempotent(make_task):
+    task_id = make_task(3)
+
+    assert enqueue_import_jobs(task_id, task(task_id).file_key, 3) == 0
+    assert ImportJob.query.filter_by(task_id=task_id, status=QUEUED).count() == 3
+
+
+def test_claims_respect_the_per_task_limit(make_task, monkeypatch):
+    monkeypatch.setattr(Config, 'IMPORT_CHUNK_CONCURRENCY', 2)
+    first = make_task(5)
+    second = make_task(5)
+
+    claimed = claim_jobs('worker-a', 10)
+
+    assert sorted(row.task_id for row in claimed) == sorted([first, first, second, second])
+    assert all(job(row.id).lease_owner == 'worker-a' and job(row.id).attempts == 1 for row in claimed)
+    assert claim_jobs('worker-b', 10) == []
+
+
+def test_expired_lease_is_claimed_again(make_task):
+    task_id = make_task(1)
+    (claimed,) = claim_jobs('worker-a', 1)
+
+    job(claimed.id).lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    (reclaimed,) = claim_jobs('worker-b', 1)
+
+    assert reclaimed.id == claimed.id
+    assert (job(claimed.id).lease_owner, job(claimed.id).attempts) == ('worker-b', 2)
+
+    # The first worker lost its lease, so its result is ignored
+    complete_job(claimed.id, 'worker-a', task_id)
+    assert job(claimed.id).status == RUNNING
+
+
+def test_failed_job_backs_off_then_dies(make_task, monkeypatch):
+    monkeypatch.setattr(Config, 'IMPORT_JOB_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(Config, 'IMPORT_JOB_BACKOFF', 60)
+    task_id = make_task(1)
+
+    (claimed,) = claim_jobs('worker-a', 1)
+    fail_job(claimed.id, 'worker-a', 'model timeout')
+    assert job(claimed.id).status == QUEUED
+    assert job(claimed.id).run_after > datetime.utcnow() + timedelta(seconds=50)
+    assert claim_jobs('worker-a', 1) == []
+
+    job(claimed.id).run_after = datetime.utcnow()
+    db.session.commit()
+    (claimed,) = claim_jobs('worker-a', 1)
+    fail_job(claimed.id, 'worker-a', 'model timeout')
+
+    assert (job(claimed.id).status, job(claimed.id).last_error) == (DEAD, 'model timeout')
+    assert task(task_id).status == TaskStatus.FAILED
+    assert task(task_id).error == '1 chunk(s) failed: model timeout'
+
+
+def test_task_settles_when_its_last_job_finishes(make_task, monkeypatch):
+    monkeypatch.setattr(Config, 'IMPORT_CHUNK_CONCURRENCY', 3)
+    task_id = make_task(3)
+    claimed = claim_jobs('worker-a', 3)
+    assert len(claimed) == 3
+
+    for row in claimed[:-1]:
+        complete_job(row.id, 'worker-a', task_id)
+    assert task(task_id).status == TaskStatus.RUNNING
+    assert task(task_id).current_chunk == len(claimed) - 1
+
+    complete_job(claimed[-1].id, 'worker-a', task_id)
+    assert ImportJob.query.filter_by(task_id=task_id, status=DONE).count() == len(claimed)
+    assert (task(task_id).status, task(task_id).progress) == (TaskStatus.COMPLETED, 100)
+
+
+def test_settle_task_waits_for_open_jobs_and_is_repeatable(make_task, monkeypatch):
+    monkeypatch.setattr(Config, 'IMPORT_CHUNK_CONCURRENCY', 1)
+    task_id = make_task(2)
+    (first,) = claim_jobs('worker-a', 2)
+
+    complete_job(first.id, 'worker-a', task_id)
+    settle_task(task_id)
+    assert task(task_id).status == TaskStatus.RUNNING
+    assert task(task_id).progress == 50
+
+    (second,) = claim_jobs('worker-a', 2)
+    complete_job(second.id, 'worker-a', task_id)
+    completed_at = task(task_id).completed_at
+    settle_task(task_id)
+    assert task(task_id).status == TaskStatus.COMPLETED
+    assert task(task_id).completed_at == completed_at
@@ -0,0 +1,70 @@
+"""Typo-tolerant search fallback on the SQLite trigram postings"""
+
+from models import db, FlashcardDecks, Flashcards, User
+from services import search_service
+from services.search_service import search_decks, search_flashcards
+
+
+def add_card(deck, question):
+    card = Flashcards(question=question, correct_answer='Answer', incorrect_answers=['Wrong'],
+                      flashcard_deck_id=deck.flashcard_deck_id, state=0)
+    db.session.add(card)
+    db.session.commit()
+    return card
+
+
+def other_user():
+    user = User(username='other', email='other@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_other_users_cards_do_not_crowd_out_own_matches(make_deck, user, monkeypatch):
+    monkeypatch.setattr(search_service, 'TRIGRAM_POSTINGS_LIMIT', 20)
+    other = other_user()
+    crowded = FlashcardDecks(name='Crowded', user_id=other.id)
+    db.session.add(crowded)
+    db.session.commit()
+    for number in range(60):
+        add_card(crowded, f'photosynthesis chloroplast {number}')
+    own = add_card(make_deck('Biology'), 'photosynthesis in chloroplasts')
+
+    cards, total = search_flashcards('photosinthesis chloroplst', user_id=user.id)
+
+    assert (total, [card.flashcard_id for card in cards]) == (1, [own.flashcard_id])
+
+
+def test_postings_follow_visibility_and_ownership(make_deck, user):
+    other = other_user()
+    deck = FlashcardDecks(name='Astronomy', user_id=other.id)
+    db.session.add(deck)
+    db.session.commit()
+    card = add_card(deck, 'constellation of orion')
+
+    assert search_flashcards('constelation', user_id=user.id) == ([], 0)
+    assert search_decks('astronmy', user_id=user.id) == ([], 0)
+
+    deck.is_public = True
+    db.session.commit()
+    assert [found.flashcard_id for found in search_flashcards('constelation')[0]] == [card.flashcard_id]
+    assert [found.flashcard_deck_id for found in search_decks('astronmy')[0]] == [deck.flashcard_deck_id]
+
+    deck.is_public = False
+    deck.user_id = user.id
+    db.session.commit()
+    assert search_flashcards('constelation') == ([], 0)
+    assert [found.flashcard_id for found in search_flashcards('constelation', user_id=user.id)[0]] == [card.flashcard_id]
+
+    # Moving the card into another user's private deck hides it again
+    elsewhere = FlashcardDecks(name='Elsewhere', user_id=other.id)
+    db.session.add(elsewhere)
+    db.session.commit()
+    card.flashcard_deck_id = elsewhere.flashcard_deck_id
+    db.session.commit()
+    assert search_flashcards('constelation', user_id=user.id) == ([], 0)
+    assert [found.flashcard_id for found in search_flashcards('constelation', user_id=other.id)[0]] == [card.flashcard_id]
+
+    db.session.delete(card)
+    db.session.commit()
+    assert search_flashcards('constelation', user_id=other.id) == ([], 0)
@@ -0,0 +1,74 @@
+"""Keyset-paged study queue over a deck subtree"""
+
+from datetime import datetime, timedelta
+
+from models import db
+from services import fsrs_scheduler
+from services.fsrs_scheduler import get_due_cards_page
+
+
+def walk(deck, **kwargs):
+    """Every page of the study queue, following next_cursor to the end"""
+    pages, cursor = [], None
+    while True:
+        cards, cursor = get_due_cards_page(deck.flashcard_deck_id, cursor=cursor, **kwargs)
+        if cards:
+            pages.append(cards)
+        if cursor is None:
+            return pages
+
+
+def study_tree(make_deck, make_cards):
+    now = datetime.utcnow()
+    root = make_deck('Root')
+    child = make_deck('Child', root)
+    make_deck('Unrelated')
+    make_cards(root, 4, state=0)
+    make_cards(child, 3, state=0, due_date=now - timedelta(days=1))
+    make_cards(root, 5, state=1, due_date=now - timedelta(hours=2))
+    make_cards(child, 2, state=1, due_date=now + timedelta(days=3))
+    make_cards(child, 4, state=3, due_date=now - timedelta(hours=1))
+    make_cards(root, 3, state=2, due_date=now + timedelta(days=10))
+    return root
+
+
+def test_pages_cover_the_subtree_once(make_deck, make_cards):
+    root = study_tree(make_deck, make_cards)
+
+    pages = walk(root, per_page=4)
+    served = [card.flashcard_id for page in pages for card in page]
+
+    assert len(served) == len(set(served)) == 21
+    assert all(len(page) <= 4 for page in pages)
+
+
+def test_states_are_balanced_and_ordered(make_deck, make_cards):
+    root = study_tree(make_deck, make_cards)
+
+    first_page, _ = get_due_cards_page(root.flashcard_deck_id, per_page=6)
+    assert [card.state for card in first_page] == [3, 1, 0, 3, 1, 0]
+
+    # Within a state, cards without a due date come first, then by due date
+    new_cards = [card for page in walk(root, per_page=6) for card in page if card.state == 0]
+    assert [card.due_date is None for card in new_cards] == [True] * 4 + [False] * 3
+    assert [card.flashcard_id for card in new_cards[:4]] == sorted(card.flashcard_id for card in new_cards[:4])
+
+
+def test_due_only_skips_future_cards(make_deck, make_cards):
+    root = study_tree(make_deck, make_cards)
+
+    served = [card for page in walk(root, per_page=5, due_only=True) for card in page]
+
+    assert len(served) == 16
+    assert all(card.due_date is None or card.due_date <= datetime.utcnow() for card in served)
+
+
+def test_large_subtrees_page_the_same_way(make_deck, make_cards, monkeypatch):
+    root = study_tree(make_deck, make_cards)
+    merged = [[card.flashcard_id for card in page] for page in walk(root, per_page=4)]
+
+    monkeypatch.setattr(fsrs_scheduler, 'STUDY_MERGE_MAX_DECKS', 1)
+    db.session.expire_all()
+    sorted_pages = [[card.flashcard_id for card in page] for page in walk(root, per_page=4)]
+
+    assert sorted_pages == merged
@@ -0,0 +1,78 @@
+"""Per-user suggestion and related-card indexes kept current by committed changes"""
+
+import pytest
+
+from models import db, FlashcardDecks, Flashcards, User
+from services.similarity_service import get_similarity_index, similar_cards
+from services.suggest_service import get_suggest_index, suggest
+
+
+@pytest.fixture
+def other(app):
+    user = User(username='other', email='other@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_card(deck, question, answer='Answer'):
+    card = Flashcards(question=question, correct_answer=answer, incorrect_answers=['Wrong'],
+                      flashcard_deck_id=deck.flashcard_deck_id, state=0)
+    db.session.add(card)
+    db.session.commit()
+    return card
+
+
+def suggested_cards(user_id, query):
+    return {item['id'] for item in suggest(user_id, query) if item['type'] == 'card'}
+
+
+def test_committed_cards_are_indexed_and_rolled_back_ones_are_not(make_deck, user):
+    deck = make_deck('Cells')
+    add_card(deck, 'Mitochondria produce ATP')
+    get_suggest_index(user.id)
+    get_similarity_index(user.id)
+
+    card = add_card(deck, 'Mitochondria have their own DNA')
+    assert card.flashcard_id in suggested_cards(user.id, 'mitoch')
+    assert [found.flashcard_id for found in similar_cards(user.id, query='mitochondria DNA')[0]][0] == card.flashcard_id
+
+    db.session.add(Flashcards(question='Mitosis splits a cell', correct_answer='Answer',
+                              incorrect_answers=['Wrong'], flashcard_deck_id=deck.flashcard_deck_id))
+    db.session.flush()
+    db.session.rollback()
+    assert not any('Mitosis' in item['text'] for item in suggest(user.id, 'mitos'))
+
+
+def test_deck_owner_change_invalidates_both_users(make_deck, user, other):
+    deck = make_deck('Chemistry')
+    card = add_card(deck, 'Covalent bonds share electrons')
+    assert card.flashcard_id in suggested_cards(user.id, 'coval')
+    assert get_suggest_index(other.id).lookup('coval') == []
+    previous = get_similarity_index(user.id)
+
+    deck.user_id = other.id
+    db.session.commit()
+
+    assert suggested_cards(user.id, 'coval') == set()
+    assert card.flashcard_id in suggested_cards(other.id, 'coval')
+    assert get_similarity_index(user.id) is not previous
+    assert similar_cards(other.id, query='covalent electrons')[1] == 1
+
+
+def test_card_moved_to_another_users_deck_leaves_the_old_index(make_deck, user, other):
+    mine = make_deck('Physics')
+    theirs = FlashcardDecks(name='Theirs', user_id=other.id)
+    db.session.add(theirs)
+    db.session.commit()
+    card = add_card(mine, 'Entropy never decreases')
+    assert card.flashcard_id in suggested_cards(user.id, 'entro')
+    get_suggest_index(other.id)
+    assert similar_cards(user.id, query='entropy')[1] == 1
+
+    card.flashcard_deck_id = theirs.flashcard_deck_id
+    db.session.commit()
+
+    assert suggested_cards(user.id, 'entro') == set()
+    assert similar_cards(user.id, query='entropy')[1] == 0
+    assert card.flashcard_id in suggested_cards(other.id, 'entro')
@@ -1,32 +1,62 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Iterable, Iterator
 from io import StringIO
 import PyPDF2
 from config import Config
-from models import db, FlashcardDecks, Flashcards
+from models import db, FlashcardDecks, Flashcards, DeckClosure
 from services.fsrs_scheduler import get_current_time
 from flask import current_app
 import math
 
 def chunk_text(text: str, size: int = Config.CHUNK_SIZE) -> List[str]:
     """Split text into chunks of approximately given size"""
-    words = text.split()
-    chunks = []
+    return list(iter_chunks([text], size))
+
+def iter_chunks(pieces: Iterable[str], size: int = Config.CHUNK_SIZE) -> Iterator[str]:
+    """
+    Incrementally split a stream of text pieces into chunks of approximately given size
+    
+    Pieces are treated as one continuous text (a word may span two pieces),
+    so only the current chunk and a partial word are held at any time.
+    Runs of text without whitespace longer than ten chunks are cut so that
+    memory stays bounded on malformed input.
+    """
     current_chunk = []
     current_size = 0
-    
-    for word in words:
-        word_size = len(word) + 1
-        if current_size + word_size > size:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_size = word_size
+    carry = ''
+    max_word = 10 * size
+    
+    def words_of(text, final):
+        nonlocal carry
+        text = carry + text
+        words = text.split()
+        # The last word may continue in the next piece
+        if words and not final and not text[-1].isspace():
+            carry = words.pop()
+            while len(carry) > max_word:
+                words.append(carry[:max_word])
+                carry = carry[max_word:]
         else:
-            current_chunk.append(word)
-            current_size += word_size
+            carry = ''
+        return words
+    
+    def add(words):
+        nonlocal current_chunk, current_size
+        for word in words:
+            word_size = len(word) + 1
+            if current_size + word_size > size and current_chunk:
+                yield ' '.join(current_chunk)
+                current_chunk = [word]
+                current_size = word_size
+            else:
+                current_chunk.append(word)
+                current_size += word_size
+    
+    for piece in pieces:
+        yield from add(words_of(piece, final=False))
+    yield from add(words_of('', final=True))
     
     if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    return chunks
+        yield ' '.join(current_chunk)
 
 def allowed_file(filename):
     """Check if uploaded file has an allowed extension"""
@@ -58,76 +88,88 @@ def is_descendant(potential_descendant_id, ancestor_id):
     """Check if a deck is a descendant of another deck"""
     if potential_descendant_id == ancestor_id:
         return True
-        
-    deck = FlashcardDecks.query.get(potential_descendant_id)
-    if not deck:
-        return False
     
-    # If this deck has no parent, it can't be a descendant
-    if deck.parent_deck_id is None:
-        return False
-        
-    # Check if the parent is the ancestor we're looking for
-    if deck.parent_deck_id == ancestor_id:
-        return True
-        
-    # Recursively check the parent
-    return is_descendant(deck.parent_deck_id, ancestor_id)
+    # Single primary key lookup in the closure table
+    return DeckClosure.is_ancestor(ancestor_id, potential_descendant_id)
 
 def count_due_flashcards(deck_id, current_time=None):
     """Count flashcards that are due for a deck and its sub-decks"""
     if current_time is None:
         current_time = get_current_time()
     
-    # Create recursive CTE to find all decks including this one and its sub-decks
-    cte = db.session.query(
-        FlashcardDecks.flashcard_deck_id.label('id')
-    ).filter(
-        FlashcardDecks.flashcard_deck_id == deck_id
-    ).cte(name='due_decks', recursive=True)
-
-    cte = cte.union_all(
-        db.session.query(
-            FlashcardDecks.flashcard_deck_id.label('id')
-        ).filter(
-            FlashcardDecks.parent_deck_id == cte.c.id
-        )
-    )
-    
-    # Count cards that are due now, but exclude cards already in "mastered" state (2) 
-    # even if they have a due date in the past
+    # Count cards that are due now in this deck and its sub-decks, but exclude cards
+    # already in "mastered" state (2) even if they have a due date in the past
     due_count = Flashcards.query.filter(
-        Flashcards.flashcard_deck_id.in_(db.session.query(cte.c.id)),
+        Flashcards.flashcard_deck_id.in_(DeckClosure.subtree_ids(deck_id)),
         (Flashcards.due_date <= current_time) | (Flashcards.due_date == None),
         Flashcards.state != 2  # Exclude cards already mastered
     ).count()
     
     return due_count
 
+def count_user_due_cards(user_id, current_time=None):
+    """
+    Count due cards for every deck a user owns, rolled up over sub-decks.
+    
+    Runs one grouped COUNT over the user's flashcards and one query for the
+    deck hierarchy, then sums the direct counts up the tree in Python.
+    
+    Returns:
+        Dictionary mapping deck_id -> due count for the deck and its sub-decks
+    """
+    if current_time is None:
+        current_time = get_current_time()
+    
+    parents = dict(db.session.query(
+        FlashcardDecks.flashcard_deck_id,
+        FlashcardDecks.parent_deck_id
+    ).filter(FlashcardDecks.user_id == user_id).all())
+    
+    direct_counts = dict(db.session.query(
+        Flashcards.flashcard_deck_id,
+        db.func.count(Flashcards.flashcard_id)
+    ).join(
+        FlashcardDecks, FlashcardDecks.flashcard_deck_id == Flashcards.flashcard_deck_id
+    ).filter(
+        FlashcardDecks.user_id == user_id,
+        (Flashcards.due_date <= current_time) | (Flashcards.due_date == None),
+        Flashcards.state != 2  # Exclude cards already mastered
+    ).group_by(Flashcards.flashcard_deck_id).all())
+    
+    totals = {deck_id: 0 for deck_id in parents}
+    for deck_id, count in direct_counts.items():
+        # Add each deck's direct count to itself and every ancestor
+        seen = set()
+        while deck_id in totals and deck_id not in seen:
+            seen.add(deck_id)
+            totals[deck_id] += count
+            deck_id = parents[deck_id]
+    
+    return totals
+
 def batch_count_due_cards(deck_ids, user_id):
     """
     Efficiently count due cards for multiple decks at once.
     Returns a dictionary mapping deck_id -> due_count.
     """
-    # Create a cache key for the user's counts
-    cache_key = f"due_counts_{user_id}"
-    
-    # Try to get from cache first if caching is enabled
-    if hasattr(current_app, 'cache') and current_app.config.get('ENABLE_CACHING', False):
-        cached_counts = current_app.cache.get(cache_key)
-        if cached_counts:
-            # Filter to just the requested deck IDs
-            result = {deck_id: cached_counts.get(deck_id, 0) for deck_id in deck_ids}
-            return result
-    
-    # If not cached or no cache available, count for each deck
+    from services.cache_service import get_cache
+    
+    # Count every deck of the user in one pass so the cached value is complete
+    cache = get_cache()
+    if cache is not None:
+        all_counts = cache.get_or_set(
+            'due_counts', 'all', lambda: count_user_due_cards(user_id), user_id=user_id
+        )
+    else:
+        all_counts = count_user_due_cards(user_id)
+    
     result = {}
     for deck_id in deck_ids:
-        result[deck_id] = count_due_flashcards(deck_id)
-    
-    # Cache for future use if caching is enabled
-    if hasattr(current_app, 'cache') and current_app.config.get('ENABLE_CACHING', False):
-        current_app.cache.set(cache_key, result, timeout=300)  # 5 minute cache
+        if deck_id in all_counts:
+            result[deck_id] = all_counts[deck_id]
+        else:
+            # Deck owned by someone else (e.g. public); count it on its own
+            result[deck_id] = count_due_flashcards(deck_id)
     
     return result
 